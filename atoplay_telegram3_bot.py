@@ -1,9 +1,25 @@
 import sqlite3
 import uuid
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from types import MappingProxyType
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, TypeHandler, filters
+from telegram.error import BadRequest, NetworkError, RetryAfter
+from telegram.helpers import escape_markdown
+import csv
+import itertools
+import math
 import os
+import pytz
+import queue
+import re
+import string
+import tempfile
+import threading
+import time
 import warnings
 import logging
 
@@ -18,9 +34,69 @@ logger = logging.getLogger(__name__)
 warnings.filterwarnings("ignore")
 
 TOKEN = os.environ.get('BOT_TOKEN', '8505602493:AAF8fznj0OA3OqVstBDt-Zn9MkQ8DjPh5vw')
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL')  # e.g. a local fake Bot API for testing
 SUPER_ADMIN_ID = 5911406948  # Super Admin ID
 ADMIN_IDS = [5911406948, 5510368247]  # Initial admins
 
+# Database settings
+DB_PATH = os.environ.get('DB_PATH', 'atoplay_bot.db')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))  # Idle connections kept open
+DB_WORKERS = int(os.environ.get('DB_WORKERS', '4'))  # Threads running queries off the event loop
+DB_STORAGE_MODE = os.environ.get('DB_STORAGE_MODE', 'wal')  # 'wal' or 'legacy' (rollback journal)
+DB_BUSY_TIMEOUT_MS = 5000  # How long a statement waits for a lock before failing
+DB_LOCK_RETRIES = 3  # Extra attempts for a DB call that still hits "database is locked"
+DB_LOCK_RETRY_DELAY = 0.05  # Seconds, doubled after each attempt
+
+# Pragmas applied to every new connection (single configuration point)
+STORAGE_PRAGMAS = {
+    'wal': {
+        'journal_mode': 'WAL',  # Readers no longer wait for writers
+        'synchronous': 'NORMAL',  # Safe with WAL, fsync only at checkpoints
+        'cache_size': -16000,  # 16 MB page cache per connection
+        'mmap_size': 67108864,  # 64 MB memory-mapped reads
+        'busy_timeout': DB_BUSY_TIMEOUT_MS,
+        'temp_store': 'MEMORY'
+    },
+    'legacy': {
+        'busy_timeout': DB_BUSY_TIMEOUT_MS,
+        'temp_store': 'MEMORY'
+    }
+}
+DB_PRAGMAS = STORAGE_PRAGMAS[DB_STORAGE_MODE]
+
+# Admin notification fan-out
+NOTIFY_CONCURRENCY = int(os.environ.get('NOTIFY_CONCURRENCY', '8'))  # Messages in flight at once
+NOTIFY_TIMEOUT = float(os.environ.get('NOTIFY_TIMEOUT', '10'))  # Seconds per recipient for admin fan-out (send_to_chats)
+
+# Pending payments inbox
+PENDING_PAGE_SIZE = 5  # Transactions per inbox page
+BULK_MAX_TRANSACTIONS = 30  # Per bulk approve/reject (keeps the summary within one message)
+
+# Bulk key import
+KEY_IMPORT_BATCH_SIZE = 500  # Keys per INSERT batch / admin_logs row
+KEY_IMPORT_MAX_BYTES = 5 * 1024 * 1024  # Largest document accepted
+
+# Stock browser
+STOCK_PAGE_SIZE = 25  # Keys per page
+STOCK_PAGE_MAX_CHARS = 3500  # Page text budget (Telegram limit is 4096)
+MY_KEYS_PAGE_SIZE = 10  # Keys per My Keys page
+
+# Statistics
+STATS_CACHE_TTL = float(os.environ.get('STATS_CACHE_TTL', '30'))  # Seconds a stats snapshot is reused
+BUSINESS_TIMEZONE = pytz.timezone(os.environ.get('BUSINESS_TIMEZONE', 'Asia/Karachi'))  # Where "today" starts and ends
+
+# Outbound message queue (Telegram allows ~30 msg/s overall and ~1 msg/s per chat)
+SEND_RATE_GLOBAL = float(os.environ.get('SEND_RATE_GLOBAL', '25'))  # Messages per second, all chats
+SEND_RATE_PER_CHAT = float(os.environ.get('SEND_RATE_PER_CHAT', '1'))  # Messages per second, one chat
+SEND_BURST_PER_CHAT = 3  # Short bursts allowed per chat before throttling
+SEND_WORKERS = 4  # Sends in flight at once
+SEND_MAX_RETRIES = 3  # Extra attempts after flood control or network errors
+
+# Send priorities - lower is sent first
+PRIORITY_CUSTOMER = 0  # Key delivery, payment results
+PRIORITY_NOTICE = 1  # One-off notices (block/unblock, admin changes)
+PRIORITY_ADMIN = 2  # Admin broadcasts (sale notifications, screenshots)
+
 # Exchange rates for different payment methods
 EXCHANGE_RATES = {
     'easypaisa': {
@@ -41,13 +117,16 @@ EXCHANGE_RATES = {
     }
 }
 
-# Make prices editable
-PRODUCT_PRICES = {
-    '3d': 280,
-    '10d': 560,
-    '30d': 1250
-}
+# Products the catalogue is seeded with: (key_type, name, days, price) in menu order.
+# Prices and new products are managed from the bot and kept in the products table.
+DEFAULT_PRODUCTS = [
+    ('3d', '3-Day Key', 3, 280),
+    ('10d', '10-Day Key', 10, 560),
+    ('30d', '30-Day Key', 30, 1250)
+]
 
+# Defaults seeded into payment_methods on first run. At startup this is replaced by the
+# registry snapshot loaded from the database (see reload_payment_methods).
 PAYMENT_METHODS = {
     'easypaisa': {'name': 'Easypaisa', 'number': '03431178575', 'account_name': ''},
     'jazzcash': {'name': 'JazzCash', 'number': '', 'account_name': ''},
@@ -73,22 +152,188 @@ ADMIN_PERMISSIONS = {
     'manage_admins': False
 }
 
-def get_products():
-    """Get products with current prices"""
-    return {
-        'product_3d': {'name': '3-Day Key', 'price': PRODUCT_PRICES['3d'], 'days': 3},
-        'product_10d': {'name': '10-Day Key', 'price': PRODUCT_PRICES['10d'], 'days': 10},
-        'product_30d': {'name': '30-Day Key', 'price': PRODUCT_PRICES['30d'], 'days': 30}
-    }
+# One bit per permission, in ADMIN_PERMISSIONS order (append new flags at the end -
+# existing bit positions are stored in users.permission_mask)
+PERMISSION_BITS = {perm: 1 << bit for bit, perm in enumerate(ADMIN_PERMISSIONS)}
+ALL_PERMISSIONS_MASK = (1 << len(PERMISSION_BITS)) - 1
+
+def permissions_to_mask(permissions):
+    """Permissions dict -> bitmask"""
+    mask = 0
+    for perm, enabled in permissions.items():
+        if enabled and perm in PERMISSION_BITS:
+            mask |= PERMISSION_BITS[perm]
+    return mask
+
+def mask_to_permissions(mask):
+    """Bitmask -> permissions dict with every flag present"""
+    return {perm: bool(mask & bit) for perm, bit in PERMISSION_BITS.items()}
+
+# ========== DATABASE CONNECTION POOL ==========
+class PooledConnection:
+    """sqlite3 connection borrowed from the pool - close() gives it back"""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __del__(self):
+        # Handlers that leak a connection on an error path still give it back
+        try:
+            self.close()
+        except Exception:
+            pass
 
-def init_db():
-    # Delete old database if exists
-    if os.path.exists('atoplay_bot.db'):
-        os.remove('atoplay_bot.db')
-        print("🗑️ Old database deleted!")
-    
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
+
+class ConnectionPool:
+    """Bounded pool of sqlite3 connections shared by the whole process"""
+
+    def __init__(self, path, size, pragmas):
+        self.path = path
+        self.pragmas = pragmas
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.borrowed = 0
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            self.borrowed += 1
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        # Discard anything the borrower left uncommitted, like close() would
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        """Close idle connections (used before the database file is replaced)"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        return {
+            'opened': self.opened,
+            'borrowed': self.borrowed,
+            'idle': self._idle.qsize()
+        }
+
+
+DB_POOL = ConnectionPool(DB_PATH, DB_POOL_SIZE, DB_PRAGMAS)
+
+def get_db_connection():
+    """Borrow a connection from the shared pool"""
+    return DB_POOL.acquire()
+
+# ========== ASYNC DATABASE ACCESS ==========
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='db')
+
+def is_lock_error(error):
+    """True for the sqlite errors raised when another writer holds the lock"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+def call_with_lock_retry(func, *args, **kwargs):
+    """Call a DB function, retrying a bounded number of times while the database is locked"""
+    delay = DB_LOCK_RETRY_DELAY
+    for attempt in range(DB_LOCK_RETRIES + 1):
+        try:
+            return func(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e) or attempt == DB_LOCK_RETRIES:
+                raise
+            logger.warning(f"Database locked in {getattr(func, '__name__', func)}, retry {attempt + 1}/{DB_LOCK_RETRIES}")
+            time.sleep(delay)
+            delay *= 2
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking single-transaction database function on the DB executor and await its result.
+    
+    The whole call is retried while the database is locked, so func must commit at most once.
+    """
+    return await run_db_no_retry(call_with_lock_retry, func, *args, **kwargs)
+
+async def run_db_no_retry(func, *args, **kwargs):
+    """run_db() without the outer lock retry - for work that commits in several transactions and
+    retries each one itself (re-running it whole would redo what was already committed)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DB_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+def _run_query(query, params, fetch):
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(query, params)
+        if fetch == 'one':
+            result = cursor.fetchone()
+        elif fetch == 'all':
+            result = cursor.fetchall()
+        else:
+            result = cursor.lastrowid
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+async def db_fetchone(query, params=()):
+    """Fetch a single row without blocking the event loop"""
+    return await run_db(_run_query, query, params, 'one')
+
+async def db_fetchall(query, params=()):
+    """Fetch all rows without blocking the event loop"""
+    return await run_db(_run_query, query, params, 'all')
+
+async def db_execute(query, params=()):
+    """Execute and commit a write statement, returning lastrowid"""
+    return await run_db(_run_query, query, params, None)
+
+# Secondary indexes, one per hot query shape
+DB_INDEXES = [
+    # Key claim and stock counts: keys_stock WHERE key_type = ? AND status = 'available'
+    'CREATE INDEX IF NOT EXISTS idx_keys_stock_type_status ON keys_stock (key_type, status)',
+    # My Keys: user_keys WHERE user_id = ? ORDER BY purchased_at
+    'CREATE INDEX IF NOT EXISTS idx_user_keys_user_purchased ON user_keys (user_id, purchased_at)',
+    # Pending payments: transactions WHERE status = 'pending' ORDER BY created_at
+    'CREATE INDEX IF NOT EXISTS idx_transactions_status_created ON transactions (status, created_at)',
+    # User info: transactions WHERE user_id = ? AND status = 'approved'
+    'CREATE INDEX IF NOT EXISTS idx_transactions_user_status ON transactions (user_id, status)',
+    # Admin lists: users WHERE is_admin = 1
+    'CREATE INDEX IF NOT EXISTS idx_users_is_admin ON users (is_admin)'
+]
+
+def migration_001_initial_schema(cursor):
+    """Base tables, initial admins, payment methods and the first stock keys"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'")
+    fresh_database = cursor.fetchone() is None
     
     # USERS table with ALL columns
     cursor.execute('''CREATE TABLE IF NOT EXISTS users (
@@ -216,16 +461,184 @@ def init_db():
                         method_data.get('account_name', ''),
                         method_data.get('qr_code', '')))
     
-    conn.commit()
-    conn.close()
+    # Seed stock only on a brand-new database so sold keys never come back
+    if fresh_database:
+        add_sample_keys(cursor)
+    
     print("✅ Database tables created successfully!")
     print("✅ Super Admin (5911406948) added with ALL permissions!")
     print("✅ Admin (5510368247) added with basic permissions!")
     print("✅ Payment methods initialized!")
 
+def migration_002_indexes(cursor):
+    """Secondary indexes for the queries the handlers issue"""
+    for index_sql in DB_INDEXES:
+        cursor.execute(index_sql)
+
+def migration_003_users_created_at(cursor):
+    """Join date for users (ALTER TABLE cannot add a CURRENT_TIMESTAMP default)"""
+    cursor.execute('ALTER TABLE users ADD COLUMN created_at TIMESTAMP')
+    cursor.execute('UPDATE users SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL')
+
+def migration_004_permission_mask(cursor):
+    """Integer permission bitmask replacing the str(dict) permissions column"""
+    import ast
+    
+    cursor.execute('ALTER TABLE users ADD COLUMN permission_mask INTEGER DEFAULT 0')
+    cursor.execute("SELECT telegram_id, permissions FROM users WHERE permissions IS NOT NULL AND permissions != '{}'")
+    
+    updates = []
+    for telegram_id, permissions in cursor.fetchall():
+        try:
+            parsed = ast.literal_eval(permissions)
+            if not isinstance(parsed, dict):
+                raise ValueError("not a dict")
+        except (ValueError, SyntaxError) as e:
+            logger.warning(f"Unreadable permissions for {telegram_id} ({e}), migrated with none")
+            parsed = {}
+        updates.append((permissions_to_mask(parsed), telegram_id))
+    
+    # The old text column is left in place (no longer read or written) for rollback
+    cursor.executemany('UPDATE users SET permission_mask = ? WHERE telegram_id = ?', updates)
+
+def migration_005_stock_browse_index(cursor):
+    """Index for paging through keys_stock newest first within a key type"""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_keys_stock_type_created ON keys_stock (key_type, created_at, key_id)')
+
+def migration_006_users_keys_count(cursor):
+    """Per-user purchased key counter, kept in step with user_keys inserts"""
+    cursor.execute('ALTER TABLE users ADD COLUMN keys_count INTEGER DEFAULT 0')
+    cursor.execute('''UPDATE users SET keys_count = (SELECT COUNT(*) FROM user_keys 
+                                                     WHERE user_keys.user_id = users.user_id)''')
+
+def migration_007_products(cursor):
+    """Product catalogue, seeded from DEFAULT_PRODUCTS with any price saved in settings"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS products (
+        key_type TEXT PRIMARY KEY,  -- '3d', '10d', ... (also used in keys_stock and callback data)
+        name TEXT,
+        days INTEGER,
+        price INTEGER,
+        sort_order INTEGER,
+        is_active INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    
+    # /price_* used to save here without the value ever being read back
+    cursor.execute("SELECT setting_key, setting_value FROM settings WHERE setting_key LIKE 'price_%'")
+    saved_prices = {setting_key[len('price_'):]: setting_value for setting_key, setting_value in cursor.fetchall()}
+    
+    rows = []
+    for sort_order, (key_type, name, days, price) in enumerate(DEFAULT_PRODUCTS, 1):
+        saved_price = saved_prices.get(key_type) or ''
+        if saved_price.isdigit() and int(saved_price) > 0:
+            price = int(saved_price)
+        rows.append((key_type, name, days, price, sort_order))
+    cursor.executemany('''INSERT OR IGNORE INTO products (key_type, name, days, price, sort_order) 
+                          VALUES (?, ?, ?, ?, ?)''', rows)
+
+def migration_008_daily_sales(cursor):
+    """Daily sales rollup keyed by approval date, backfilled from approved transactions"""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS daily_sales (
+        day TEXT,  -- YYYY-MM-DD in BUSINESS_TIMEZONE, the day the sale was approved
+        key_type TEXT,  -- '3d', '10d', '30d', '' for balance top-ups
+        payment_method TEXT,
+        sales_count INTEGER DEFAULT 0,
+        amount REAL DEFAULT 0,
+        PRIMARY KEY (day, key_type, payment_method)
+    )''')
+    cursor.execute('ALTER TABLE transactions ADD COLUMN approved_at TIMESTAMP')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_status_approved ON transactions (status, approved_at)')
+    
+    # Approval times were only kept in the admin log ("Transaction #N - ₹amount"). Balance purchases
+    # and adjustments are approved as they are created, so created_at stands in for them
+    cursor.execute("SELECT details, created_at FROM admin_logs WHERE action = 'approve_payment'")
+    approved_times = {}
+    for details, created_at in cursor.fetchall():
+        match = re.match(r'Transaction #(\d+) ', details or '')
+        if match:
+            transaction_id = int(match.group(1))
+            approved_times[transaction_id] = min(created_at, approved_times.get(transaction_id, created_at))
+    
+    cursor.execute('''SELECT transaction_id, created_at, amount, payment_method 
+                      FROM transactions 
+                      WHERE status = 'approved' ''')
+    transactions = cursor.fetchall()
+    cursor.executemany('UPDATE transactions SET approved_at = ? WHERE transaction_id = ?',
+                       [(approved_times.get(transaction_id, created_at), transaction_id)
+                        for transaction_id, created_at, _, _ in transactions])
+    
+    # Old transactions don't record the key type, so it is inferred from the amount at the prices in
+    # the products table (migration 7 carried over any saved /price_* value). Admin balance
+    # adjustments are not sales and are left out
+    cursor.execute('''SELECT key_type, name, days, price, is_active FROM products 
+                      ORDER BY sort_order, days, key_type''')
+    by_price = build_catalogue(cursor.fetchall())['by_price']
+    rollup = {}
+    for transaction_id, created_at, amount, payment_method in transactions:
+        if payment_method == 'admin_adjustment':
+            continue
+        product = by_price.get(amount)
+        approved_at = approved_times.get(transaction_id, created_at)
+        key = (db_timestamp_to_business_day(approved_at), product['key_type'] if product else '', payment_method)
+        previous_count, previous_total = rollup.get(key, (0, 0))
+        rollup[key] = (previous_count + 1, previous_total + amount)
+    
+    cursor.executemany('INSERT INTO daily_sales (day, key_type, payment_method, sales_count, amount) VALUES (?, ?, ?, ?, ?)',
+                       [key + value for key, value in rollup.items()])
+
+# Forward-only migrations: (version, description, function). Never edit an applied entry -
+# append a new one instead.
+SCHEMA_MIGRATIONS = [
+    (1, 'initial schema', migration_001_initial_schema),
+    (2, 'secondary indexes', migration_002_indexes),
+    (3, 'users.created_at', migration_003_users_created_at),
+    (4, 'users.permission_mask', migration_004_permission_mask),
+    (5, 'keys_stock browse index', migration_005_stock_browse_index),
+    (6, 'users.keys_count', migration_006_users_keys_count),
+    (7, 'products catalogue', migration_007_products),
+    (8, 'daily_sales rollup', migration_008_daily_sales)
+]
+
+def get_schema_version(cursor):
+    cursor.execute('PRAGMA user_version')
+    return cursor.fetchone()[0]
+
+def init_db():
+    """Bring the database schema up to date in place - existing data is never dropped"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        current_version = get_schema_version(cursor)
+        latest_version = SCHEMA_MIGRATIONS[-1][0]
+        
+        if current_version >= latest_version:
+            print(f"✅ Database schema is current (version {current_version})")
+            return current_version
+        
+        for version, description, migrate in SCHEMA_MIGRATIONS:
+            if version <= current_version:
+                continue
+            
+            # Take the write lock first so two processes never apply the same migration
+            cursor.execute('BEGIN IMMEDIATE')
+            if get_schema_version(cursor) >= version:
+                conn.rollback()
+                continue
+            
+            migrate(cursor)
+            cursor.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+            print(f"✅ Migration {version} applied: {description}")
+        
+        return get_schema_version(cursor)
+    finally:
+        conn.close()
+
 def load_payment_methods():
     """Load payment methods from database"""
-    conn = sqlite3.connect('atoplay_bot.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     cursor.execute('''SELECT method_key, method_name, number, pay_id, account_name, qr_code 
@@ -246,16 +659,36 @@ def load_payment_methods():
     
     return methods
 
-def update_payment_methods_global():
-    """Update the global PAYMENT_METHODS variable from database"""
-    global PAYMENT_METHODS
-    new_methods = load_payment_methods()
-    PAYMENT_METHODS.clear()
-    PAYMENT_METHODS.update(new_methods)
+# ========== PAYMENT METHOD REGISTRY ==========
+# PAYMENT_METHODS always refers to an immutable snapshot (read-only mappings all the way down).
+# reload_payment_methods() builds a complete new snapshot and swaps the reference in a single
+# assignment, so a reader holding a snapshot never sees it change or half-built. The table is
+# loaded at startup and reloaded only after update_payment_method() writes.
+PAYMENT_METHODS_VERSION = 0  # Bumped on every reload (part of the keyboard cache key)
+_payment_methods_lock = threading.Lock()
+
+def freeze_payment_methods(methods):
+    """Read-only snapshot of a {method_key: {field: value}} dict"""
+    return MappingProxyType({method_key: MappingProxyType(dict(method_data))
+                             for method_key, method_data in methods.items()})
+
+def get_payment_methods():
+    """Current payment method snapshot - take it once per handler and read from it"""
+    return PAYMENT_METHODS
+
+def reload_payment_methods():
+    """Load payment_methods into a new snapshot and publish it"""
+    global PAYMENT_METHODS, PAYMENT_METHODS_VERSION
+    snapshot = freeze_payment_methods(load_payment_methods())
+    with _payment_methods_lock:
+        PAYMENT_METHODS = snapshot
+        PAYMENT_METHODS_VERSION += 1
+    invalidate_keyboard_cache()
+    return snapshot
 
 def update_payment_method(method_key, updates):
     """Update a payment method in database"""
-    conn = sqlite3.connect('atoplay_bot.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     set_clauses = []
@@ -275,14 +708,11 @@ def update_payment_method(method_key, updates):
     conn.commit()
     conn.close()
     
-    # Update global variable
-    update_payment_methods_global()
+    # Publish the new details
+    reload_payment_methods()
 
-def add_sample_keys():
+def add_sample_keys(cursor):
     """Add real keys provided by user - ONLY REAL KEYS"""
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
     # ONLY REAL KEYS FROM USER'S MESSAGES
     real_keys = {
         '3d': [
@@ -306,13 +736,184 @@ def add_sample_keys():
             cursor.execute('''INSERT OR IGNORE INTO keys_stock (key_value, key_type) 
                               VALUES (?, ?)''', (key_value, key_type))
     
-    conn.commit()
-    conn.close()
     print("✅ ONLY REAL KEYS ADDED (EXACTLY AS PROVIDED)!")
 
-def get_stock_info():
-    """Get current stock information"""
-    conn = sqlite3.connect('atoplay_bot.db')
+# ========== PRODUCT CATALOGUE ==========
+# Products live in the products table. PRODUCT_CATALOGUE is an immutable snapshot of it with an
+# index per lookup the handlers make - buy-menu callback id, key type and price - so each is one
+# dict access. Like PAYMENT_METHODS it is rebuilt whole and swapped in one assignment. It starts
+# from DEFAULT_PRODUCTS (the migrations price old transactions with it) and is reloaded from the
+# table at startup and after every catalogue write. Inactive products keep their key_type entry
+# so old keys still display, but leave the menus and the price index.
+KEY_TYPE_PATTERN = re.compile(r'^[a-z0-9]{1,8}$')  # key_type ends up in callback data and commands
+CATALOGUE_VERSION = 0  # Bumped on every reload (part of the keyboard cache key)
+# Payments are matched to a product by amount, so no two active products may share a price
+PRICE_TAKEN_MESSAGE = "❌ {name} already costs ₹{price}. Payments are matched to products by amount, so every product needs its own price."
+_catalogue_lock = threading.Lock()
+
+def build_catalogue(rows):
+    """Read-only catalogue snapshot from (key_type, name, days, price, is_active) rows in menu order"""
+    products = []
+    by_callback = {}
+    by_key_type = {}
+    by_price = {}
+    for key_type, name, days, price, is_active in rows:
+        product = MappingProxyType({
+            'key_type': key_type,
+            'name': name,
+            'days': days,
+            'price': price,
+            'callback': f'product_{key_type}',
+            'stock_label': f'{name}s' if name.endswith('Key') else name
+        })
+        by_key_type[key_type] = product
+        if not is_active:
+            continue
+        products.append(product)
+        by_callback[product['callback']] = product
+        by_price.setdefault(price, product)  # Two products at one price: the first listed wins
+    return MappingProxyType({
+        'products': tuple(products),
+        'by_callback': MappingProxyType(by_callback),
+        'by_key_type': MappingProxyType(by_key_type),
+        'by_price': MappingProxyType(by_price)
+    })
+
+PRODUCT_CATALOGUE = build_catalogue([product + (1,) for product in DEFAULT_PRODUCTS])
+
+def list_products():
+    """Active products in menu order"""
+    return PRODUCT_CATALOGUE['products']
+
+def get_products():
+    """Active products keyed by their buy-menu callback id, with current prices"""
+    return PRODUCT_CATALOGUE['by_callback']
+
+def get_product(key_type):
+    """Product for a key type (active or not), or None"""
+    return PRODUCT_CATALOGUE['by_key_type'].get(key_type)
+
+def product_days(key_type):
+    product = get_product(key_type)
+    return product['days'] if product else 0
+
+def product_at_price(price):
+    """Active product sold at price, or None"""
+    return PRODUCT_CATALOGUE['by_price'].get(price)
+
+def product_for_amount(amount):
+    """(product_name, key_type) a payment of amount buys - key_type is '' for a balance top-up"""
+    product = product_at_price(amount)
+    if product:
+        return product['name'], product['key_type']
+    # For balance addition, no key needed
+    return "Balance Addition", ''
+
+def stock_lines(stock_info, with_prices=False, bold=False):
+    """'• 3-Day Keys: N available' line per active product"""
+    lines = []
+    for product in list_products():
+        label = f"**{product['stock_label']}:**" if bold else f"{product['stock_label']}:"
+        line = f"• {label} {stock_info.get(product['key_type'], 0)} available"
+        if with_prices:
+            line += f" - ₹{product['price']}"
+        lines.append(line)
+    return '\n'.join(lines)
+
+def price_lines(prefix="• ", bold=False):
+    """'• 3-Day Key: ₹280' line per active product"""
+    lines = []
+    for product in list_products():
+        label = f"**{product['name']}:**" if bold else f"{product['name']}:"
+        lines.append(f"{prefix}{label} ₹{product['price']}")
+    return '\n'.join(lines)
+
+def command_key_type(command, prefix):
+    """'3d' from '/price_3d' or '/price_3d@SomeBot' given prefix '/price_'"""
+    return command.split('@', 1)[0][len(prefix):].lower()
+
+def key_type_list():
+    """'3d, 10d, 30d' - the active key types for usage messages"""
+    return ', '.join(product['key_type'] for product in list_products())
+
+def load_products():
+    """Read every catalogue row in menu order"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''SELECT key_type, name, days, price, is_active FROM products 
+                      ORDER BY sort_order, days, key_type''')
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def reload_catalogue():
+    """Load the products table into a new snapshot and publish it"""
+    global PRODUCT_CATALOGUE, CATALOGUE_VERSION
+    snapshot = build_catalogue(load_products())
+    with _catalogue_lock:
+        PRODUCT_CATALOGUE = snapshot
+        CATALOGUE_VERSION += 1
+    invalidate_keyboard_cache()
+    return snapshot
+
+def set_product_price(key_type, price, admin_id):
+    """Change a product's price - returns the old price, or None for an unknown key type"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        begin_immediate(cursor)
+        cursor.execute('SELECT name, price FROM products WHERE key_type = ?', (key_type,))
+        row = cursor.fetchone()
+        if not row:
+            conn.rollback()
+            return None
+        name, old_price = row
+        
+        cursor.execute('UPDATE products SET price = ?, updated_at = CURRENT_TIMESTAMP WHERE key_type = ?',
+                       (price, key_type))
+        log_admin_action(admin_id, 'change_price', 0, f"{name}: ₹{old_price} → ₹{price}", cursor=cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    
+    reload_catalogue()
+    return old_price
+
+def add_product(key_type, name, days, price, admin_id):
+    """Add a product at the end of the menu (or bring back an inactive one with new details)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        begin_immediate(cursor)
+        cursor.execute('''INSERT INTO products (key_type, name, days, price, sort_order) 
+                          VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(sort_order), 0) + 1 FROM products))
+                          ON CONFLICT (key_type) DO UPDATE SET 
+                              name = excluded.name, days = excluded.days, price = excluded.price,
+                              sort_order = excluded.sort_order, is_active = 1, updated_at = CURRENT_TIMESTAMP''',
+                       (key_type, name, days, price))
+        log_admin_action(admin_id, 'add_product', 0, f"{key_type}: {name}, {days} days, ₹{price}", cursor=cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    
+    reload_catalogue()
+
+# ========== STOCK COUNTERS ==========
+# key_type -> available keys. Loaded once from keys_stock, then adjusted after every
+# commit that adds, sells or deletes a key; reconcile_stock_counters() corrects drift.
+STOCK_RECONCILE_INTERVAL = int(os.getenv('STOCK_RECONCILE_INTERVAL', '300'))  # seconds
+_stock_counts = {}
+_stock_loaded = False
+_stock_generation = 0  # Bumped by every adjust_stock_counter() - a count that straddles one is stale
+_stock_lock = threading.Lock()
+STOCK_RECONCILE_ATTEMPTS = 3  # Counts discarded for a concurrent change before counting under the lock
+
+def count_stock_from_db():
+    """Count available keys per type straight from keys_stock"""
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     cursor.execute('''SELECT key_type, 
@@ -329,60 +930,333 @@ def get_stock_info():
     
     return stock_info
 
-def is_admin(user_id):
-    """Check if user is admin"""
-    conn = sqlite3.connect('atoplay_bot.db')
+def reconcile_stock_counters():
+    """Reload the counters from the table - returns {key_type: (cached, actual)} for any drift"""
+    # A sale that commits during the count and adjusts the counters right after would be undone
+    # by swapping in the older count, so counts overlapping an adjustment are thrown away
+    for _ in range(STOCK_RECONCILE_ATTEMPTS):
+        with _stock_lock:
+            generation = _stock_generation
+        actual = count_stock_from_db()
+        with _stock_lock:
+            if _stock_generation == generation:
+                drift = _swap_stock_counts(actual)
+                break
+    else:
+        # Still busy: count with adjustments held off
+        with _stock_lock:
+            drift = _swap_stock_counts(count_stock_from_db())
+    
+    if drift:
+        logger.warning(f"Stock counters drifted, corrected: {drift}")
+    return drift
+
+def _swap_stock_counts(actual):
+    """Replace the counters with actual, returning the drift (_stock_lock held)"""
+    global _stock_counts, _stock_loaded
+    
+    drift = {}
+    if _stock_loaded:
+        for key_type in set(_stock_counts) | set(actual):
+            cached_count = _stock_counts.get(key_type, 0)
+            actual_count = actual.get(key_type, 0)
+            if cached_count != actual_count:
+                drift[key_type] = (cached_count, actual_count)
+    _stock_counts = actual
+    _stock_loaded = True
+    return drift
+
+def adjust_stock_counter(key_type, delta):
+    """Apply a committed stock change to the counters"""
+    global _stock_generation
+    
+    with _stock_lock:
+        _stock_generation += 1
+        if _stock_loaded:
+            _stock_counts[key_type] = _stock_counts.get(key_type, 0) + delta
+
+def get_stock_info():
+    """Get current stock information (from the in-memory counters).
+    
+    Handlers find the counters already loaded (see warm_caches); before that the first call
+    counts keys_stock in the calling thread.
+    """
+    if not _stock_loaded:
+        reconcile_stock_counters()
+    with _stock_lock:
+        return dict(_stock_counts)
+
+# DELETE ... RETURNING needs SQLite 3.35+
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+def begin_immediate(cursor):
+    """Take the write lock up front so concurrent writers queue instead of racing"""
+    cursor.execute('BEGIN IMMEDIATE')
+
+CLAIM_KEYS_RETURNING_SQL = '''DELETE FROM keys_stock 
+                              WHERE key_id IN (SELECT key_id FROM keys_stock 
+                                               WHERE key_type = ? AND status = 'available' 
+                                               ORDER BY key_id LIMIT ?)
+                              RETURNING key_id, key_value'''
+CLAIM_KEYS_SQL = '''SELECT key_id, key_value FROM keys_stock 
+                    WHERE key_type = ? AND status = 'available' 
+                    ORDER BY key_id LIMIT ?'''
+
+def claim_stock_keys(cursor, key_type, count):
+    """Remove up to count available keys of key_type (oldest first) and return [(key_id, key_value)].
+    
+    Must run inside begin_immediate(); the keys are gone once the caller commits and
+    come back if it rolls back.
+    """
+    if SQLITE_HAS_RETURNING:
+        cursor.execute(CLAIM_KEYS_RETURNING_SQL, (key_type, count))
+        return sorted(cursor.fetchall())
+    
+    cursor.execute(CLAIM_KEYS_SQL, (key_type, count))
+    keys = cursor.fetchall()
+    cursor.executemany('DELETE FROM keys_stock WHERE key_id = ?', [(key_id,) for key_id, _ in keys])
+    return keys
+
+def claim_stock_key(cursor, key_type):
+    """Remove one available key of key_type and return (key_id, key_value), or None if out of stock"""
+    keys = claim_stock_keys(cursor, key_type, 1)
+    return keys[0] if keys else None
+
+async def stock_reconcile_loop():
+    """Background task: periodically re-check the counters against keys_stock"""
+    while True:
+        await asyncio.sleep(STOCK_RECONCILE_INTERVAL)
+        try:
+            await run_db(reconcile_stock_counters)
+        except Exception as e:
+            logger.error(f"Stock reconciliation failed: {e}")
+
+# ========== TIME WINDOWS ==========
+# Reports filter on half-open UTC ranges (start <= column < end) computed here, never on
+# DATE(column), so the comparison stays on the raw column and can use an index. Timestamps in the
+# database are SQLite CURRENT_TIMESTAMP values: UTC, 'YYYY-MM-DD HH:MM:SS'.
+DB_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def business_now():
+    """Current time in BUSINESS_TIMEZONE"""
+    return datetime.now(pytz.utc).astimezone(BUSINESS_TIMEZONE)
+
+def business_day(days_ago=0):
+    """Business-timezone date as 'YYYY-MM-DD' (the daily_sales key)"""
+    return (business_now().date() - timedelta(days=days_ago)).isoformat()
+
+def to_db_timestamp(local_date):
+    """UTC database timestamp of midnight at the start of a business-timezone date"""
+    midnight = BUSINESS_TIMEZONE.localize(datetime.combine(local_date, datetime.min.time()))
+    return midnight.astimezone(pytz.utc).strftime(DB_TIMESTAMP_FORMAT)
+
+def time_window(name):
+    """(start, end) UTC timestamps for 'today', 'last_7_days' (today included) or 'this_month'"""
+    today = business_now().date()
+    if name == 'today':
+        start = today
+    elif name == 'last_7_days':
+        start = today - timedelta(days=6)
+    elif name == 'this_month':
+        start = today.replace(day=1)
+    else:
+        raise ValueError(f"Unknown time window: {name}")
+    return to_db_timestamp(start), to_db_timestamp(today + timedelta(days=1))
+
+def day_window(name):
+    """(start_day, end_day) business dates for a time_window name, for date-keyed tables"""
+    start, end = time_window(name)
+    return (db_timestamp_to_business_day(start), db_timestamp_to_business_day(end))
+
+def db_timestamp_to_business_day(timestamp):
+    """Business-timezone date of a UTC database timestamp"""
+    utc_time = pytz.utc.localize(datetime.strptime(timestamp, DB_TIMESTAMP_FORMAT))
+    return utc_time.astimezone(BUSINESS_TIMEZONE).date().isoformat()
+
+# ========== SALES ROLLUP ==========
+# daily_sales holds one row per (day, key_type, payment_method) with the number and total amount
+# of approved sales. It is updated in the same transaction that approves a sale, so reports never
+# scan transactions. day is the business-timezone date of the approval (transactions.approved_at);
+# key_type is '' for balance top-ups. Admin balance adjustments are not sales and are left out.
+RECORD_SALE_SQL = '''INSERT INTO daily_sales (day, key_type, payment_method, sales_count, amount)
+                     SELECT ?, ?, payment_method, 1, amount 
+                     FROM transactions WHERE transaction_id = ?
+                     ON CONFLICT (day, key_type, payment_method) DO UPDATE SET 
+                         sales_count = sales_count + excluded.sales_count,
+                         amount = amount + excluded.amount'''
+
+def record_sale(cursor, transaction_id, key_type):
+    """Add an approved transaction to daily_sales - call inside the approving transaction"""
+    cursor.execute(RECORD_SALE_SQL, (business_day(), key_type, transaction_id))
+
+def get_sales_summary(start_day=None, end_day=None):
+    """Sales in [start_day, end_day) from the rollup: {(key_type, payment_method): (count, amount)}
+    
+    Days are business dates - see day_window().
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    query = 'SELECT key_type, payment_method, SUM(sales_count), SUM(amount) FROM daily_sales WHERE 1 = 1 '
+    params = []
+    if start_day:
+        query += 'AND day >= ? '
+        params.append(start_day)
+    if end_day:
+        query += 'AND day < ? '
+        params.append(end_day)
+    query += 'GROUP BY key_type, payment_method'
+    
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    conn.close()
+    
+    return {(key_type, payment_method): (count, amount) for key_type, payment_method, count, amount in rows}
+
+# ========== ADMIN PERMISSION CACHE ==========
+# telegram_id -> permission bitmask, for admins only. Loaded once, then kept in sync by
+# invalidate_admin_cache() whenever an admin row is written. The database is read without
+# holding _admin_cache_lock; the lock only guards swapping the results in, so a permission check
+# never waits on a query.
+_admin_cache = {}
+_admin_cache_loaded = False
+_admin_cache_stale = set()
+_admin_cache_generation = 0  # Bumped by every invalidation - reads that straddle one are retried
+_admin_cache_lock = threading.Lock()
+PERMISSION_CACHE_STATS = {'hits': 0, 'misses': 0}  # Updated under _admin_cache_lock
+
+ADMIN_MASKS_SQL = 'SELECT telegram_id, permission_mask FROM users WHERE is_admin = 1'
+ADMIN_MASK_SQL = 'SELECT permission_mask FROM users WHERE telegram_id = ? AND is_admin = 1'
+
+def _load_all_admins():
+    conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('SELECT is_admin FROM users WHERE telegram_id = ?', (user_id,))
+    cursor.execute(ADMIN_MASKS_SQL)
+    rows = cursor.fetchall()
+    conn.close()
+    
+    return {telegram_id: mask or 0 for telegram_id, mask in rows}
+
+def _load_admin(user_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(ADMIN_MASK_SQL, (user_id,))
     result = cursor.fetchone()
     conn.close()
     
-    return result and result[0] == 1
+    return (result[0] or 0) if result else None
+
+def refresh_admin_cache():
+    """Load the cache on first use and reload any stale entries"""
+    global _admin_cache, _admin_cache_loaded
+    
+    while True:
+        with _admin_cache_lock:
+            if _admin_cache_loaded and not _admin_cache_stale:
+                return
+            loaded = _admin_cache_loaded
+            stale = list(_admin_cache_stale)
+            generation = _admin_cache_generation
+            PERMISSION_CACHE_STATS['misses'] += len(stale) if loaded else 1
+        
+        if loaded:
+            masks = {user_id: _load_admin(user_id) for user_id in stale}
+        else:
+            admins = _load_all_admins()
+        
+        with _admin_cache_lock:
+            if _admin_cache_generation != generation:
+                # An admin row was written while we read, so what we read may be older than it
+                continue
+            if loaded:
+                for user_id, mask in masks.items():
+                    if mask is None:
+                        _admin_cache.pop(user_id, None)
+                    else:
+                        _admin_cache[user_id] = mask
+            else:
+                _admin_cache = admins
+                _admin_cache_loaded = True
+            _admin_cache_stale.clear()
+            return
+
+def admin_cache_ready():
+    """True once the cache is loaded and nothing in it is stale"""
+    with _admin_cache_lock:
+        return _admin_cache_loaded and not _admin_cache_stale
+
+def get_cached_admin(user_id):
+    """Permission bitmask for an admin, or None if the user is not an admin.
+    
+    Handlers find the cache already warm (see warm_caches); a miss reads the database in the
+    calling thread.
+    """
+    with _admin_cache_lock:
+        if _admin_cache_loaded and user_id not in _admin_cache_stale:
+            PERMISSION_CACHE_STATS['hits'] += 1
+            return _admin_cache.get(user_id)
+    
+    refresh_admin_cache()
+    with _admin_cache_lock:
+        return _admin_cache.get(user_id)
+
+def get_admins_with_permission(permission):
+    """telegram_ids of every admin holding permission (Super Admin always does), from the cache"""
+    bit = PERMISSION_BITS[permission]
+    refresh_admin_cache()
+    with _admin_cache_lock:
+        return [admin_id for admin_id, mask in _admin_cache.items()
+                if admin_id == SUPER_ADMIN_ID or mask & bit]
+
+def invalidate_admin_cache(user_id):
+    """Forget the cached admin entry so the next check reloads it from the database"""
+    global _admin_cache_generation
+    
+    with _admin_cache_lock:
+        _admin_cache.pop(user_id, None)
+        _admin_cache_stale.add(user_id)
+        _admin_cache_generation += 1
+
+def is_admin(user_id):
+    """Check if user is admin"""
+    return get_cached_admin(user_id) is not None
 
 def is_super_admin(user_id):
     """Check if user is super admin"""
     return user_id == SUPER_ADMIN_ID
 
 def get_admin_permissions(user_id):
-    """Get admin permissions from database"""
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT permissions FROM users WHERE telegram_id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    
-    if result and result[0]:
-        import ast
-        try:
-            return ast.literal_eval(result[0])
-        except:
-            return ADMIN_PERMISSIONS.copy()
-    return ADMIN_PERMISSIONS.copy()
+    """Get admin permissions as a dict (copy, safe to modify)"""
+    mask = get_cached_admin(user_id)
+    return mask_to_permissions(mask or 0)
 
 def has_permission(user_id, permission):
     """Check if admin has specific permission"""
     if is_super_admin(user_id):
         return True
     
-    permissions = get_admin_permissions(user_id)
-    return permissions.get(permission, False)
+    mask = get_cached_admin(user_id)
+    return bool(mask and mask & PERMISSION_BITS.get(permission, 0))
 
 def update_admin_permissions(user_id, permissions):
     """Update admin permissions in database"""
-    conn = sqlite3.connect('atoplay_bot.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('UPDATE users SET permissions = ? WHERE telegram_id = ?',
-                   (str(permissions), user_id))
+    cursor.execute('UPDATE users SET permission_mask = ? WHERE telegram_id = ?',
+                   (permissions_to_mask(permissions), user_id))
     
     conn.commit()
     conn.close()
+    
+    invalidate_admin_cache(user_id)
+    refresh_admin_cache()
 
 def get_all_admins():
     """Get all admin users"""
-    conn = sqlite3.connect('atoplay_bot.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     cursor.execute('''SELECT telegram_id, username, is_admin 
@@ -393,8 +1267,8 @@ def get_all_admins():
     return admins
 
 def get_admin_permissions_list(admin_id):
-    """Get admin permissions as formatted list"""
-    permissions = get_admin_permissions(admin_id)
+    """Get admin permissions as formatted list (rendered from the cached mask)"""
+    mask = get_cached_admin(admin_id) or 0
     
     permission_names = {
         'approve_payments': '✅ Approve Payments',
@@ -417,16 +1291,22 @@ def get_admin_permissions_list(admin_id):
     disabled = []
     
     for perm, name in permission_names.items():
-        if permissions.get(perm, False):
+        if mask & PERMISSION_BITS[perm]:
             enabled.append(name)
         else:
             disabled.append(name.replace('✅', '❌'))
     
     return enabled, disabled
 
-def log_admin_action(admin_id, action, target_user_id, details=""):
-    """Log admin actions"""
-    conn = sqlite3.connect('atoplay_bot.db')
+def log_admin_action(admin_id, action, target_user_id, details="", cursor=None):
+    """Log admin actions (pass cursor to write inside the caller's transaction)"""
+    if cursor is not None:
+        cursor.execute('''INSERT INTO admin_logs (admin_id, action, target_user_id, details) 
+                          VALUES (?, ?, ?, ?)''',
+                       (admin_id, action, target_user_id, details))
+        return
+    
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     cursor.execute('''INSERT INTO admin_logs (admin_id, action, target_user_id, details) 
@@ -437,7 +1317,79 @@ def log_admin_action(admin_id, action, target_user_id, details=""):
     conn.close()
 
 # ========== KEYBOARDS ==========
+# Markup objects are immutable once built (python-telegram-bot freezes them), so one instance is
+# shared by every chat. Menus are cached by (menu, permission mask, PAYMENT_METHODS_VERSION,
+# CATALOGUE_VERSION): a permission change gives the admin a new mask and so a new entry, and a
+# payment method or catalogue reload bumps its version and clears the cache.
+SUPER_ADMIN_MASK = -1  # Permission-mask key used for the super admin's menus
+_keyboard_cache = {}
+KEYBOARD_CACHE_STATS = {'hits': 0, 'misses': 0}
+
+def menu_mask(user_id):
+    """Permission mask a user's menus are cached under (0 for non-admins)"""
+    if is_super_admin(user_id):
+        return SUPER_ADMIN_MASK
+    return get_cached_admin(user_id) or 0
+
+def mask_allows(mask, permission):
+    """has_permission() for a menu_mask() value"""
+    return mask == SUPER_ADMIN_MASK or bool(mask & PERMISSION_BITS.get(permission, 0))
+
+def cached_keyboard(menu, mask, build, *args):
+    """Prebuilt markup for (menu, mask) under the current payment methods and catalogue, built on first use"""
+    key = (menu, mask, PAYMENT_METHODS_VERSION, CATALOGUE_VERSION)
+    markup = _keyboard_cache.get(key)
+    if markup is None:
+        KEYBOARD_CACHE_STATS['misses'] += 1
+        markup = _keyboard_cache[key] = build(*args)
+    else:
+        KEYBOARD_CACHE_STATS['hits'] += 1
+    return markup
+
+def invalidate_keyboard_cache():
+    """Drop every cached menu - called when payment methods or the catalogue are reloaded"""
+    _keyboard_cache.clear()
+
 def get_user_main_menu(is_admin=False):
+    return cached_keyboard('user_main', int(bool(is_admin)), _build_user_main_menu, bool(is_admin))
+
+def get_admin_main_menu(user_id):
+    """Admin panel buttons the user has permission for"""
+    mask = menu_mask(user_id)
+    return cached_keyboard('admin_main', mask, _build_admin_main_menu, mask)
+
+def get_admin_stock_menu(user_id):
+    mask = menu_mask(user_id)
+    return cached_keyboard('admin_stock', mask, _build_admin_stock_menu, mask)
+
+def get_admin_payments_menu(user_id):
+    mask = menu_mask(user_id)
+    return cached_keyboard('admin_payments', mask, _build_admin_payments_menu, mask)
+
+def get_admin_prices_menu(user_id):
+    mask = menu_mask(user_id)
+    return cached_keyboard('admin_prices', mask, _build_admin_prices_menu, mask)
+
+def get_admin_users_menu(user_id):
+    mask = menu_mask(user_id)
+    return cached_keyboard('admin_users', mask, _build_admin_users_menu, mask)
+
+def get_admin_settings_menu(user_id):
+    if not is_super_admin(user_id):
+        return None
+    return cached_keyboard('admin_settings', SUPER_ADMIN_MASK, _build_admin_settings_menu)
+
+def get_buy_menu():
+    return cached_keyboard('buy', 0, _build_buy_menu)
+
+def get_payment_methods_menu():
+    return cached_keyboard('payment_methods', 0, _build_payment_methods_menu)
+
+def get_balance_choice_menu():
+    """Use Balance / New Payment choice shown when the balance covers the product"""
+    return cached_keyboard('balance_choice', 0, _build_balance_choice_menu)
+
+def _build_user_main_menu(is_admin):
     if is_admin:
         keyboard = [
             [KeyboardButton("🛒 Buy Keys"), KeyboardButton("🔧 Admin Panel")],
@@ -452,56 +1404,60 @@ def get_user_main_menu(is_admin=False):
         ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
 
-def get_admin_main_menu(user_id):
+def _build_admin_main_menu(mask):
     """Beautiful admin panel with inline buttons based on permissions"""
     keyboard = []
     
-    if has_permission(user_id, 'view_stock'):
+    if mask_allows(mask, 'approve_payments'):
+        keyboard.append([InlineKeyboardButton("📥 Pending Payments", callback_data='approval_inbox')])
+    
+    if mask_allows(mask, 'view_stock'):
         keyboard.append([InlineKeyboardButton("📦 Stock Management", callback_data='admin_stock')])
     
-    if has_permission(user_id, 'change_prices'):
+    if mask_allows(mask, 'change_prices'):
         keyboard.append([InlineKeyboardButton("💰 Price Management", callback_data='admin_prices')])
     
-    if has_permission(user_id, 'view_users'):
+    if mask_allows(mask, 'view_users'):
         keyboard.append([InlineKeyboardButton("👤 User Management", callback_data='admin_users')])
     
-    if has_permission(user_id, 'view_payments'):
+    if mask_allows(mask, 'view_payments'):
         keyboard.append([InlineKeyboardButton("💳 Payment Methods", callback_data='admin_payments')])
     
-    if has_permission(user_id, 'view_stats'):
+    if mask_allows(mask, 'view_stats'):
         keyboard.append([InlineKeyboardButton("📊 View Statistics", callback_data='admin_stats')])
     
-    if is_super_admin(user_id) or has_permission(user_id, 'manage_admins'):
+    if mask_allows(mask, 'manage_admins'):
         keyboard.append([InlineKeyboardButton("⚙️ Admin Settings", callback_data='admin_settings')])
     
     keyboard.append([InlineKeyboardButton("🏠 Back to Main Menu", callback_data='admin_back_home')])
     
     return InlineKeyboardMarkup(keyboard)
 
-def get_admin_stock_menu(user_id):
+def _build_admin_stock_menu(mask):
     """Stock management sub-menu based on permissions"""
     keyboard = []
     
-    if has_permission(user_id, 'add_keys'):
-        keyboard.append([InlineKeyboardButton("➕ Add 3-Day Key", callback_data='addkey_3d_menu')])
-        keyboard.append([InlineKeyboardButton("➕ Add 10-Day Key", callback_data='addkey_10d_menu')])
-        keyboard.append([InlineKeyboardButton("➕ Add 30-Day Key", callback_data='addkey_30d_menu')])
+    if mask_allows(mask, 'add_keys'):
+        for product in list_products():
+            keyboard.append([InlineKeyboardButton(f"➕ Add {product['name']}",
+                                                  callback_data=f"addkey_{product['key_type']}_menu")])
+        keyboard.append([InlineKeyboardButton("📥 Import Keys From File", callback_data='importkeys_menu')])
     
-    if has_permission(user_id, 'delete_keys'):
+    if mask_allows(mask, 'delete_keys'):
         keyboard.append([InlineKeyboardButton("🗑️ Delete Key", callback_data='delkey_menu')])
     
-    if has_permission(user_id, 'view_stock'):
+    if mask_allows(mask, 'view_stock'):
         keyboard.append([InlineKeyboardButton("📋 View All Keys", callback_data='view_stock')])
     
     keyboard.append([InlineKeyboardButton("🔙 Back", callback_data='admin_back')])
     
     return InlineKeyboardMarkup(keyboard)
 
-def get_admin_payments_menu(user_id):
+def _build_admin_payments_menu(mask):
     """Payment methods management sub-menu based on permissions"""
     keyboard = []
     
-    if has_permission(user_id, 'change_payments'):
+    if mask_allows(mask, 'change_payments'):
         keyboard.append([InlineKeyboardButton("📱 Easypaisa", callback_data='set_easypaisa_menu')])
         keyboard.append([InlineKeyboardButton("📱 JazzCash", callback_data='set_jazzcash_menu')])
         keyboard.append([InlineKeyboardButton("💰 Binance", callback_data='set_binance_menu')])
@@ -509,57 +1465,55 @@ def get_admin_payments_menu(user_id):
         keyboard.append([InlineKeyboardButton("📸 UPI QR Code", callback_data='set_upi_qr_menu')])
         keyboard.append([InlineKeyboardButton("📸 Binance QR Code", callback_data='set_binance_qr_menu')])
     
-    if has_permission(user_id, 'view_payments'):
+    if mask_allows(mask, 'view_payments'):
         keyboard.append([InlineKeyboardButton("👀 View Methods", callback_data='view_payments')])
     
     keyboard.append([InlineKeyboardButton("🔙 Back", callback_data='admin_back')])
     
     return InlineKeyboardMarkup(keyboard)
 
-def get_admin_prices_menu(user_id):
+def _build_admin_prices_menu(mask):
     """Price management sub-menu based on permissions"""
     keyboard = []
     
-    if has_permission(user_id, 'change_prices'):
-        keyboard.append([InlineKeyboardButton("💰 3-Day Price", callback_data='price_3d_menu')])
-        keyboard.append([InlineKeyboardButton("💰 10-Day Price", callback_data='price_10d_menu')])
-        keyboard.append([InlineKeyboardButton("💰 30-Day Price", callback_data='price_30d_menu')])
+    if mask_allows(mask, 'change_prices'):
+        for product in list_products():
+            keyboard.append([InlineKeyboardButton(f"💰 {product['name']} Price",
+                                                  callback_data=f"price_{product['key_type']}_menu")])
+        keyboard.append([InlineKeyboardButton("➕ Add Product", callback_data='addproduct_menu')])
     
-    if has_permission(user_id, 'view_payments'):
+    if mask_allows(mask, 'view_payments'):
         keyboard.append([InlineKeyboardButton("📊 View All Prices", callback_data='view_prices')])
     
     keyboard.append([InlineKeyboardButton("🔙 Back", callback_data='admin_back')])
     
     return InlineKeyboardMarkup(keyboard)
 
-def get_admin_users_menu(user_id):
+def _build_admin_users_menu(mask):
     """User management sub-menu based on permissions"""
     keyboard = []
     
-    if has_permission(user_id, 'block_users'):
+    if mask_allows(mask, 'block_users'):
         keyboard.append([InlineKeyboardButton("🚫 Block User", callback_data='block_user_menu')])
     
-    if has_permission(user_id, 'unblock_users'):
+    if mask_allows(mask, 'unblock_users'):
         keyboard.append([InlineKeyboardButton("✅ Unblock User", callback_data='unblock_user_menu')])
     
-    if has_permission(user_id, 'view_user_info'):
+    if mask_allows(mask, 'view_user_info'):
         keyboard.append([InlineKeyboardButton("👤 User Info", callback_data='userinfo_menu')])
     
-    if has_permission(user_id, 'view_users'):
+    if mask_allows(mask, 'view_users'):
         keyboard.append([InlineKeyboardButton("📊 All Users", callback_data='view_users')])
     
-    if has_permission(user_id, 'adjust_balance'):
+    if mask_allows(mask, 'adjust_balance'):
         keyboard.append([InlineKeyboardButton("💰 Manage Balance", callback_data='manage_user_balance_menu')])
     
     keyboard.append([InlineKeyboardButton("🔙 Back", callback_data='admin_back')])
     
     return InlineKeyboardMarkup(keyboard)
 
-def get_admin_settings_menu(user_id):
+def _build_admin_settings_menu():
     """Admin settings sub-menu (for super admin only)"""
-    if not is_super_admin(user_id):
-        return None
-    
     keyboard = [
         [InlineKeyboardButton("➕ Add Admin", callback_data='addadmin_menu')],
         [InlineKeyboardButton("➖ Remove Admin", callback_data='removeadmin_menu')],
@@ -570,18 +1524,13 @@ def get_admin_settings_menu(user_id):
     ]
     return InlineKeyboardMarkup(keyboard)
 
-def get_buy_menu():
-    keyboard = [
-        [
-            InlineKeyboardButton("3-Day Key", callback_data='product_3d'),
-            InlineKeyboardButton("10-Day Key", callback_data='product_10d')
-        ],
-        [
-            InlineKeyboardButton("30-Day Key", callback_data='product_30d'),
-            InlineKeyboardButton("💳 Add Balance", callback_data='add_balance')
-        ],
-        [InlineKeyboardButton("❌ Cancel", callback_data='cancel')]
-    ]
+def _build_buy_menu():
+    """Product buttons two to a row, then Add Balance, then Cancel"""
+    buttons = [InlineKeyboardButton(product['name'], callback_data=product['callback'])
+               for product in list_products()]
+    buttons.append(InlineKeyboardButton("💳 Add Balance", callback_data='add_balance'))
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data='cancel')])
     return InlineKeyboardMarkup(keyboard)
 
 def get_permissions_menu(target_admin_id):
@@ -612,7 +1561,17 @@ def get_permissions_menu(target_admin_id):
     
     return InlineKeyboardMarkup(keyboard)
 
-def get_payment_methods_menu():
+def _build_balance_choice_menu():
+    keyboard = [
+        [
+            InlineKeyboardButton("💳 Use Balance", callback_data='use_balance'),
+            InlineKeyboardButton("💸 New Payment", callback_data='new_payment')
+        ],
+        [InlineKeyboardButton("❌ Cancel", callback_data='cancel')]
+    ]
+    return InlineKeyboardMarkup(keyboard)
+
+def _build_payment_methods_menu():
     """Payment methods menu for customers"""
     keyboard = [
         [
@@ -627,89 +1586,47 @@ def get_payment_methods_menu():
     ]
     return InlineKeyboardMarkup(keyboard)
 
-# ========== NEW FUNCTION: NOTIFY ADMINS ABOUT KEY SALE ==========
-async def notify_admins_about_key_sale(context, user_id, username, product_name, key_value, key_type, amount, payment_method="balance"):
-    """Notify all admins when a key is sold"""
-    try:
-        admins = get_all_admins()
-        
-        # Get user details
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT unique_id FROM users WHERE telegram_id = ?', (user_id,))
-        user_data = cursor.fetchone()
-        unique_id = user_data[0] if user_data else "N/A"
-        conn.close()
-        
-        # Get current stock after sale
-        stock_info = get_stock_info()
-        
-        # Create notification message
-        notification_text = f"""🔔 **NEW KEY SOLD!**
-
-✅ **Sale Details:**
-• **Customer:** @{username} (ID: {user_id})
-• **Unique ID:** {unique_id}
-• **Product:** {product_name}
-• **Key:** `{key_value}`
-• **Key Type:** {key_type.upper()}-Day
-• **Price:** ₹{amount}
-• **Payment Method:** {payment_method.title()}
-• **Time:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-📊 **Updated Stock:**
-• 3-Day Keys: {stock_info.get('3d', 0)} available
-• 10-Day Keys: {stock_info.get('10d', 0)} available
-• 30-Day Keys: {stock_info.get('30d', 0)} available
-
-⚠️ **Key has been automatically removed from stock.**"""
-        
-        # Send to all admins
-        for admin_id, admin_name, _ in admins:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=notification_text,
-                    parse_mode='Markdown'
-                )
-                logger.info(f"Key sale notification sent to admin: {admin_id}")
-            except Exception as e:
-                logger.error(f"Failed to send notification to admin {admin_id}: {e}")
-        
-    except Exception as e:
-        logger.error(f"Error in notify_admins_about_key_sale: {e}")
-
-# ========== HANDLERS ==========
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logger.info(f"Start command received from user: {update.effective_user.id}")
-    
-    try:
-        user = update.effective_user
-        user_id = user.id
-        
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT balance, unique_id, is_blocked, is_admin FROM users WHERE telegram_id = ?', (user_id,))
-        user_data = cursor.fetchone()
-        
-        # Check if user is blocked
-        if user_data and user_data[2] == 1:
-            await update.message.reply_text("❌ You are blocked from using this bot!")
-            conn.close()
-            return
-        
-        if not user_data:
-            unique_id = str(uuid.uuid4())[:8].upper()
-            is_admin_user = 1 if user_id in ADMIN_IDS else 0
-            cursor.execute('INSERT INTO users (telegram_id, username, unique_id, balance, is_blocked, is_admin) VALUES (?, ?, ?, ?, 0, ?)', 
-                          (user_id, user.username, unique_id, 0, is_admin_user))
-            conn.commit()
-            
-            welcome_text = f"""🎉 **Welcome to Atoplay Shop!**
-
-🆔 **Your Unique ID:** `{unique_id}`
-💰 **Balance:** ₹0
+# ========== MESSAGE TEMPLATES ==========
+class MessageTemplate:
+    """A Markdown message body parsed once, at import, with string.Formatter.
+    
+    Fields listed in escape hold user-supplied text (names, reasons, account names) and go through
+    escape_markdown() when rendered. Don't list fields that sit inside `code` spans - Telegram's
+    Markdown has no escaping there. render() formats each field and joins the pieces once.
+    """
+    
+    def __init__(self, source, escape=()):
+        self.escape = frozenset(escape)
+        self.parts = []  # (literal, field_name, format_spec, conversion)
+        self.fields = set()
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(source):
+            if field_name is not None and not field_name.isidentifier():
+                raise ValueError(f"Template fields must be plain names, got {field_name!r}")
+            self.parts.append((literal, field_name, format_spec or '', conversion))
+            if field_name is not None:
+                self.fields.add(field_name)
+        unknown = self.escape - self.fields
+        if unknown:
+            raise ValueError(f"Escaped fields not in template: {sorted(unknown)}")
+    
+    def render(self, **values):
+        pieces = []
+        for literal, field_name, format_spec, conversion in self.parts:
+            pieces.append(literal)
+            if field_name is None:
+                continue
+            value = values[field_name]
+            if conversion == 'r':
+                value = repr(value)
+            elif conversion == 's':
+                value = str(value)
+            if field_name in self.escape:
+                value = escape_markdown(str(value))
+            pieces.append(format(value, format_spec))
+        return ''.join(pieces)
+
+WELCOME_BODY = """🆔 **Your Unique ID:** `{unique_id}`
+💰 **Balance:** ₹{balance}
 
 📱 **Available Commands:**
 • /buy - Purchase Atoplay keys
@@ -720,25 +1637,481 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📢 **Channel:** @SnakeEngine105
 
 👉 **Use the buttons below to navigate!**"""
-        else:
-            balance, unique_id, is_blocked, is_admin_user = user_data
-            
-            welcome_text = f"""🎉 **Welcome back {user.first_name}!**
 
-🆔 **Your Unique ID:** `{unique_id}`
-💰 **Balance:** ₹{balance}
+WELCOME_NEW_TEMPLATE = MessageTemplate("🎉 **Welcome to Atoplay Shop!**\n\n" + WELCOME_BODY)
+WELCOME_BACK_TEMPLATE = MessageTemplate("🎉 **Welcome back {first_name}!**\n\n" + WELCOME_BODY, escape=('first_name',))
 
-📱 **Available Commands:**
-• /buy - Purchase Atoplay keys
-• /balance - Check your balance
-• /mykeys - View your purchased keys
+BUY_MENU_TEMPLATE = MessageTemplate("""🛒 **Select Product:**
 
-📞 **Contact:** @Aarifseller
-📢 **Channel:** @SnakeEngine105
+{product_lines}
 
-👉 **Use the buttons below to navigate!**"""
+📦 **Current Stock:**
+{stock_lines}
+
+👇 **Select a product or add balance:**""")
+BUY_MENU_PRODUCT_TEMPLATE = MessageTemplate("{number} **{name}** - ₹{price}")
+
+def buy_menu_number(position):
+    """1️⃣ .. 9️⃣ keycap emoji, then plain numbers"""
+    return f"{position}\ufe0f\u20e3" if position < 10 else f"{position}."
+
+def build_buy_menu_text(stock_info):
+    """/buy screen body for the active products"""
+    product_lines = '\n'.join(
+        BUY_MENU_PRODUCT_TEMPLATE.render(number=buy_menu_number(position), name=product['name'], price=product['price'])
+        for position, product in enumerate(list_products(), 1)
+    )
+    return BUY_MENU_TEMPLATE.render(product_lines=product_lines, stock_lines=stock_lines(stock_info))
+
+OUT_OF_STOCK_TEMPLATE = MessageTemplate("""❌ **Out of Stock!**
+
+{product_name} is currently out of stock.
+
+📞 Contact @Aarifseller for availability.
+Or choose another product.""")
+
+KEY_INSTRUCTIONS = """📋 **Instructions:**
+1. Open Atoplay application
+2. Go to settings or activation section
+3. Enter the key: `{key_value}`
+4. Enjoy your {days} days subscription!"""
+
+PURCHASE_SUCCESS_TEMPLATE = MessageTemplate("""✅ **Purchase Successful!**
+
+🎉 Congratulations! Your purchase is complete.
+
+📦 **Product:** {product_name}
+💰 **Price:** ₹{price}
+💳 **New Balance:** ₹{new_balance}
+🔑 **Your Key:** `{key_value}`
+
+""" + KEY_INSTRUCTIONS + """
+
+⚠️ **Important:**
+• This key is for ONE-TIME use only
+• Do not share with anyone
+• Key will expire after {days} days
+
+📞 **Contact:** @Aarifseller for any issues.
+📢 **Join:** @SnakeEngine105""")
+
+APPROVAL_HEADER = """✅ **Payment Approved!**
+
+🎉 Congratulations! Your payment has been approved.
+
+📋 **Transaction Details:**
+• **Transaction ID:** #{transaction_id}
+"""
+
+APPROVED_KEY_TEMPLATE = MessageTemplate(APPROVAL_HEADER + """• **Product:** {product_name}
+• **Amount:** ₹{amount}
+• **Status:** ✅ Approved
+• **Approved by:** Admin
+
+💰 **Your New Balance:** ₹{new_balance}
+
+🔑 **Your Key:** `{key_value}`
+
+""" + KEY_INSTRUCTIONS + """
+
+📞 **Contact:** @Aarifseller for any queries.""")
+
+APPROVED_BALANCE_TEMPLATE = MessageTemplate(APPROVAL_HEADER + """• **Amount:** ₹{amount}
+• **Status:** ✅ Approved
+• **Approved by:** Admin
+
+💰 **Your New Balance:** ₹{new_balance}
+
+💸 You can now use your balance to purchase keys!
+Use /buy to get started.
+
+📞 **Contact:** @Aarifseller for any queries.""")
+
+# Payment details screen, assembled from the pieces that apply to the chosen method
+PAYMENT_PRODUCT_TEMPLATE = MessageTemplate("\n🔸 **Product:** {product_name}")
+PAYMENT_PURPOSE_TEMPLATE = MessageTemplate("\n🔸 **Purpose:** {purpose}\n🔸 **Method:** {method_name}")
+PAYMENT_ACCOUNT_TEMPLATES = {
+    'easypaisa': MessageTemplate("\n🔸 **Number:** `{number}`"),
+    'jazzcash': MessageTemplate("\n🔸 **Number:** `{number}`"),
+    'binance': MessageTemplate("\n🔸 **Pay ID:** `{pay_id}`"),
+    'upi': MessageTemplate("\n🔸 **UPI ID:** `{number}`")
+}
+PAYMENT_ACCOUNT_NAME_TEMPLATE = MessageTemplate("\n🔸 **Account Name:** {account_name}", escape=('account_name',))
+PAYMENT_QR_NOTES = {
+    'upi': "\n\n📱 **UPI QR Code:** Available (Scan to pay)",
+    'binance': "\n\n💰 **Binance QR Code:** Available (Scan to pay)"
+}
+PAYMENT_INSTRUCTIONS_TEMPLATE = MessageTemplate("""\n🔸 **Amount:** ₹{amount}{qr_note}
+
+📋 **Instructions:**
+1. Send ₹{amount} to above {method_name} details
+2. Take a clear screenshot of successful payment
+3. Send the screenshot here
+
+⚠️ **Make sure screenshot shows:**
+• Transaction ID/Reference
+• Amount
+• Date & Time
+
+📸 **After payment, send the screenshot now.**""")
+
+def build_payment_details(payment_method, payment_info, amount, purpose, product_name=None):
+    """Payment details screen for a product purchase or a balance top-up"""
+    pieces = ["💳 **Payment Details:**\n"]
+    if product_name:
+        pieces.append(PAYMENT_PRODUCT_TEMPLATE.render(product_name=product_name))
+    pieces.append(PAYMENT_PURPOSE_TEMPLATE.render(purpose=purpose, method_name=payment_info['name']))
+    
+    # Exchange rate notice for methods paid in another currency
+    if payment_method in EXCHANGE_RATES:
+        pieces.append(f"\n\n{EXCHANGE_RATES[payment_method]['message']}\n")
+    
+    account_template = PAYMENT_ACCOUNT_TEMPLATES.get(payment_method)
+    if account_template:
+        pieces.append(account_template.render(number=payment_info.get('number', ''), pay_id=payment_info.get('pay_id', '')))
+        if payment_method != 'binance' and payment_info.get('account_name'):
+            pieces.append(PAYMENT_ACCOUNT_NAME_TEMPLATE.render(account_name=payment_info['account_name']))
+    
+    qr_note = PAYMENT_QR_NOTES.get(payment_method, '') if payment_info.get('qr_code') else ''
+    pieces.append(PAYMENT_INSTRUCTIONS_TEMPLATE.render(amount=amount, qr_note=qr_note, method_name=payment_info['name']))
+    return ''.join(pieces)
+
+# Admin screens
+ADMIN_PANEL_TEMPLATE = MessageTemplate("""🔧 **ADMIN PANEL** - **Control Center**
+
+📊 **Quick Stats:**
+{stock_lines}
+
+🎛️ **Management Sections:**
+
+📥 **Pending Payments** - Approve/Reject queue
+📦 **Stock Management** - Add/Delete/View keys
+💰 **Price Management** - Change product prices
+👤 **User Management** - Block/Unblock/View users
+💳 **Payment Methods** - Update payment details
+📊 **Statistics** - View bot analytics
+🔑 **Admin Settings** - Manage admins (Super Admin only)
+
+👇 **Select a section to manage:**""")
+
+def build_admin_panel_text(stock_info):
+    """Admin panel body, for both /admin and the Back to Admin Panel buttons"""
+    return ADMIN_PANEL_TEMPLATE.render(stock_lines=stock_lines(stock_info))
+
+ADMIN_PERMISSIONS_ENTRY_TEMPLATE = MessageTemplate("**{username_display}** ({telegram_id}) - {status}",
+                                                   escape=('username_display',))
+
+def build_permissions_overview(admins):
+    """Super Admin's overview: each admin followed by their enabled and disabled permissions"""
+    lines = ["👑 **ADMIN PERMISSIONS OVERVIEW**", ""]
+    for admin_telegram_id, username, _ in admins:
+        lines.append(ADMIN_PERMISSIONS_ENTRY_TEMPLATE.render(
+            username_display=f"@{username}" if username else "No username",
+            telegram_id=admin_telegram_id,
+            status="👑 Super Admin" if admin_telegram_id == SUPER_ADMIN_ID else "🔧 Admin"))
         
-        conn.close()
+        if admin_telegram_id != SUPER_ADMIN_ID:
+            enabled, disabled = get_admin_permissions_list(admin_telegram_id)
+            if enabled:
+                lines.append("✅ **Enabled:**")
+                lines.extend(f"  • {perm}" for perm in enabled)
+            if disabled:
+                lines.append("❌ **Disabled:**")
+                lines.extend(f"  • {perm}" for perm in disabled)
+        
+        lines.append("")
+    return '\n'.join(lines) + '\n'
+
+# ========== OUTBOUND MESSAGE QUEUE ==========
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """Take a token - returns 0 on success, else the seconds to wait for one"""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+class OutboundQueue:
+    """Single exit for bot sends: priority order, global and per-chat token buckets,
+    RetryAfter / network-error retries, and depth metrics.
+
+    Works with any object exposing the Bot methods, so a fake bot can stand in for tests.
+    """
+
+    def __init__(self, global_rate=SEND_RATE_GLOBAL, chat_rate=SEND_RATE_PER_CHAT,
+                 chat_burst=SEND_BURST_PER_CHAT, workers=SEND_WORKERS, max_retries=SEND_MAX_RETRIES):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.worker_count = workers
+        self.max_retries = max_retries
+        self._queue = None
+        self._loop = None
+        self._workers = []
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        self._paused_until = 0
+        self._seq = itertools.count()
+        self._depth = {}
+        self._delayed = 0
+        self._in_flight = 0
+        self.counters = {'sent': 0, 'failed': 0, 'retried': 0, 'rate_limited': 0, 'max_depth': 0}
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.PriorityQueue()
+            self._depth = {}
+            self._delayed = 0
+            self._workers = [loop.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    def _put(self, item):
+        priority = item[0]
+        self._depth[priority] = self._depth.get(priority, 0) + 1
+        self._queue.put_nowait(item)
+        self.counters['max_depth'] = max(self.counters['max_depth'], self._queue.qsize())
+
+    def _put_later(self, delay, item):
+        self._delayed += 1
+        
+        def put():
+            self._delayed -= 1
+            self._put(item)
+        self._loop.call_later(delay, put)
+
+    def submit(self, bot, method, priority=PRIORITY_CUSTOMER, **kwargs):
+        """Queue bot.<method>(**kwargs) and return a future for its result"""
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._put((priority, next(self._seq), bot, method, kwargs, future, 0))
+        return future
+
+    async def send(self, bot, method, priority=PRIORITY_CUSTOMER, **kwargs):
+        """Queue a send and wait for it - raises the last error if every attempt failed"""
+        return await self.submit(bot, method, priority, **kwargs)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 1000:
+                # Forget chats that have been quiet long enough to refill
+                self._chat_buckets = {chat: b for chat, b in self._chat_buckets.items() if not b.is_full()}
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            priority, seq, bot, method, kwargs, future, attempts = item
+            self._depth[priority] -= 1
+            
+            if future.done():
+                # Caller gave up (timeout/cancel) while it was queued
+                continue
+            
+            # Flood control from Telegram applies to the whole bot
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            
+            chat_id = kwargs.get('chat_id')
+            if chat_id is not None:
+                wait = self._chat_bucket(chat_id).take()
+                if wait:
+                    # Don't hold a worker for one busy chat
+                    self._put_later(wait, item)
+                    continue
+            
+            wait = self._global_bucket.take()
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self._global_bucket.take()
+            
+            self._in_flight += 1
+            try:
+                result = await getattr(bot, method)(**kwargs)
+            except BadRequest as e:
+                # A malformed request won't get better on retry
+                self._fail(future, e)
+            except RetryAfter as e:
+                self.counters['rate_limited'] += 1
+                retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                self._retry_or_fail(item, e, 0)
+            except NetworkError as e:
+                self._retry_or_fail(item, e, 2 ** attempts)
+            except Exception as e:
+                self._fail(future, e)
+            else:
+                self.counters['sent'] += 1
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self._in_flight -= 1
+
+    def _retry_or_fail(self, item, error, delay):
+        priority, seq, bot, method, kwargs, future, attempts = item
+        if attempts >= self.max_retries or future.done():
+            self._fail(future, error)
+            return
+        
+        self.counters['retried'] += 1
+        logger.warning(f"Retrying {method} to {kwargs.get('chat_id')} after {error} ({attempts + 1}/{self.max_retries})")
+        # Same priority and sequence number, so it keeps its place in line
+        retry = (priority, seq, bot, method, kwargs, future, attempts + 1)
+        if delay:
+            self._put_later(delay, retry)
+        else:
+            self._put(retry)
+
+    def _fail(self, future, error):
+        self.counters['failed'] += 1
+        if not future.done():
+            future.set_exception(error)
+
+    def stats(self):
+        """Queue depth (total, per priority, waiting on a chat limit) and lifetime counters"""
+        depth = self._queue.qsize() if self._queue else 0
+        return dict(self.counters, depth=depth, delayed=self._delayed, in_flight=self._in_flight,
+                    depth_by_priority={p: n for p, n in sorted(self._depth.items()) if n})
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+        self._loop = None
+
+OUTBOX = OutboundQueue()
+
+# ========== NEW FUNCTION: NOTIFY ADMINS ABOUT KEY SALE ==========
+async def send_tracked(bot, chat_id, priority, method='send_message', *, timeout=None, **message):
+    """One send through OUTBOX - returns (chat_id, delivered, latency_ms, error).
+    
+    timeout (seconds) gives up on the send; None waits for OUTBOX to deliver or fail. Leave it
+    None for messages that can't be lost, like a key the customer has already paid for.
+    """
+    started = time.monotonic()
+    try:
+        await asyncio.wait_for(OUTBOX.send(bot, method, priority, chat_id=chat_id, **message), timeout)
+        error = None
+    except asyncio.TimeoutError:
+        error = f"timed out after {timeout}s"
+    except Exception as e:
+        error = str(e)
+    return chat_id, error is None, (time.monotonic() - started) * 1000, error
+
+async def send_to_chats(bot, chat_ids, priority=PRIORITY_ADMIN, method='send_message', **message):
+    """Send the same message (bot.<method>) to several chats concurrently through OUTBOX.
+    
+    At most NOTIFY_CONCURRENCY sends are queued at once and each gets NOTIFY_TIMEOUT seconds.
+    Returns a list of (chat_id, delivered, latency_ms, error) in chat_ids order.
+    """
+    semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+    
+    async def send_one(chat_id):
+        async with semaphore:
+            return await send_tracked(bot, chat_id, priority, method, timeout=NOTIFY_TIMEOUT, **message)
+    
+    return await asyncio.gather(*(send_one(chat_id) for chat_id in chat_ids))
+
+async def notify_admins_about_key_sale(context, user_id, username, product_name, key_value, key_type, amount, payment_method="balance"):
+    """Notify all admins when a key is sold - returns the per-admin send results"""
+    try:
+        admins = await run_db(get_all_admins)
+        
+        # Get user details
+        user_data = await db_fetchone('SELECT unique_id FROM users WHERE telegram_id = ?', (user_id,))
+        unique_id = user_data[0] if user_data else "N/A"
+        
+        # Get current stock after sale
+        stock_info = get_stock_info()
+        
+        # Create notification message
+        notification_text = f"""🔔 **NEW KEY SOLD!**
+
+✅ **Sale Details:**
+• **Customer:** @{username} (ID: {user_id})
+• **Unique ID:** {unique_id}
+• **Product:** {product_name}
+• **Key:** `{key_value}`
+• **Key Type:** {product_days(key_type)}-Day
+• **Price:** ₹{amount}
+• **Payment Method:** {payment_method.title()}
+• **Time:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+📊 **Updated Stock:**
+{stock_lines(stock_info)}
+
+⚠️ **Key has been automatically removed from stock.**"""
+        
+        # Send to all admins at once
+        results = await send_to_chats(
+            context.bot,
+            [admin_id for admin_id, admin_name, _ in admins],
+            text=notification_text,
+            parse_mode='Markdown'
+        )
+        
+        for admin_id, delivered, latency_ms, error in results:
+            if delivered:
+                logger.info(f"Key sale notification sent to admin: {admin_id} ({latency_ms:.0f} ms)")
+            else:
+                logger.error(f"Failed to send notification to admin {admin_id}: {error} ({latency_ms:.0f} ms)")
+        
+        delivered_count = sum(1 for result in results if result[1])
+        logger.info(f"Key sale notification delivered to {delivered_count}/{len(results)} admins")
+        return results
+        
+    except Exception as e:
+        logger.error(f"Error in notify_admins_about_key_sale: {e}")
+
+# ========== HANDLERS ==========
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    logger.info(f"Start command received from user: {update.effective_user.id}")
+    
+    try:
+        user = update.effective_user
+        user_id = user.id
+        
+        user_data = await db_fetchone('SELECT balance, unique_id, is_blocked, is_admin FROM users WHERE telegram_id = ?', (user_id,))
+        
+        # Check if user is blocked
+        if user_data and user_data[2] == 1:
+            await update.message.reply_text("❌ You are blocked from using this bot!")
+            return
+        
+        if not user_data:
+            unique_id = str(uuid.uuid4())[:8].upper()
+            is_admin_user = 1 if user_id in ADMIN_IDS else 0
+            await db_execute('INSERT INTO users (telegram_id, username, unique_id, balance, is_blocked, is_admin, created_at) VALUES (?, ?, ?, ?, 0, ?, CURRENT_TIMESTAMP)', 
+                             (user_id, user.username, unique_id, 0, is_admin_user))
+            if is_admin_user:
+                invalidate_admin_cache(user_id)
+                await run_db(refresh_admin_cache)
+            
+            welcome_text = WELCOME_NEW_TEMPLATE.render(unique_id=unique_id, balance=0)
+        else:
+            balance, unique_id, is_blocked, is_admin_user = user_data
+            
+            welcome_text = WELCOME_BACK_TEMPLATE.render(first_name=user.first_name, unique_id=unique_id, balance=balance)
         
         reply_markup = get_user_main_menu(is_admin(user_id))
         
@@ -757,28 +2130,9 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Unauthorized!")
         return
     
-    # Update payment methods from database
-    update_payment_methods_global()
-    
     stock_info = get_stock_info()
     
-    text = f"""🔧 **ADMIN PANEL** - **Control Center**
-
-📊 **Quick Stats:**
-• 3-Day Keys: {stock_info.get('3d', 0)} available
-• 10-Day Keys: {stock_info.get('10d', 0)} available
-• 30-Day Keys: {stock_info.get('30d', 0)} available
-
-🎛️ **Management Sections:**
-
-📦 **Stock Management** - Add/Delete/View keys
-💰 **Price Management** - Change product prices
-👤 **User Management** - Block/Unblock/View users
-💳 **Payment Methods** - Update payment details
-📊 **Statistics** - View bot analytics
-🔑 **Admin Settings** - Manage admins (Super Admin only)
-
-👇 **Select a section to manage:**"""
+    text = build_admin_panel_text(stock_info)
     
     reply_markup = get_admin_main_menu(admin_id)
     
@@ -795,11 +2149,7 @@ async def buy(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = user.id
         
         # Check if user is blocked
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_blocked FROM users WHERE telegram_id = ?', (user_id,))
-        user_data = cursor.fetchone()
-        conn.close()
+        user_data = await db_fetchone('SELECT is_blocked FROM users WHERE telegram_id = ?', (user_id,))
         
         if user_data and user_data[0] == 1:
             await update.message.reply_text("❌ You are blocked from using this bot!")
@@ -810,21 +2160,7 @@ async def buy(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         reply_markup = get_buy_menu()
         
-        # Load current payment methods
-        update_payment_methods_global()
-        
-        text = f"""🛒 **Select Product:**
-
-1️⃣ **3-Day Atoplay Key** - ₹{PRODUCT_PRICES['3d']}
-2️⃣ **10-Day Atoplay Key** - ₹{PRODUCT_PRICES['10d']}
-3️⃣ **30-Day Atoplay Key** - ₹{PRODUCT_PRICES['30d']}
-
-📦 **Current Stock:**
-• 3-Day Keys: {stock_info.get('3d', 0)} available
-• 10-Day Keys: {stock_info.get('10d', 0)} available
-• 30-Day Keys: {stock_info.get('30d', 0)} available
-
-👇 **Select a product or add balance:**"""
+        text = build_buy_menu_text(stock_info)
         
         if update.callback_query:
             await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
@@ -847,354 +2183,18 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"Callback from user: {user_id}, data: {data}")
     
     try:
-        # Handle cancel
-        if data == 'cancel':
-            try:
-                await query.edit_message_text("❌ Cancelled!")
-            except Exception as e:
-                logger.error(f"Error editing message: {e}")
-            return
-        
-        # Handle admin panel navigation
-        if data == 'admin_back':
-            await admin_panel_callback(update, context)
-            return
-        
-        if data == 'admin_back_home':
-            await start_callback(update, context)
-            return
-        
-        # Handle permission toggling
-        if data.startswith('toggle_'):
-            await toggle_permission(update, context)
-            return
-        
-        if data.startswith('save_permissions_'):
-            await save_permissions(update, context)
+        # Routes are declared in CALLBACK_ROUTER (see CALLBACK ROUTING below)
+        route = CALLBACK_ROUTER.resolve(data)
+        if route is None:
             return
         
-        # Handle select_admin callback
-        if data.startswith('select_admin_'):
-            await select_admin_for_permissions(update, context)
+        handler, permission, denied = route
+        if not route_allowed(user_id, permission):
+            await query.edit_message_text(denied)
             return
         
-        # Admin panel sections
-        if data == 'admin_stock':
-            if has_permission(user_id, 'view_stock'):
-                await admin_stock_menu(update, context)
-            else:
-                await query.edit_message_text("❌ You don't have permission to access Stock Management!")
-            return
-        
-        if data == 'admin_prices':
-            if has_permission(user_id, 'change_prices') or has_permission(user_id, 'view_payments'):
-                await admin_prices_menu(update, context)
-            else:
-                await query.edit_message_text("❌ You don't have permission to access Price Management!")
-            return
-        
-        if data == 'admin_users':
-            if has_permission(user_id, 'view_users'):
-                await admin_users_menu(update, context)
-            else:
-                await query.edit_message_text("❌ You don't have permission to access User Management!")
-            return
-        
-        if data == 'admin_payments':
-            if has_permission(user_id, 'view_payments'):
-                await admin_payments_menu(update, context)
-            else:
-                await query.edit_message_text("❌ You don't have permission to access Payment Methods!")
-            return
-        
-        if data == 'admin_stats':
-            if has_permission(user_id, 'view_stats'):
-                await show_stats(update, context)
-            else:
-                await query.edit_message_text("❌ You don't have permission to view Statistics!")
-            return
-        
-        if data == 'admin_settings':
-            if is_super_admin(user_id) or has_permission(user_id, 'manage_admins'):
-                await admin_settings_menu(update, context)
-            else:
-                await query.edit_message_text("❌ Only Super Admin can access this section!")
-            return
-        
-        if data == 'set_permissions_menu':
-            if is_super_admin(user_id):
-                await set_permissions_menu(update, context)
-            else:
-                await query.edit_message_text("❌ Only Super Admin can set permissions!")
-            return
-        
-        if data == 'view_permissions':
-            if is_super_admin(user_id):
-                await view_all_permissions(update, context)
-            else:
-                await query.edit_message_text("❌ Only Super Admin can view permissions!")
-            return
-        
-        # Stock management sub-menus
-        if data == 'addkey_3d_menu':
-            if has_permission(user_id, 'add_keys'):
-                await query.edit_message_text(
-                    "📝 **Add 3-Day Key**\n\nSend command: `/addkey_3d KEYVALUE`\n\nExample: `/addkey_3d ABC123`\n\n⚠️ Key will be saved EXACTLY as you type it (case sensitive).",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to add keys!")
-            return
-        
-        if data == 'addkey_10d_menu':
-            if has_permission(user_id, 'add_keys'):
-                await query.edit_message_text(
-                    "📝 **Add 10-Day Key**\n\nSend command: `/addkey_10d KEYVALUE`\n\nExample: `/addkey_10d XYZ789`\n\n⚠️ Key will be saved EXACTLY as you type it (case sensitive).",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to add keys!")
-            return
-        
-        if data == 'addkey_30d_menu':
-            if has_permission(user_id, 'add_keys'):
-                await query.edit_message_text(
-                    "📝 **Add 30-Day Key**\n\nSend command: `/addkey_30d KEYVALUE`\n\nExample: `/addkey_30d LMN456`\n\n⚠️ Key will be saved EXACTLY as you type it (case sensitive).",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to add keys!")
-            return
-        
-        if data == 'delkey_menu':
-            if has_permission(user_id, 'delete_keys'):
-                await query.edit_message_text(
-                    "🗑️ **Delete Key**\n\nSend command: `/delkey KEYVALUE`\n\nExample: `/delkey ABC123`\n\n⚠️ Key must match EXACTLY (case sensitive).",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to delete keys!")
-            return
-        
-        if data == 'view_stock':
-            if has_permission(user_id, 'view_stock'):
-                await show_stock(update, context)
-            else:
-                await query.edit_message_text("❌ You don't have permission to view stock!")
-            return
-        
-        # Price management sub-menus
-        if data == 'price_3d_menu':
-            if has_permission(user_id, 'change_prices'):
-                await query.edit_message_text(
-                    f"💰 **Change 3-Day Price**\n\nCurrent Price: ₹{PRODUCT_PRICES['3d']}\n\nSend command: `/price_3d NEW_PRICE`\n\nExample: `/price_3d 300`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to change prices!")
-            return
-        
-        if data == 'price_10d_menu':
-            if has_permission(user_id, 'change_prices'):
-                await query.edit_message_text(
-                    f"💰 **Change 10-Day Price**\n\nCurrent Price: ₹{PRODUCT_PRICES['10d']}\n\nSend command: `/price_10d NEW_PRICE`\n\nExample: `/price_10d 600`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to change prices!")
-            return
-        
-        if data == 'price_30d_menu':
-            if has_permission(user_id, 'change_prices'):
-                await query.edit_message_text(
-                    f"💰 **Change 30-Day Price**\n\nCurrent Price: ₹{PRODUCT_PRICES['30d']}\n\nSend command: `/price_30d NEW_PRICE`\n\nExample: `/price_30d 1300`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to change prices!")
-            return
-        
-        if data == 'view_prices':
-            if has_permission(user_id, 'view_payments'):
-                await view_prices(update, context)
-            else:
-                await query.edit_message_text("❌ You don't have permission to view prices!")
-            return
-        
-        # User management sub-menus
-        if data == 'block_user_menu':
-            if has_permission(user_id, 'block_users'):
-                await query.edit_message_text(
-                    "🚫 **Block User**\n\nSend command: `/block USER_ID REASON`\n\nExample: `/block 1234567 \"Spamming\"`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to block users!")
-            return
-        
-        if data == 'unblock_user_menu':
-            if has_permission(user_id, 'unblock_users'):
-                await query.edit_message_text(
-                    "✅ **Unblock User**\n\nSend command: `/unblock USER_ID`\n\nExample: `/unblock 1234567`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to unblock users!")
-            return
-        
-        if data == 'userinfo_menu':
-            if has_permission(user_id, 'view_user_info'):
-                await query.edit_message_text(
-                    "👤 **User Information**\n\nSend command: `/userinfo USER_ID`\n\nExample: `/userinfo 1234567`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to view user info!")
-            return
-        
-        if data == 'view_users':
-            if has_permission(user_id, 'view_users'):
-                await view_users(update, context)
-            else:
-                await query.edit_message_text("❌ You don't have permission to view users!")
-            return
-        
-        if data == 'manage_user_balance_menu':
-            if has_permission(user_id, 'adjust_balance'):
-                await query.edit_message_text(
-                    "💰 **Manage User Balance**\n\nSend command: `/adjustbalance USER_ID AMOUNT`\n\nExamples:\n• `/adjustbalance 1234567 +500` - Add ₹500\n• `/adjustbalance 1234567 -200` - Subtract ₹200",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to adjust balance!")
-            return
-        
-        # Payment methods sub-menus
-        if data == 'set_easypaisa_menu':
-            if has_permission(user_id, 'change_payments'):
-                await query.edit_message_text(
-                    "📱 **Set Easypaisa Details**\n\nSend command: `/seteasypaisa NUMBER \"ACCOUNT NAME\"`\n\nExample: `/seteasypaisa 03431178575 \"John Doe\"`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to change payment methods!")
-            return
-        
-        if data == 'set_jazzcash_menu':
-            if has_permission(user_id, 'change_payments'):
-                await query.edit_message_text(
-                    "📱 **Set JazzCash Details**\n\nSend command: `/setjazzcash NUMBER \"ACCOUNT NAME\"`\n\nExample: `/setjazzcash 03001234567 \"Ali Khan\"`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to change payment methods!")
-            return
-        
-        if data == 'set_binance_menu':
-            if has_permission(user_id, 'change_payments'):
-                await query.edit_message_text(
-                    "💰 **Set Binance Pay ID**\n\nSend command: `/setbinance PAY_ID`\n\nExample: `/setbinance 335277914`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to change payment methods!")
-            return
-        
-        if data == 'set_upi_menu':
-            if has_permission(user_id, 'change_payments'):
-                await query.edit_message_text(
-                    "💎 **Set UPI Details**\n\nSend command: `/setupi UPI_ID \"ACCOUNT NAME\"`\n\nExample: `/setupi user@upi \"Account Name\"`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to change payment methods!")
-            return
-        
-        if data == 'set_upi_qr_menu':
-            if has_permission(user_id, 'change_payments'):
-                await query.edit_message_text(
-                    "📸 **Set UPI QR Code**\n\nSend command: `/setupiqr` then send the QR code image.",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to change payment methods!")
-            return
-        
-        if data == 'set_binance_qr_menu':
-            if has_permission(user_id, 'change_payments'):
-                await query.edit_message_text(
-                    "📸 **Set Binance QR Code**\n\nSend command: `/setbinanceqr` then send the QR code image.",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ You don't have permission to change payment methods!")
-            return
-        
-        if data == 'view_payments':
-            if has_permission(user_id, 'view_payments'):
-                await view_payment_methods(update, context)
-            else:
-                await query.edit_message_text("❌ You don't have permission to view payment methods!")
-            return
-        
-        # Admin settings sub-menus
-        if data == 'addadmin_menu':
-            if is_super_admin(user_id):
-                await query.edit_message_text(
-                    "➕ **Add Admin**\n\nSend command: `/addadmin USER_ID`\n\nExample: `/addadmin 1234567`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ Only Super Admin can add admins!")
-            return
-        
-        if data == 'removeadmin_menu':
-            if is_super_admin(user_id):
-                await query.edit_message_text(
-                    "➖ **Remove Admin**\n\nSend command: `/removeadmin USER_ID`\n\nExample: `/removeadmin 1234567`",
-                    parse_mode='Markdown'
-                )
-            else:
-                await query.edit_message_text("❌ Only Super Admin can remove admins!")
-            return
-        
-        if data == 'listadmins':
-            if is_super_admin(user_id) or has_permission(user_id, 'manage_admins'):
-                await list_admins(update, context)
-            else:
-                await query.edit_message_text("❌ You don't have permission to list admins!")
-            return
-        
-        # Product selection
-        if data in ['product_3d', 'product_10d', 'product_30d']:
-            await handle_product_selection(update, context)
-            return
-        
-        # Add balance
-        if data == 'add_balance':
-            await handle_add_balance(update, context)
-            return
-        
-        # Payment method selection
-        if data.startswith('payment_'):
-            await handle_payment_selection(update, context)
-            return
-        
-        # Amount selection
-        if data.startswith('amount_'):
-            await handle_amount_selection(update, context)
-            return
-        
-        # Use balance
-        if data == 'use_balance':
-            await process_balance_purchase(update, context)
-            return
-        
-        # New payment
-        if data == 'new_payment':
-            await handle_new_payment(update, context)
-            return
-            
+        await handler(update, context)
+    
     except Exception as e:
         logger.error(f"Error in callback handler: {e}")
         await query.edit_message_text("❌ An error occurred. Please try again.")
@@ -1212,23 +2212,7 @@ async def admin_panel_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     
     stock_info = get_stock_info()
     
-    text = f"""🔧 **ADMIN PANEL** - **Control Center**
-
-📊 **Quick Stats:**
-• 3-Day Keys: {stock_info.get('3d', 0)} available
-• 10-Day Keys: {stock_info.get('10d', 0)} available
-• 30-Day Keys: {stock_info.get('30d', 0)} available
-
-🎛️ **Management Sections:**
-
-📦 **Stock Management** - Add/Delete/View keys
-💰 **Price Management** - Change product prices
-👤 **User Management** - Block/Unblock/View users
-💳 **Payment Methods** - Update payment details
-📊 **Statistics** - View bot analytics
-🔑 **Admin Settings** - Manage admins (Super Admin only)
-
-👇 **Select a section to manage:**"""
+    text = build_admin_panel_text(stock_info)
     
     reply_markup = get_admin_main_menu(admin_id)
     await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
@@ -1240,12 +2224,7 @@ async def start_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     user_id = query.from_user.id
     
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT balance, unique_id, is_blocked FROM users WHERE telegram_id = ?', (user_id,))
-    user_data = cursor.fetchone()
-    conn.close()
+    user_data = await db_fetchone('SELECT balance, unique_id, is_blocked FROM users WHERE telegram_id = ?', (user_id,))
     
     if user_data:
         balance, unique_id, is_blocked = user_data
@@ -1285,9 +2264,7 @@ async def admin_stock_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = f"""📦 **Stock Management**
 
 📊 **Current Stock:**
-• 3-Day Keys: {stock_info.get('3d', 0)} available - ₹{PRODUCT_PRICES['3d']}
-• 10-Day Keys: {stock_info.get('10d', 0)} available - ₹{PRODUCT_PRICES['10d']}
-• 30-Day Keys: {stock_info.get('30d', 0)} available - ₹{PRODUCT_PRICES['30d']}
+{stock_lines(stock_info, with_prices=True)}
 
 🔧 **Actions:**
 • **Add Keys** - Add new keys to stock
@@ -1317,9 +2294,7 @@ async def admin_prices_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = f"""💰 **Price Management**
 
 💵 **Current Prices:**
-• 3-Day Key: ₹{PRODUCT_PRICES['3d']}
-• 10-Day Key: ₹{PRODUCT_PRICES['10d']}
-• 30-Day Key: ₹{PRODUCT_PRICES['30d']}
+{price_lines()}
 
 🔧 **Actions:**
 • Change individual product prices
@@ -1345,16 +2320,8 @@ async def admin_users_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("❌ You don't have permission to access User Management!")
         return
     
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT COUNT(*) FROM users')
-    total_users = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(*) FROM users WHERE is_blocked = 1')
-    blocked_users = cursor.fetchone()[0]
-    
-    conn.close()
+    total_users, blocked_users = await db_fetchone('''SELECT COUNT(*), COALESCE(SUM(is_blocked = 1), 0) 
+                                                       FROM users''')
     
     text = f"""👤 **User Management**
 
@@ -1390,9 +2357,6 @@ async def admin_payments_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.edit_message_text("❌ You don't have permission to access Payment Methods!")
         return
     
-    # Update payment methods
-    update_payment_methods_global()
-    
     text = """💳 **Payment Methods Management**
 
 🔧 **Available Methods:**
@@ -1421,7 +2385,7 @@ async def admin_settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
         await query.edit_message_text("❌ Only Super Admin can access this section!")
         return
     
-    admins = get_all_admins()
+    admins = await run_db(get_all_admins)
     
     text = f"""🔑 **Admin Settings** (Super Admin Only)
 
@@ -1452,14 +2416,8 @@ async def set_permissions_menu(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.edit_message_text("❌ Only Super Admin can set permissions!")
         return
     
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''SELECT telegram_id, username FROM users 
-                      WHERE is_admin = 1 AND telegram_id != ?''', (SUPER_ADMIN_ID,))
-    
-    admins = cursor.fetchall()
-    conn.close()
+    admins = await db_fetchall('''SELECT telegram_id, username FROM users 
+                                  WHERE is_admin = 1 AND telegram_id != ?''', (SUPER_ADMIN_ID,))
     
     if not admins:
         text = "❌ No other admins found to set permissions!"
@@ -1490,16 +2448,11 @@ async def select_admin_for_permissions(update: Update, context: ContextTypes.DEF
     target_admin_id = int(data.replace('select_admin_', ''))
     
     # Get admin info
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT username FROM users WHERE telegram_id = ?', (target_admin_id,))
-    result = cursor.fetchone()
+    result = await db_fetchone('SELECT username FROM users WHERE telegram_id = ?', (target_admin_id,))
     username = result[0] if result else "No username"
-    conn.close()
     
     # Get current permissions
-    current_permissions = get_admin_permissions(target_admin_id)
+    current_permissions = await run_db(get_admin_permissions, target_admin_id)
     
     text = f"""⚙️ **Set Permissions for Admin**
 
@@ -1541,7 +2494,7 @@ async def toggle_permission(update: Update, context: ContextTypes.DEFAULT_TYPE):
     permission_key = '_'.join(parts[2:])
     
     # Get current permissions
-    current_permissions = get_admin_permissions(target_admin_id)
+    current_permissions = await run_db(get_admin_permissions, target_admin_id)
     
     # Toggle the permission
     current_permissions[permission_key] = not current_permissions.get(permission_key, False)
@@ -1551,13 +2504,8 @@ async def toggle_permission(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['target_admin_id'] = target_admin_id
     
     # Get admin info
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT username FROM users WHERE telegram_id = ?', (target_admin_id,))
-    result = cursor.fetchone()
+    result = await db_fetchone('SELECT username FROM users WHERE telegram_id = ?', (target_admin_id,))
     username = result[0] if result else "No username"
-    conn.close()
     
     text = f"""⚙️ **Set Permissions for Admin**
 
@@ -1599,24 +2547,19 @@ async def save_permissions(update: Update, context: ContextTypes.DEFAULT_TYPE):
     permissions = context.user_data['temp_permissions']
     
     # Save to database
-    update_admin_permissions(target_admin_id, permissions)
+    await run_db(update_admin_permissions, target_admin_id, permissions)
     
     # Clear temp data
     context.user_data.pop('temp_permissions', None)
     context.user_data.pop('target_admin_id', None)
     
     # Get admin info
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT username FROM users WHERE telegram_id = ?', (target_admin_id,))
-    result = cursor.fetchone()
+    result = await db_fetchone('SELECT username FROM users WHERE telegram_id = ?', (target_admin_id,))
     username = result[0] if result else "No username"
-    conn.close()
     
     # Log admin action
-    log_admin_action(query.from_user.id, 'set_permissions', target_admin_id, 
-                    f"Updated permissions for @{username}")
+    await run_db(log_admin_action, query.from_user.id, 'set_permissions', target_admin_id, 
+                 f"Updated permissions for @{username}")
     
     text = f"""✅ **Permissions Updated Successfully!**
 
@@ -1642,30 +2585,9 @@ async def view_all_permissions(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.edit_message_text("❌ Only Super Admin can view permissions!")
         return
     
-    admins = get_all_admins()
-    
-    text = "👑 **ADMIN PERMISSIONS OVERVIEW**\n\n"
+    admins = await run_db(get_all_admins)
     
-    for admin_telegram_id, username, is_admin_user in admins:
-        username_display = f"@{username}" if username else "No username"
-        status = "👑 Super Admin" if admin_telegram_id == SUPER_ADMIN_ID else "🔧 Admin"
-        
-        text += f"**{username_display}** ({admin_telegram_id}) - {status}\n"
-        
-        if admin_telegram_id != SUPER_ADMIN_ID:
-            enabled, disabled = get_admin_permissions_list(admin_telegram_id)
-            
-            if enabled:
-                text += "✅ **Enabled:**\n"
-                for perm in enabled:
-                    text += f"  • {perm}\n"
-            
-            if disabled:
-                text += "❌ **Disabled:**\n"
-                for perm in disabled:
-                    text += f"  • {perm}\n"
-        
-        text += "\n"
+    text = build_permissions_overview(admins)
     
     keyboard = [[InlineKeyboardButton("🔙 Back to Admin Settings", callback_data='admin_settings')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1678,43 +2600,31 @@ async def handle_product_selection(update: Update, context: ContextTypes.DEFAULT
     user_id = query.from_user.id
     data = query.data
     
-    products = get_products()
-    product = products[data]
+    product = get_products().get(data)
+    if product is None:
+        # Button from an old menu for a product that has since been removed
+        await query.edit_message_text("❌ This product is no longer available. Use /buy to see the current list.")
+        return
     context.user_data['selected_product'] = product
     context.user_data['product_id'] = data
     
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT balance FROM users WHERE telegram_id = ?', (user_id,))
-    result = cursor.fetchone()
+    result = await db_fetchone('SELECT balance FROM users WHERE telegram_id = ?', (user_id,))
     user_balance = result[0] if result else 0
-    conn.close()
     
     # Get stock for this specific product
     stock_info = get_stock_info()
-    key_type = '3d' if product['days'] == 3 else ('10d' if product['days'] == 10 else '30d')
+    key_type = product['key_type']
     available_stock = stock_info.get(key_type, 0)
     
     if available_stock == 0:
         try:
-            await query.edit_message_text(f"""❌ **Out of Stock!**
-
-{product['name']} is currently out of stock.
-
-📞 Contact @Aarifseller for availability.
-Or choose another product.""", parse_mode='Markdown')
+            await query.edit_message_text(OUT_OF_STOCK_TEMPLATE.render(product_name=product['name']), parse_mode='Markdown')
         except Exception as e:
             logger.error(f"Error editing message: {e}")
         return
     
     if user_balance >= product['price']:
-        keyboard = [
-            [
-                InlineKeyboardButton("💳 Use Balance", callback_data='use_balance'),
-                InlineKeyboardButton("💸 New Payment", callback_data='new_payment')
-            ],
-            [InlineKeyboardButton("❌ Cancel", callback_data='cancel')]
-        ]
+        reply_markup = get_balance_choice_menu()
         text = f"""🛒 **Product:** {product['name']}
 💰 **Price:** ₹{product['price']}
 📦 **Available:** {available_stock} keys
@@ -1728,9 +2638,8 @@ Or choose another product.""", parse_mode='Markdown')
 📦 **Available:** {available_stock} keys
 
 💸 **Please select payment method:**"""
-        keyboard = get_payment_methods_menu()
+        reply_markup = get_payment_methods_menu()
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
     try:
         await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
     except Exception as e:
@@ -1773,12 +2682,10 @@ async def handle_payment_selection(update: Update, context: ContextTypes.DEFAULT
     data = query.data
     payment_method = data.replace('payment_', '')
     
-    # Update payment methods
-    update_payment_methods_global()
-    
-    if payment_method in PAYMENT_METHODS:
+    payment_methods = get_payment_methods()
+    if payment_method in payment_methods:
         context.user_data['payment_method'] = payment_method
-        payment_info = PAYMENT_METHODS[payment_method]
+        payment_info = payment_methods[payment_method]
         
         # Set flag to await screenshot
         context.user_data['awaiting_screenshot'] = True
@@ -1787,81 +2694,16 @@ async def handle_payment_selection(update: Update, context: ContextTypes.DEFAULT
         if 'selected_product' in context.user_data:
             product = context.user_data.get('selected_product')
             amount = product['price']
-            purpose = "Product Purchase"
-            
-            text = f"""💳 **Payment Details:**
-
-🔸 **Product:** {product['name']}
-🔸 **Purpose:** {purpose}
-🔸 **Method:** {payment_info['name']}"""
-            
-            # Add exchange rate message for specific payment methods
-            if payment_method in EXCHANGE_RATES:
-                exchange_info = EXCHANGE_RATES[payment_method]
-                text += f"\n\n{exchange_info['message']}\n"
-            
-            if payment_method in ['easypaisa', 'jazzcash']:
-                account_text = f"\n🔸 **Account Name:** {payment_info.get('account_name', '')}" if payment_info.get('account_name') else ""
-                text += f"\n🔸 **Number:** `{payment_info['number']}`{account_text}"
-            elif payment_method == 'binance':
-                text += f"\n🔸 **Pay ID:** `{payment_info['pay_id']}`"
-            elif payment_method == 'upi':
-                account_text = f"\n🔸 **Account Name:** {payment_info.get('account_name', '')}" if payment_info.get('account_name') else ""
-                text += f"\n🔸 **UPI ID:** `{payment_info['number']}`{account_text}"
-            
-            text += f"\n🔸 **Amount:** ₹{amount}"
-            
-            # Add QR code info for UPI and Binance
-            if payment_method == 'upi' and payment_info.get('qr_code'):
-                text += f"\n\n📱 **UPI QR Code:** Available (Scan to pay)"
-            elif payment_method == 'binance' and payment_info.get('qr_code'):
-                text += f"\n\n💰 **Binance QR Code:** Available (Scan to pay)"
+            text = build_payment_details(payment_method, payment_info, amount, "Product Purchase", product['name'])
         
         # If adding balance
         elif 'amount' in context.user_data and context.user_data.get('is_adding_balance', False):
             amount = context.user_data.get('amount')
-            purpose = "Add Balance"
-            
-            text = f"""💳 **Payment Details:**
-
-🔸 **Purpose:** {purpose}
-🔸 **Method:** {payment_info['name']}"""
-            
-            # Add exchange rate message for specific payment methods
-            if payment_method in EXCHANGE_RATES:
-                exchange_info = EXCHANGE_RATES[payment_method]
-                text += f"\n\n{exchange_info['message']}\n"
-            
-            if payment_method in ['easypaisa', 'jazzcash']:
-                account_text = f"\n🔸 **Account Name:** {payment_info.get('account_name', '')}" if payment_info.get('account_name') else ""
-                text += f"\n🔸 **Number:** `{payment_info['number']}`{account_text}"
-            elif payment_method == 'binance':
-                text += f"\n🔸 **Pay ID:** `{payment_info['pay_id']}`"
-            elif payment_method == 'upi':
-                account_text = f"\n🔸 **Account Name:** {payment_info.get('account_name', '')}" if payment_info.get('account_name') else ""
-                text += f"\n🔸 **UPI ID:** `{payment_info['number']}`{account_text}"
-            
-            text += f"\n🔸 **Amount:** ₹{amount}"
-            
-            # Add QR code info for UPI and Binance
-            if payment_method == 'upi' and payment_info.get('qr_code'):
-                text += f"\n\n📱 **UPI QR Code:** Available (Scan to pay)"
-            elif payment_method == 'binance' and payment_info.get('qr_code'):
-                text += f"\n\n💰 **Binance QR Code:** Available (Scan to pay)"
+            text = build_payment_details(payment_method, payment_info, amount, "Add Balance")
         
-        text += f"""
-
-📋 **Instructions:**
-1. Send ₹{amount} to above {payment_info['name']} details
-2. Take a clear screenshot of successful payment
-3. Send the screenshot here
-
-⚠️ **Make sure screenshot shows:**
-• Transaction ID/Reference
-• Amount
-• Date & Time
-
-📸 **After payment, send the screenshot now.**"""
+        else:
+            await query.edit_message_text("❌ No product selected!")
+            return
         
         keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data='cancel')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1873,7 +2715,8 @@ async def handle_payment_selection(update: Update, context: ContextTypes.DEFAULT
                 
                 # Send QR code photo
                 try:
-                    await context.bot.send_photo(
+                    await OUTBOX.send(
+                        context.bot, 'send_photo', PRIORITY_CUSTOMER,
                         chat_id=query.message.chat_id,
                         photo=payment_info['qr_code'],
                         caption=f"📱 **{payment_info['name']} QR Code**\n\nScan this QR code to make payment of ₹{amount}"
@@ -1942,6 +2785,63 @@ async def handle_new_payment(update: Update, context: ContextTypes.DEFAULT_TYPE)
     except Exception as e:
         logger.error(f"Error editing message: {e}")
 
+def purchase_with_balance(user_id, product):
+    """Charge the user's balance and hand out a key for the product.
+    
+    Returns (status, details) where status is 'ok', 'no_user', 'insufficient' or 'out_of_stock'.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        begin_immediate(cursor)
+        
+        # Get user balance and info
+        cursor.execute('SELECT user_id, balance, unique_id FROM users WHERE telegram_id = ?', (user_id,))
+        user_data = cursor.fetchone()
+        
+        if not user_data:
+            return 'no_user', None
+        
+        user_db_id, user_balance, unique_id = user_data
+        
+        # Check if user has enough balance
+        if user_balance < product['price']:
+            return 'insufficient', {'balance': user_balance}
+        
+        # Claim a key for this product (removed from stock in the same transaction)
+        key_type = product['key_type']
+        key_data = claim_stock_key(cursor, key_type)
+        
+        if not key_data:
+            return 'out_of_stock', None
+        
+        key_id, key_value = key_data
+        
+        # Deduct balance
+        new_balance = user_balance - product['price']
+        cursor.execute('UPDATE users SET balance = ?, keys_count = keys_count + 1 WHERE user_id = ?',
+                       (new_balance, user_db_id))
+        
+        # Add to user_keys table
+        cursor.execute('''INSERT INTO user_keys (user_id, key_value, key_type) 
+                          VALUES (?, ?, ?)''',
+                       (user_db_id, key_value, key_type))
+        
+        # Create transaction record
+        cursor.execute('''INSERT INTO transactions 
+                          (user_id, amount, payment_method, status, admin_id, approved_at) 
+                          VALUES (?, ?, 'balance', 'approved', 0, CURRENT_TIMESTAMP)''',
+                       (user_db_id, product['price']))
+        record_sale(cursor, cursor.lastrowid, key_type)
+        
+        conn.commit()
+        adjust_stock_counter(key_type, -1)
+        
+        return 'ok', {'key_value': key_value, 'key_type': key_type, 'new_balance': new_balance}
+    finally:
+        conn.close()
+
 async def process_balance_purchase(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process purchase using balance - WITH ADMIN NOTIFICATION"""
     query = update.callback_query
@@ -1957,112 +2857,44 @@ async def process_balance_purchase(update: Update, context: ContextTypes.DEFAULT
     
     product = context.user_data.get('selected_product')
     
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
     try:
-        # Get user balance and info
-        cursor.execute('SELECT user_id, balance, unique_id FROM users WHERE telegram_id = ?', (user_id,))
-        user_data = cursor.fetchone()
+        status, details = await run_db(purchase_with_balance, user_id, product)
         
-        if not user_data:
+        if status == 'no_user':
             try:
                 await query.edit_message_text("❌ User not found!")
             except Exception as e:
                 logger.error(f"Error editing message: {e}")
-            conn.close()
             return
         
-        user_db_id, user_balance, unique_id = user_data
-        
-        # Check if user has enough balance
-        if user_balance < product['price']:
+        if status == 'insufficient':
             try:
                 await query.edit_message_text(f"""❌ **Insufficient Balance!**
 
 💰 **Price:** ₹{product['price']}
-💳 **Your Balance:** ₹{user_balance}
+💳 **Your Balance:** ₹{details['balance']}
 
 💸 Please add balance or use another payment method.""", parse_mode='Markdown')
             except Exception as e:
                 logger.error(f"Error editing message: {e}")
-            conn.close()
             return
         
-        # Get stock for this product
-        key_type = '3d' if product['days'] == 3 else ('10d' if product['days'] == 10 else '30d')
-        cursor.execute('''SELECT key_id, key_value FROM keys_stock 
-                          WHERE key_type = ? AND status = 'available' 
-                          LIMIT 1''', (key_type,))
-        
-        key_data = cursor.fetchone()
-        
-        if not key_data:
+        if status == 'out_of_stock':
             try:
-                await query.edit_message_text(f"""❌ **Out of Stock!**
-
-{product['name']} is currently out of stock.
-
-📞 Contact @Aarifseller for availability.
-Or choose another product.""")
+                await query.edit_message_text(OUT_OF_STOCK_TEMPLATE.render(product_name=product['name']))
             except Exception as e:
                 logger.error(f"Error editing message: {e}")
-            conn.close()
             return
         
-        key_id, key_value = key_data
-        
-        # Deduct balance
-        new_balance = user_balance - product['price']
-        cursor.execute('UPDATE users SET balance = ? WHERE user_id = ?',
-                       (new_balance, user_db_id))
-        
-        # Update key status to 'used' (but don't delete yet for logging)
-        cursor.execute('''UPDATE keys_stock 
-                          SET status = 'used', used_by = ?, used_at = CURRENT_TIMESTAMP
-                          WHERE key_id = ?''',
-                       (user_db_id, key_id))
-        
-        # Add to user_keys table
-        cursor.execute('''INSERT INTO user_keys (user_id, key_value, key_type) 
-                          VALUES (?, ?, ?)''',
-                       (user_db_id, key_value, key_type))
-        
-        # Create transaction record
-        cursor.execute('''INSERT INTO transactions 
-                          (user_id, amount, payment_method, status, admin_id) 
-                          VALUES (?, ?, 'balance', 'approved', 0)''',
-                       (user_db_id, product['price']))
-        
-        # ========== DELETE KEY FROM STOCK COMPLETELY ==========
-        cursor.execute('''DELETE FROM keys_stock 
-                          WHERE key_id = ?''', (key_id,))
-        
-        conn.commit()
+        key_value = details['key_value']
+        key_type = details['key_type']
+        new_balance = details['new_balance']
         
         # Send key to user
-        key_message = f"""✅ **Purchase Successful!**
-
-🎉 Congratulations! Your purchase is complete.
-
-📦 **Product:** {product['name']}
-💰 **Price:** ₹{product['price']}
-💳 **New Balance:** ₹{new_balance}
-🔑 **Your Key:** `{key_value}`
-
-📋 **Instructions:**
-1. Open Atoplay application
-2. Go to settings or activation section
-3. Enter the key: `{key_value}`
-4. Enjoy your {product['days']} days subscription!
-
-⚠️ **Important:**
-• This key is for ONE-TIME use only
-• Do not share with anyone
-• Key will expire after {product['days']} days
-
-📞 **Contact:** @Aarifseller for any issues.
-📢 **Join:** @SnakeEngine105"""
+        key_message = PURCHASE_SUCCESS_TEMPLATE.render(
+            product_name=product['name'], price=product['price'], new_balance=new_balance,
+            key_value=key_value, days=product['days']
+        )
         
         try:
             await query.edit_message_text(key_message, parse_mode='Markdown')
@@ -2070,7 +2902,8 @@ Or choose another product.""")
             logger.error(f"Error editing message: {e}")
         
         # ========== NOTIFY ALL ADMINS ABOUT KEY SALE ==========
-        await notify_admins_about_key_sale(
+        # Runs in the background so the buyer doesn't wait for admin messages
+        context.application.create_task(notify_admins_about_key_sale(
             context=context,
             user_id=user_id,
             username=username,
@@ -2079,22 +2912,20 @@ Or choose another product.""")
             key_type=key_type,
             amount=product['price'],
             payment_method="balance"
-        )
+        ))
         
         # Log the purchase
         logger.info(f"User {user_id} purchased {product['name']} with balance. Key: {key_value}")
         
         # Clear user data
         context.user_data.clear()
-        
+    
     except Exception as e:
         logger.error(f"Error in process_balance_purchase: {e}")
         try:
             await query.edit_message_text("❌ An error occurred during purchase. Please try again.")
         except:
             pass
-    finally:
-        conn.close()
 
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text messages for various purposes"""
@@ -2117,11 +2948,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                         return
             
             # Check if user is blocked
-            conn = sqlite3.connect('atoplay_bot.db')
-            cursor = conn.cursor()
-            cursor.execute('SELECT is_blocked FROM users WHERE telegram_id = ?', (user_id,))
-            user_data = cursor.fetchone()
-            conn.close()
+            user_data = await db_fetchone('SELECT is_blocked FROM users WHERE telegram_id = ?', (user_id,))
             
             if user_data and user_data[0] == 1 and text not in ["/start"]:
                 await update.message.reply_text("❌ You are blocked from using this bot!")
@@ -2188,6 +3015,54 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         logger.error(f"Error in handle_text_message: {e}")
 
 # ========== FIXED ADJUST BALANCE HANDLER ==========
+def adjust_user_balance(target_user_id, operation, amount, admin_id):
+    """Add or subtract balance for a user and record the adjustment.
+    
+    Returns (status, details) where status is 'ok', 'no_user' or 'insufficient'.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        # Check if user exists
+        cursor.execute('SELECT user_id, telegram_id, username, balance FROM users WHERE telegram_id = ?', (target_user_id,))
+        user_data = cursor.fetchone()
+        
+        if not user_data:
+            return 'no_user', None
+        
+        user_db_id, target_telegram_id, username, current_balance = user_data
+        
+        # Calculate new balance
+        if operation == 'add':
+            new_balance = current_balance + amount
+        else:  # subtract
+            if current_balance < amount:
+                return 'insufficient', {'current_balance': current_balance}
+            new_balance = current_balance - amount
+        
+        # Update user balance
+        cursor.execute('UPDATE users SET balance = ? WHERE user_id = ?',
+                       (new_balance, user_db_id))
+        
+        # Create transaction record
+        cursor.execute('''INSERT INTO transactions 
+                          (user_id, amount, payment_method, status, admin_id, approved_at) 
+                          VALUES (?, ?, 'admin_adjustment', 'approved', ?, CURRENT_TIMESTAMP)''',
+                       (user_db_id, amount if operation == 'add' else -amount, admin_id))
+        
+        # Log admin action
+        operation_text = "added" if operation == 'add' else "subtracted"
+        log_admin_action(admin_id, 'adjust_balance', user_db_id, 
+                         f"{operation_text} ₹{amount}. Old: ₹{current_balance}, New: ₹{new_balance}",
+                         cursor=cursor)
+        
+        conn.commit()
+    finally:
+        conn.close()
+    
+    return 'ok', {'username': username, 'current_balance': current_balance, 'new_balance': new_balance}
+
 async def adjust_balance_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle adjustbalance command - FIXED AND WORKING VERSION"""
     try:
@@ -2237,50 +3112,27 @@ async def adjust_balance_handler(update: Update, context: ContextTypes.DEFAULT_T
             await update.message.reply_text("❌ Amount must be greater than 0!")
             return
         
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        
-        # Check if user exists
-        cursor.execute('SELECT user_id, telegram_id, username, balance FROM users WHERE telegram_id = ?', (target_user_id,))
-        user_data = cursor.fetchone()
+        status, details = await run_db(adjust_user_balance, target_user_id, operation, amount, admin_id)
         
-        if not user_data:
+        if status == 'no_user':
             await update.message.reply_text(f"❌ User with ID {target_user_id} not found!")
-            conn.close()
             return
         
-        user_db_id, target_telegram_id, username, current_balance = user_data
+        if status == 'insufficient':
+            await update.message.reply_text(f"❌ User doesn't have enough balance! Current balance: ₹{details['current_balance']}")
+            return
+        
+        username = details['username']
+        current_balance = details['current_balance']
+        new_balance = details['new_balance']
         
-        # Calculate new balance
         if operation == 'add':
-            new_balance = current_balance + amount
             operation_text = "added"
             emoji = "➕"
         else:  # subtract
-            if current_balance < amount:
-                await update.message.reply_text(f"❌ User doesn't have enough balance! Current balance: ₹{current_balance}")
-                conn.close()
-                return
-            new_balance = current_balance - amount
             operation_text = "subtracted"
             emoji = "➖"
         
-        # Update user balance
-        cursor.execute('UPDATE users SET balance = ? WHERE user_id = ?',
-                       (new_balance, user_db_id))
-        
-        # Create transaction record
-        cursor.execute('''INSERT INTO transactions 
-                          (user_id, amount, payment_method, status, admin_id) 
-                          VALUES (?, ?, 'admin_adjustment', 'approved', ?)''',
-                       (user_db_id, amount if operation == 'add' else -amount, admin_id))
-        
-        conn.commit()
-        
-        # Log admin action
-        log_admin_action(admin_id, 'adjust_balance', user_db_id, 
-                        f"{operation_text} ₹{amount}. Old: ₹{current_balance}, New: ₹{new_balance}")
-        
         # Notify user if they haven't blocked the bot
         user_notified = False
         try:
@@ -2299,7 +3151,8 @@ Your account balance has been updated by admin.
 
 📞 **Contact:** @Aarifseller for any queries."""
             
-            await context.bot.send_message(
+            await OUTBOX.send(
+                context.bot, 'send_message', PRIORITY_CUSTOMER,
                 chat_id=target_user_id,
                 text=user_message,
                 parse_mode='Markdown'
@@ -2329,42 +3182,22 @@ Your account balance has been updated by admin.
         
         await update.message.reply_text(admin_message, parse_mode='Markdown')
         
-        conn.close()
         logger.info(f"Admin {admin_id} {operation_text} ₹{amount} for user {target_user_id}")
         
     except Exception as e:
         logger.error(f"Error in adjust_balance_handler: {e}")
         await update.message.reply_text(f"❌ An error occurred while adjusting balance: {str(e)}")
 
-async def approve_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Approve a payment transaction - WITH KEY DELIVERY AND ADMIN NOTIFICATION"""
+def approve_transaction(transaction_id, admin_id):
+    """Approve a pending transaction, assigning a key when it pays for a product.
+    
+    Returns (status, details) where status is 'ok', 'not_found', 'not_pending' or 'out_of_stock'.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
     try:
-        admin_id = update.effective_user.id
-        admin_username = update.effective_user.username or update.effective_user.first_name
-        
-        # Check if user is admin and has permission
-        if not is_admin(admin_id):
-            await update.message.reply_text("❌ Unauthorized! Only admins can approve payments.")
-            return
-        
-        if not has_permission(admin_id, 'approve_payments'):
-            await update.message.reply_text("❌ You don't have permission to approve payments!")
-            return
-        
-        # Get transaction ID from command
-        command_text = update.message.text
-        if not command_text.startswith('/approve_'):
-            await update.message.reply_text("❌ Invalid command format!")
-            return
-        
-        try:
-            transaction_id = int(command_text.replace('/approve_', '').strip())
-        except ValueError:
-            await update.message.reply_text("❌ Invalid transaction ID!")
-            return
-        
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
+        begin_immediate(cursor)
         
         # Get transaction details
         cursor.execute('''SELECT t.transaction_id, t.user_id, t.amount, t.status, 
@@ -2377,62 +3210,36 @@ async def approve_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         transaction_data = cursor.fetchone()
         
         if not transaction_data:
-            await update.message.reply_text(f"❌ Transaction #{transaction_id} not found!")
-            conn.close()
-            return
+            return 'not_found', None
         
         (trans_id, user_db_id, amount, status, user_telegram_id, 
          username, user_balance, unique_id, payment_method) = transaction_data
         
         if status != 'pending':
-            await update.message.reply_text(f"❌ Transaction #{transaction_id} is already {status}!")
-            conn.close()
-            return
+            return 'not_pending', {'status': status}
         
         # Determine product type from amount
-        product_name = ""
-        key_type = ""
-        if amount == PRODUCT_PRICES['3d']:
-            product_name = "3-Day Key"
-            key_type = '3d'
-        elif amount == PRODUCT_PRICES['10d']:
-            product_name = "10-Day Key"
-            key_type = '10d'
-        elif amount == PRODUCT_PRICES['30d']:
-            product_name = "30-Day Key"
-            key_type = '30d'
-        else:
-            # For balance addition, no key needed
-            product_name = "Balance Addition"
+        product_name, key_type = product_for_amount(amount)
         
         # If this is for a product purchase (not balance addition), get a key
         key_value = None
         if product_name != "Balance Addition":
-            # Get a key from stock
-            cursor.execute('''SELECT key_id, key_value FROM keys_stock 
-                              WHERE key_type = ? AND status = 'available' 
-                              LIMIT 1''', (key_type,))
-            
-            key_data = cursor.fetchone()
+            # Claim a key from stock
+            key_data = claim_stock_key(cursor, key_type)
             
             if not key_data:
-                await update.message.reply_text(f"❌ No {key_type}-day keys available in stock!")
-                conn.close()
-                return
+                return 'out_of_stock', {'key_type': key_type}
             
             key_id, key_value = key_data
-            
-            # Update key status to 'used' and mark as used
-            cursor.execute('''UPDATE keys_stock 
-                              SET status = 'used', used_by = ?, used_at = CURRENT_TIMESTAMP
-                              WHERE key_id = ?''',
-                           (user_db_id, key_id))
         
-        # Update transaction status
+        # Update transaction status (only if still pending)
         cursor.execute('''UPDATE transactions 
-                          SET status = 'approved', admin_id = ?
-                          WHERE transaction_id = ?''',
+                          SET status = 'approved', admin_id = ?, approved_at = CURRENT_TIMESTAMP
+                          WHERE status = 'pending' AND transaction_id = ?''',
                        (admin_id, transaction_id))
+        if cursor.rowcount != 1:
+            conn.rollback()
+            return 'not_pending', {'status': 'processed'}
         
         # Update user balance
         new_balance = user_balance + amount
@@ -2444,86 +3251,134 @@ async def approve_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
             cursor.execute('''INSERT INTO user_keys (user_id, key_value, key_type) 
                               VALUES (?, ?, ?)''',
                            (user_db_id, key_value, key_type))
-            
-            # ========== DELETE KEY FROM STOCK COMPLETELY ==========
-            cursor.execute('''DELETE FROM keys_stock 
-                              WHERE key_id = ?''', (key_id,))
+            cursor.execute('UPDATE users SET keys_count = keys_count + 1 WHERE user_id = ?', (user_db_id,))
         
-        conn.commit()
+        record_sale(cursor, transaction_id, key_type)
         
         # Log admin action
-        log_admin_action(admin_id, 'approve_payment', user_db_id, f"Transaction #{transaction_id} - ₹{amount}")
+        log_admin_action(admin_id, 'approve_payment', user_db_id, f"Transaction #{transaction_id} - ₹{amount}",
+                         cursor=cursor)
         
-        # Send notification to user
-        try:
-            if key_value:
-                # Product purchase - send key
-                days = 3 if key_type == '3d' else (10 if key_type == '10d' else 30)
-                user_message = f"""✅ **Payment Approved!**
-
-🎉 Congratulations! Your payment has been approved.
-
-📋 **Transaction Details:**
-• **Transaction ID:** #{transaction_id}
-• **Product:** {product_name}
-• **Amount:** ₹{amount}
-• **Status:** ✅ Approved
-• **Approved by:** Admin
-
-💰 **Your New Balance:** ₹{new_balance}
-
-🔑 **Your Key:** `{key_value}`
-
-📋 **Instructions:**
-1. Open Atoplay application
-2. Go to settings or activation section
-3. Enter the key: `{key_value}`
-4. Enjoy your {days} days subscription!
-
-📞 **Contact:** @Aarifseller for any queries."""
-            else:
-                # Balance addition
-                user_message = f"""✅ **Payment Approved!**
-
-🎉 Congratulations! Your payment has been approved.
-
-📋 **Transaction Details:**
-• **Transaction ID:** #{transaction_id}
-• **Amount:** ₹{amount}
-• **Status:** ✅ Approved
-• **Approved by:** Admin
-
-💰 **Your New Balance:** ₹{new_balance}
-
-💸 You can now use your balance to purchase keys!
-Use /buy to get started.
+        conn.commit()
+    finally:
+        conn.close()
+    
+    if key_value:
+        adjust_stock_counter(key_type, -1)
+    
+    return 'ok', {
+        'user_telegram_id': user_telegram_id,
+        'username': username,
+        'amount': amount,
+        'product_name': product_name,
+        'key_type': key_type,
+        'key_value': key_value,
+        'user_balance': user_balance,
+        'new_balance': new_balance,
+        'payment_method': payment_method
+    }
 
-📞 **Contact:** @Aarifseller for any queries."""
-            
-            await context.bot.send_message(
-                chat_id=user_telegram_id,
-                text=user_message,
-                parse_mode='Markdown'
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify user {user_telegram_id}: {e}")
+async def approve_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Approve a payment transaction - WITH KEY DELIVERY AND ADMIN NOTIFICATION"""
+    try:
+        admin_id = update.effective_user.id
+        admin_username = update.effective_user.username or update.effective_user.first_name
         
-        # ========== NOTIFY ALL ADMINS ABOUT KEY SALE (if it was a product purchase) ==========
-        if key_value:
-            await notify_admins_about_key_sale(
-                context=context,
-                user_id=user_telegram_id,
-                username=username,
-                product_name=product_name,
-                key_value=key_value,
-                key_type=key_type,
-                amount=amount,
-                payment_method=payment_method if payment_method else "manual_approval"
-            )
+        # Check if user is admin and has permission
+        if not is_admin(admin_id):
+            await update.message.reply_text("❌ Unauthorized! Only admins can approve payments.")
+            return
+        
+        if not has_permission(admin_id, 'approve_payments'):
+            await update.message.reply_text("❌ You don't have permission to approve payments!")
+            return
+        
+        # Get transaction ID from command
+        command_text = update.message.text
+        if not command_text.startswith('/approve_'):
+            await update.message.reply_text("❌ Invalid command format!")
+            return
+        
+        try:
+            transaction_id = int(command_text.replace('/approve_', '').strip())
+        except ValueError:
+            await update.message.reply_text("❌ Invalid transaction ID!")
+            return
+        
+        await complete_approval(context, admin_id, transaction_id, update.message.reply_text)
+        
+    except Exception as e:
+        logger.error(f"Error in approve_payment: {e}")
+
+def build_approval_message(transaction_id, details):
+    """Message telling the customer their payment was approved (with the key for a purchase)"""
+    if details['key_value']:
+        # Product purchase - send key
+        days = product_days(details['key_type'])
+        return APPROVED_KEY_TEMPLATE.render(
+            transaction_id=transaction_id, product_name=details['product_name'], amount=details['amount'],
+            new_balance=details['new_balance'], key_value=details['key_value'], days=days
+        )
+    # Balance addition
+    return APPROVED_BALANCE_TEMPLATE.render(transaction_id=transaction_id, amount=details['amount'],
+                                           new_balance=details['new_balance'])
+
+async def complete_approval(context, admin_id, transaction_id, reply):
+    """Approve a transaction, deliver the key and notify admins - reply(text, **kwargs) answers the approver"""
+    status, details = await run_db(approve_transaction, transaction_id, admin_id)
+    
+    if status == 'not_found':
+        await reply(f"❌ Transaction #{transaction_id} not found!")
+        return
+    
+    if status == 'not_pending':
+        await reply(f"❌ Transaction #{transaction_id} is already {details['status']}!")
+        return
+    
+    if status == 'out_of_stock':
+        await reply(f"❌ No {details['key_type']}-day keys available in stock!")
+        return
+    
+    user_telegram_id = details['user_telegram_id']
+    username = details['username']
+    amount = details['amount']
+    product_name = details['product_name']
+    key_type = details['key_type']
+    key_value = details['key_value']
+    user_balance = details['user_balance']
+    new_balance = details['new_balance']
+    payment_method = details['payment_method']
+    
+    # Send notification to user
+    try:
+        user_message = build_approval_message(transaction_id, details)
         
-        # Send confirmation to admin
-        if key_value:
-            admin_message = f"""✅ **Payment Approved Successfully!**
+        await OUTBOX.send(
+            context.bot, 'send_message', PRIORITY_CUSTOMER,
+            chat_id=user_telegram_id,
+            text=user_message,
+            parse_mode='Markdown'
+        )
+    except Exception as e:
+        logger.error(f"Failed to notify user {user_telegram_id}: {e}")
+    
+    # ========== NOTIFY ALL ADMINS ABOUT KEY SALE (if it was a product purchase) ==========
+    # Runs in the background so the approval reply isn't held up
+    if key_value:
+        context.application.create_task(notify_admins_about_key_sale(
+            context=context,
+            user_id=user_telegram_id,
+            username=username,
+            product_name=product_name,
+            key_value=key_value,
+            key_type=key_type,
+            amount=amount,
+            payment_method=payment_method if payment_method else "manual_approval"
+        ))
+    
+    # Send confirmation to admin
+    if key_value:
+        admin_message = f"""✅ **Payment Approved Successfully!**
 
 📋 **Transaction Details:**
 • **Transaction ID:** #{transaction_id}
@@ -2537,8 +3392,8 @@ Use /buy to get started.
 
 ✅ User has been notified with key.
 ✅ Key has been removed from stock."""
-        else:
-            admin_message = f"""✅ **Payment Approved Successfully!**
+    else:
+        admin_message = f"""✅ **Payment Approved Successfully!**
 
 📋 **Transaction Details:**
 • **Transaction ID:** #{transaction_id}
@@ -2549,14 +3404,27 @@ Use /buy to get started.
 • **New Balance:** ₹{new_balance}
 
 ✅ User has been notified."""
-        
-        await update.message.reply_text(admin_message, parse_mode='Markdown')
-        
-        conn.close()
-        logger.info(f"Transaction #{transaction_id} approved by admin {admin_id}")
-        
-    except Exception as e:
-        logger.error(f"Error in approve_payment: {e}")
+    
+    await reply(admin_message, parse_mode='Markdown')
+    
+    logger.info(f"Transaction #{transaction_id} approved by admin {admin_id}")
+
+
+async def distribute_payment_screenshot(bot, transaction_id, file_id, caption):
+    """Send a payment screenshot with its details to every approver - one send_photo each, concurrently"""
+    approvers = await run_db(get_admins_with_permission, 'approve_payments')
+    
+    results = await send_to_chats(bot, approvers, method='send_photo', photo=file_id, caption=caption)
+    
+    for admin_id, delivered, latency_ms, error in results:
+        if delivered:
+            logger.info(f"Screenshot forwarded to admin: {admin_id} ({latency_ms:.0f} ms)")
+        else:
+            logger.error(f"Failed to forward to admin {admin_id}: {error} ({latency_ms:.0f} ms)")
+    
+    delivered_count = sum(1 for result in results if result[1])
+    logger.info(f"Transaction #{transaction_id} screenshot delivered to {delivered_count}/{len(results)} approvers")
+    return results
 
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle photo messages (payment screenshots)"""
@@ -2569,48 +3437,36 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         logger.info(f"Photo received from user: {user_id}")
         
-        # Check if user is blocked
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_blocked FROM users WHERE telegram_id = ?', (user_id,))
-        user_data = cursor.fetchone()
+        # Check if user is blocked and get user info
+        user_data = await db_fetchone('SELECT is_blocked, user_id, unique_id FROM users WHERE telegram_id = ?', (user_id,))
         
         if user_data and user_data[0] == 1:
             await update.message.reply_text("❌ You are blocked from using this bot!")
-            conn.close()
             return
         
         # Check if this is for QR code setup
         if context.user_data.get('awaiting_upi_qr_code'):
             await handle_upi_qr_code_setup(update, context)
-            conn.close()
             return
         
         if context.user_data.get('awaiting_binance_qr_code'):
             await handle_binance_qr_code_setup(update, context)
-            conn.close()
             return
         
         # Check if we're expecting a screenshot
         if 'awaiting_screenshot' not in context.user_data or not context.user_data['awaiting_screenshot']:
             await update.message.reply_text("⚠️ I'm not expecting a screenshot right now. Please use /buy to start a purchase.")
-            conn.close()
             return
         
         # Get the photo (largest size)
         photo = update.message.photo[-1]
         file_id = photo.file_id
         
-        # Get user info
-        cursor.execute('SELECT user_id, unique_id FROM users WHERE telegram_id = ?', (user_id,))
-        user_data = cursor.fetchone()
-        
         if not user_data:
             await update.message.reply_text("❌ User not found! Please use /start first.")
-            conn.close()
             return
         
-        user_db_id, unique_id = user_data
+        _, user_db_id, unique_id = user_data
         
         # Determine payment purpose and amount
         purpose = "Product Purchase" if 'selected_product' in context.user_data else "Add Balance"
@@ -2627,17 +3483,13 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             product_name = "Unknown"
         
         payment_method = context.user_data.get('payment_method', 'unknown')
-        payment_method_name = PAYMENT_METHODS.get(payment_method, {}).get('name', 'Unknown')
+        payment_method_name = get_payment_methods().get(payment_method, {}).get('name', 'Unknown')
         
         # Save transaction to database
-        cursor.execute('''INSERT INTO transactions 
-                          (user_id, amount, payment_method, screenshot, status) 
-                          VALUES (?, ?, ?, ?, 'pending')''',
-                       (user_db_id, amount, payment_method, file_id))
-        conn.commit()
-        transaction_id = cursor.lastrowid
-        
-        conn.close()
+        transaction_id = await db_execute('''INSERT INTO transactions 
+                                             (user_id, amount, payment_method, screenshot, status) 
+                                             VALUES (?, ?, ?, ?, 'pending')''',
+                                          (user_db_id, amount, payment_method, file_id))
         
         # Send confirmation to user
         await update.message.reply_text(
@@ -2672,26 +3524,10 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /approve_{transaction_id} - Approve payment
 /reject_{transaction_id} - Reject payment"""
         
-        # Forward to all admins with permission
-        admins = get_all_admins()
-        for admin_id, admin_name, _ in admins:
-            if has_permission(admin_id, 'approve_payments'):
-                try:
-                    # Forward the photo
-                    await context.bot.forward_message(
-                        chat_id=admin_id,
-                        from_chat_id=user_id,
-                        message_id=update.message.message_id
-                    )
-                    
-                    # Send details
-                    await context.bot.send_message(
-                        chat_id=admin_id,
-                        text=caption
-                    )
-                    logger.info(f"Screenshot forwarded to admin: {admin_id}")
-                except Exception as e:
-                    logger.error(f"Failed to forward to admin {admin_id}: {e}")
+        # Send to all admins with permission (in the background)
+        context.application.create_task(
+            distribute_payment_screenshot(context.bot, transaction_id, file_id, caption)
+        )
         
         # Clear user data
         context.user_data.clear()
@@ -2727,49 +3563,83 @@ async def reject_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Invalid transaction ID!")
             return
         
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        
-        # Get transaction details
-        cursor.execute('''SELECT t.transaction_id, t.user_id, t.amount, t.status, 
-                                 u.telegram_id, u.username
-                          FROM transactions t
-                          JOIN users u ON t.user_id = u.user_id
-                          WHERE t.transaction_id = ?''', (transaction_id,))
-        
-        transaction_data = cursor.fetchone()
-        
-        if not transaction_data:
-            await update.message.reply_text(f"❌ Transaction #{transaction_id} not found!")
-            conn.close()
-            return
-        
-        (trans_id, user_db_id, amount, status, user_telegram_id, username) = transaction_data
-        
-        if status != 'pending':
-            await update.message.reply_text(f"❌ Transaction #{transaction_id} is already {status}!")
-            conn.close()
-            return
-        
-        # Ask for reason
-        context.user_data['awaiting_reject_reason'] = True
-        context.user_data['reject_transaction_id'] = transaction_id
-        context.user_data['reject_user_id'] = user_telegram_id
-        context.user_data['reject_amount'] = amount
+        await start_rejection(context, transaction_id, update.message.reply_text)
         
-        await update.message.reply_text(
-            f"""❌ **Reject Payment #{transaction_id}**
+    except Exception as e:
+        logger.error(f"Error in reject_payment: {e}")
+
+async def start_rejection(context, transaction_id, reply):
+    """Check the transaction is pending and ask the admin for a rejection reason"""
+    # Get transaction details
+    transaction_data = await db_fetchone('''SELECT t.transaction_id, t.user_id, t.amount, t.status, 
+                                                   u.telegram_id, u.username
+                                            FROM transactions t
+                                            JOIN users u ON t.user_id = u.user_id
+                                            WHERE t.transaction_id = ?''', (transaction_id,))
+    
+    if not transaction_data:
+        await reply(f"❌ Transaction #{transaction_id} not found!")
+        return
+    
+    (trans_id, user_db_id, amount, status, user_telegram_id, username) = transaction_data
+    
+    if status != 'pending':
+        await reply(f"❌ Transaction #{transaction_id} is already {status}!")
+        return
+    
+    # Ask for reason
+    context.user_data['awaiting_reject_reason'] = True
+    context.user_data['reject_transaction_id'] = transaction_id
+    context.user_data['reject_user_id'] = user_telegram_id
+    context.user_data['reject_amount'] = amount
+    
+    await reply(
+        f"""❌ **Reject Payment #{transaction_id}**
 
 **User:** @{username}
 **Amount:** ₹{amount}
 
 Please provide reason for rejection:"""
-        )
+    )
+
+def build_rejection_message(transaction_id, amount, reason):
+    """Message telling the customer their payment was rejected"""
+    return f"""❌ **Payment Rejected!**
+
+📋 **Transaction Details:**
+• **Transaction ID:** #{transaction_id}
+• **Amount:** ₹{amount}
+• **Status:** ❌ Rejected
+• **Reason:** {reason}
+
+⚠️ If you believe this is a mistake, please contact @Aarifseller with your payment proof.
+
+📞 **Contact:** @Aarifseller for assistance."""
+
+def reject_transaction(transaction_id, admin_id, user_telegram_id, amount, reason):
+    """Mark a pending transaction rejected - returns False if it was already processed"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''UPDATE transactions 
+                          SET status = 'rejected', admin_id = ?
+                          WHERE status = 'pending' AND transaction_id = ?''',
+                       (admin_id, transaction_id))
+        if cursor.rowcount != 1:
+            return False
         
-        conn.close()
+        # Log admin action
+        cursor.execute('SELECT user_id FROM users WHERE telegram_id = ?', (user_telegram_id,))
+        user_data = cursor.fetchone()
+        if user_data:
+            log_admin_action(admin_id, 'reject_payment', user_data[0],
+                             f"Transaction #{transaction_id} - ₹{amount} - Reason: {reason}", cursor=cursor)
         
-    except Exception as e:
-        logger.error(f"Error in reject_payment: {e}")
+        conn.commit()
+    finally:
+        conn.close()
+    return True
 
 async def handle_reject_reason(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle rejection reason"""
@@ -2790,65 +3660,550 @@ async def handle_reject_reason(update: Update, context: ContextTypes.DEFAULT_TYP
         user_telegram_id = context.user_data.get('reject_user_id')
         amount = context.user_data.get('reject_amount')
         
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        
-        # Update transaction status
-        cursor.execute('''UPDATE transactions 
-                          SET status = 'rejected', admin_id = ?
-                          WHERE transaction_id = ?''',
-                       (admin_id, transaction_id))
-        
-        conn.commit()
-        
-        # Log admin action
-        cursor.execute('SELECT user_id FROM users WHERE telegram_id = ?', (user_telegram_id,))
-        user_data = cursor.fetchone()
-        if user_data:
-            log_admin_action(admin_id, 'reject_payment', user_data[0], 
-                            f"Transaction #{transaction_id} - ₹{amount} - Reason: {reason}")
+        # Update transaction status (only if nobody processed it meanwhile)
+        rejected = await run_db(reject_transaction, transaction_id, admin_id, user_telegram_id, amount, reason)
+        if not rejected:
+            context.user_data.clear()
+            await update.message.reply_text(f"❌ Transaction #{transaction_id} was already processed!")
+            return
         
         # Send notification to user
         try:
-            await context.bot.send_message(
+            await OUTBOX.send(
+                context.bot, 'send_message', PRIORITY_CUSTOMER,
                 chat_id=user_telegram_id,
-                text=f"""❌ **Payment Rejected!**
+                text=build_rejection_message(transaction_id, amount, reason)
+            )
+        except Exception as e:
+            logger.error(f"Failed to notify user {user_telegram_id}: {e}")
+        
+        # Clear user data
+        context.user_data.clear()
+        
+        # Send confirmation to admin
+        await update.message.reply_text(
+            f"""✅ **Payment Rejected Successfully!**
 
 📋 **Transaction Details:**
 • **Transaction ID:** #{transaction_id}
 • **Amount:** ₹{amount}
-• **Status:** ❌ Rejected
 • **Reason:** {reason}
 
-⚠️ If you believe this is a mistake, please contact @Aarifseller with your payment proof.
+✅ User has been notified."""
+        )
+        
+        logger.info(f"Transaction #{transaction_id} rejected by admin {admin_id}")
+        
+    except Exception as e:
+        logger.error(f"Error in handle_reject_reason: {e}")
+
+# ========== EXISTING FUNCTIONS ==========
+# ========== PENDING PAYMENTS INBOX ==========
+PENDING_PAGE_SELECT = '''SELECT t.transaction_id, t.amount, t.payment_method, u.telegram_id, u.username,
+                                CAST((julianday('now') - julianday(t.created_at)) * 86400 AS INTEGER)
+                         FROM transactions t
+                         JOIN users u ON t.user_id = u.user_id
+                         WHERE t.status = 'pending' '''
+PENDING_PAGE_SQL = PENDING_PAGE_SELECT + 'ORDER BY t.created_at, t.transaction_id LIMIT ?'
+PENDING_PAGE_AFTER_SQL = PENDING_PAGE_SELECT + '''AND (t.created_at, t.transaction_id) > 
+                                                  (SELECT created_at, transaction_id FROM transactions WHERE transaction_id = ?) 
+                                              ORDER BY t.created_at, t.transaction_id LIMIT ?'''
+
+def get_pending_page(after_transaction_id=None, limit=PENDING_PAGE_SIZE):
+    """Oldest-first page of pending transactions, continuing after after_transaction_id.
+    
+    Keyset pagination on (created_at, transaction_id) - served by idx_transactions_status_created.
+    Returns (rows, has_more); rows are (transaction_id, amount, payment_method, telegram_id, username, age_seconds).
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if after_transaction_id is None:
+        cursor.execute(PENDING_PAGE_SQL, (limit + 1,))
+    else:
+        cursor.execute(PENDING_PAGE_AFTER_SQL, (after_transaction_id, limit + 1))
+    rows = cursor.fetchall()
+    conn.close()
+    
+    return rows[:limit], len(rows) > limit
+
+def get_pending_queue_stats():
+    """Queue length and age percentiles (seconds) of pending transactions"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # Newest first, so ages come out ascending (covering index scan)
+    cursor.execute('''SELECT CAST((julianday('now') - julianday(created_at)) * 86400 AS INTEGER)
+                      FROM transactions 
+                      WHERE status = 'pending' 
+                      ORDER BY created_at DESC''')
+    ages = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    
+    stats = {'count': len(ages)}
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+        # Nearest-rank percentile
+        stats[name] = ages[max(0, math.ceil(len(ages) * fraction) - 1)] if ages else 0
+    stats['max'] = ages[-1] if ages else 0
+    return stats
+
+def format_age(seconds):
+    """Compact age like 45s, 12m, 3h 5m, 2d 4h"""
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m"
+    if seconds < 86400:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    return f"{seconds // 86400}d {seconds % 86400 // 3600}h"
+
+async def show_pending_inbox(update: Update, context: ContextTypes.DEFAULT_TYPE, after_transaction_id=None):
+    """Pending payments with inline approve/reject buttons"""
+    (rows, has_more), stats = await asyncio.gather(
+        run_db(get_pending_page, after_transaction_id),
+        run_db(get_pending_queue_stats)
+    )
+    
+    text = f"""📥 **PENDING PAYMENTS**
+
+📊 **Queue:** {stats['count']} pending
+⏱️ **Waiting:** p50 {format_age(stats['p50'])} • p90 {format_age(stats['p90'])} • p99 {format_age(stats['p99'])} • oldest {format_age(stats['max'])}
+
+"""
+    
+    keyboard = []
+    if not rows:
+        text += "✅ No pending payments!" if after_transaction_id is None else "✅ No more pending payments."
+    
+    payment_methods = get_payment_methods()
+    for transaction_id, amount, payment_method, user_telegram_id, username, age in rows:
+        username_display = f"@{username}" if username else str(user_telegram_id)
+        method_name = payment_methods.get(payment_method, {}).get('name', payment_method or 'Unknown')
+        text += f"**#{transaction_id}** • {username_display} • ₹{amount} • {method_name} • {format_age(age)} ago\n"
+        keyboard.append([
+            InlineKeyboardButton(f"✅ Approve #{transaction_id}", callback_data=f'inbox_approve_{transaction_id}'),
+            InlineKeyboardButton(f"❌ Reject #{transaction_id}", callback_data=f'inbox_reject_{transaction_id}')
+        ])
+    
+    bulk_data = 'inbox_bulk_' + '.'.join(str(row[0]) for row in rows)
+    if len(rows) > 1 and len(bulk_data) <= 64:
+        keyboard.append([InlineKeyboardButton(f"✅ Approve all {len(rows)} on this page", callback_data=bulk_data)])
+    
+    navigation = [InlineKeyboardButton("🔄 Refresh", callback_data='approval_inbox')]
+    if has_more:
+        navigation.append(InlineKeyboardButton("Next ▶️", callback_data=f'inbox_after_{rows[-1][0]}'))
+    keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("🔙 Back to Admin Panel", callback_data='admin_back')])
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+    else:
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def pending_inbox_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inbox first page, or the page after inbox_after_<transaction_id>"""
+    data = update.callback_query.data
+    after_transaction_id = int(data.replace('inbox_after_', '')) if data.startswith('inbox_after_') else None
+    await show_pending_inbox(update, context, after_transaction_id)
+
+async def pending_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/pending - open the pending payments inbox"""
+    admin_id = update.effective_user.id
+    if not has_permission(admin_id, 'approve_payments'):
+        await update.message.reply_text("❌ You don't have permission to approve payments!")
+        return
+    await show_pending_inbox(update, context)
+
+async def inbox_approve_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Approve button in the inbox - result goes out as a new message"""
+    query = update.callback_query
+    transaction_id = int(query.data.replace('inbox_approve_', ''))
+    await complete_approval(context, query.from_user.id, transaction_id, query.message.reply_text)
+
+async def inbox_reject_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Reject button in the inbox - asks for the reason like /reject_<id>"""
+    query = update.callback_query
+    transaction_id = int(query.data.replace('inbox_reject_', ''))
+    await start_rejection(context, transaction_id, query.message.reply_text)
+
+# ========== BULK APPROVE / REJECT ==========
+def approve_transactions_bulk(transaction_ids, admin_id):
+    """Approve several pending transactions in one DB transaction.
+    
+    Keys are claimed once per key type for the whole batch. Returns [(transaction_id, status, details)]
+    in ascending id order, with the same statuses and details as approve_transaction().
+    """
+    transaction_ids = sorted(set(transaction_ids))
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        begin_immediate(cursor)
+        
+        placeholders = ','.join('?' * len(transaction_ids))
+        cursor.execute(f'''SELECT t.transaction_id, t.user_id, t.amount, t.status, 
+                                  u.telegram_id, u.username, u.balance, t.payment_method
+                           FROM transactions t
+                           JOIN users u ON t.user_id = u.user_id
+                           WHERE t.transaction_id IN ({placeholders})''', transaction_ids)
+        found = {row[0]: row for row in cursor.fetchall()}
+        
+        # Claim every key the batch needs - one statement per key type
+        wanted = {}
+        for row in found.values():
+            key_type = product_for_amount(row[2])[1]
+            if row[3] == 'pending' and key_type:
+                wanted[key_type] = wanted.get(key_type, 0) + 1
+        claimed = {key_type: iter(claim_stock_keys(cursor, key_type, count)) for key_type, count in wanted.items()}
+        
+        results = []
+        balances = {}  # user_id -> balance after this batch
+        approved = []
+        sales = []
+        new_user_keys = []
+        keys_sold = {}
+        
+        for transaction_id in transaction_ids:
+            row = found.get(transaction_id)
+            if not row:
+                results.append((transaction_id, 'not_found', None))
+                continue
+            
+            (_, user_db_id, amount, status, user_telegram_id, username, user_balance, payment_method) = row
+            if status != 'pending':
+                results.append((transaction_id, 'not_pending', {'status': status}))
+                continue
+            
+            product_name, key_type = product_for_amount(amount)
+            key_value = None
+            if key_type:
+                key_data = next(claimed[key_type], None)
+                if not key_data:
+                    results.append((transaction_id, 'out_of_stock', {'key_type': key_type}))
+                    continue
+                key_value = key_data[1]
+                new_user_keys.append((user_db_id, key_value, key_type))
+                keys_sold[key_type] = keys_sold.get(key_type, 0) + 1
+            
+            previous_balance = balances.get(user_db_id, user_balance)
+            balances[user_db_id] = previous_balance + amount
+            approved.append((admin_id, transaction_id))
+            sales.append((business_day(), key_type, transaction_id))
+            log_admin_action(admin_id, 'approve_payment', user_db_id, f"Transaction #{transaction_id} - ₹{amount}",
+                             cursor=cursor)
+            
+            results.append((transaction_id, 'ok', {
+                'user_telegram_id': user_telegram_id,
+                'username': username,
+                'amount': amount,
+                'product_name': product_name,
+                'key_type': key_type,
+                'key_value': key_value,
+                'user_balance': previous_balance,
+                'new_balance': balances[user_db_id],
+                'payment_method': payment_method
+            }))
+        
+        cursor.executemany('''UPDATE transactions 
+                              SET status = 'approved', admin_id = ?, approved_at = CURRENT_TIMESTAMP
+                              WHERE status = 'pending' AND transaction_id = ?''', approved)
+        cursor.executemany('UPDATE users SET balance = ? WHERE user_id = ?',
+                           [(balance, user_db_id) for user_db_id, balance in balances.items()])
+        cursor.executemany('''INSERT INTO user_keys (user_id, key_value, key_type) 
+                              VALUES (?, ?, ?)''', new_user_keys)
+        cursor.executemany('UPDATE users SET keys_count = keys_count + 1 WHERE user_id = ?',
+                           [(user_db_id,) for user_db_id, _, _ in new_user_keys])
+        cursor.executemany(RECORD_SALE_SQL, sales)
+        
+        conn.commit()
+    finally:
+        conn.close()
+    
+    for key_type, count in keys_sold.items():
+        adjust_stock_counter(key_type, -count)
+    return results
+
+def reject_transactions_bulk(transaction_ids, admin_id, reason):
+    """Reject several pending transactions in one DB transaction.
+    
+    Returns [(transaction_id, status, details)] with status 'ok', 'not_found' or 'not_pending'.
+    """
+    transaction_ids = sorted(set(transaction_ids))
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        begin_immediate(cursor)
+        
+        placeholders = ','.join('?' * len(transaction_ids))
+        cursor.execute(f'''SELECT t.transaction_id, t.user_id, t.amount, t.status, u.telegram_id, u.username
+                           FROM transactions t
+                           JOIN users u ON t.user_id = u.user_id
+                           WHERE t.transaction_id IN ({placeholders})''', transaction_ids)
+        found = {row[0]: row for row in cursor.fetchall()}
+        
+        results = []
+        rejected = []
+        for transaction_id in transaction_ids:
+            row = found.get(transaction_id)
+            if not row:
+                results.append((transaction_id, 'not_found', None))
+                continue
+            
+            (_, user_db_id, amount, status, user_telegram_id, username) = row
+            if status != 'pending':
+                results.append((transaction_id, 'not_pending', {'status': status}))
+                continue
+            
+            rejected.append((admin_id, transaction_id))
+            log_admin_action(admin_id, 'reject_payment', user_db_id,
+                             f"Transaction #{transaction_id} - ₹{amount} - Reason: {reason}", cursor=cursor)
+            results.append((transaction_id, 'ok', {
+                'user_telegram_id': user_telegram_id,
+                'username': username,
+                'amount': amount
+            }))
+        
+        cursor.executemany('''UPDATE transactions 
+                              SET status = 'rejected', admin_id = ?
+                              WHERE status = 'pending' AND transaction_id = ?''', rejected)
+        
+        conn.commit()
+    finally:
+        conn.close()
+    return results
+
+def parse_transaction_ids(args):
+    """Split command args into (transaction ids, remaining words) - ids may be space or comma separated"""
+    transaction_ids = []
+    for index, arg in enumerate(args):
+        parts = [part for part in arg.split(',') if part]
+        if not parts or not all(part.isdigit() for part in parts):
+            return transaction_ids, args[index:]
+        transaction_ids.extend(int(part) for part in parts)
+    return transaction_ids, []
+
+def format_bulk_results(title, results):
+    """Per-item summary of a bulk approve/reject, sent as soon as it commits"""
+    done = sum(1 for _, status, _ in results if status == 'ok')
+    text = f"📋 **{title}**\n\n✅ **Done:** {done} • ⏭️ **Skipped:** {len(results) - done}\n\n"
+    
+    for transaction_id, status, details in results:
+        if status == 'ok':
+            line = f"✅ #{transaction_id} @{details['username']} - ₹{details['amount']}"
+            if details.get('key_value'):
+                line += f" - {details['product_name']} `{details['key_value']}`"
+        elif status == 'not_found':
+            line = f"❓ #{transaction_id} - not found"
+        elif status == 'not_pending':
+            line = f"⏭️ #{transaction_id} - already {details['status']}"
+        else:
+            line = f"📦 #{transaction_id} - no {details['key_type']} keys in stock"
+        text += line + "\n"
+    
+    if done:
+        text += f"\n📨 Notifying {done} customer(s) - a delivery report follows."
+    return text
+
+def format_delivery_report(title, notified, items):
+    """Follow-up to a bulk summary: how many customers got their message, and who didn't"""
+    missed = [(transaction_id, details) for transaction_id, details in items if not notified[transaction_id]]
+    lines = [f"📨 **{title} Delivery**", "",
+             f"✅ **Notified:** {len(items) - len(missed)} • ⚠️ **Not notified:** {len(missed)}"]
+    if missed:
+        lines.append("")
+        lines.extend(f"⚠️ #{transaction_id} @{details['username']} ({details['user_telegram_id']})"
+                     for transaction_id, details in missed)
+    return '\n'.join(lines)
+
+async def deliver_bulk_notifications(context, admin_id, title, messages):
+    """Background task: send each customer their result, then report the deliveries to the admin.
+    
+    messages is [(transaction_id, details, message kwargs)]. There is no send timeout - the payments
+    are already settled, so OUTBOX keeps retrying until it delivers or gives up.
+    """
+    try:
+        deliveries = await asyncio.gather(*(
+            send_tracked(context.bot, details['user_telegram_id'], PRIORITY_CUSTOMER, **message)
+            for _, details, message in messages
+        ))
+        notified = {transaction_id: delivery[1] for (transaction_id, _, _), delivery in zip(messages, deliveries)}
+        items = [(transaction_id, details) for transaction_id, details, _ in messages]
+        await send_tracked(context.bot, admin_id, PRIORITY_NOTICE,
+                           text=format_delivery_report(title, notified, items), parse_mode='Markdown')
+    except Exception as e:
+        logger.error(f"Error delivering {title.lower()} notifications: {e}")
+
+async def complete_bulk_approval(context, admin_id, transaction_ids, reply):
+    """Approve a batch and reply with a per-item summary, then notify the customers in the background"""
+    results = await run_db(approve_transactions_bulk, transaction_ids, admin_id)
+    approved = [(transaction_id, details) for transaction_id, status, details in results if status == 'ok']
+    
+    # The summary doesn't wait on customer sends, which can take a while under flood control
+    await reply(format_bulk_results("Bulk Approval", results), parse_mode='Markdown')
+    if approved:
+        context.application.create_task(deliver_bulk_notifications(context, admin_id, "Bulk Approval", [
+            (transaction_id, details, {'text': build_approval_message(transaction_id, details), 'parse_mode': 'Markdown'})
+            for transaction_id, details in approved
+        ]))
+    
+    # Sale notifications for admins run in the background, as for single approvals
+    for transaction_id, details in approved:
+        if details['key_value']:
+            context.application.create_task(notify_admins_about_key_sale(
+                context=context,
+                user_id=details['user_telegram_id'],
+                username=details['username'],
+                product_name=details['product_name'],
+                key_value=details['key_value'],
+                key_type=details['key_type'],
+                amount=details['amount'],
+                payment_method=details['payment_method'] if details['payment_method'] else "manual_approval"
+            ))
+    
+    logger.info(f"Bulk approval by admin {admin_id}: {len(approved)}/{len(results)} approved")
+
+async def bulk_approve(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/bulkapprove ID ID ... - approve several payments at once"""
+    try:
+        admin_id = update.effective_user.id
+        
+        if not has_permission(admin_id, 'approve_payments'):
+            await update.message.reply_text("❌ You don't have permission to approve payments!")
+            return
+        
+        transaction_ids, rest = parse_transaction_ids(context.args or [])
+        if not transaction_ids or rest:
+            await update.message.reply_text(
+                "❌ **Usage:** `/bulkapprove ID ID ...`\n\nExample: `/bulkapprove 12 13 14` or `/bulkapprove 12,13,14`",
+                parse_mode='Markdown'
+            )
+            return
+        
+        if len(set(transaction_ids)) > BULK_MAX_TRANSACTIONS:
+            await update.message.reply_text(f"❌ At most {BULK_MAX_TRANSACTIONS} transactions at a time!")
+            return
+        
+        await complete_bulk_approval(context, admin_id, transaction_ids, update.message.reply_text)
+    
+    except Exception as e:
+        logger.error(f"Error in bulk_approve: {e}")
+        await update.message.reply_text("❌ An error occurred. Please try again.")
+
+async def bulk_reject(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/bulkreject ID ID ... REASON - reject several payments with one reason"""
+    try:
+        admin_id = update.effective_user.id
+        
+        if not has_permission(admin_id, 'approve_payments'):
+            await update.message.reply_text("❌ You don't have permission to reject payments!")
+            return
+        
+        transaction_ids, rest = parse_transaction_ids(context.args or [])
+        reason = ' '.join(rest)
+        if not transaction_ids or not reason:
+            await update.message.reply_text(
+                "❌ **Usage:** `/bulkreject ID ID ... REASON`\n\nExample: `/bulkreject 12 13 Screenshot not valid`",
+                parse_mode='Markdown'
+            )
+            return
+        
+        if len(set(transaction_ids)) > BULK_MAX_TRANSACTIONS:
+            await update.message.reply_text(f"❌ At most {BULK_MAX_TRANSACTIONS} transactions at a time!")
+            return
+        
+        results = await run_db(reject_transactions_bulk, transaction_ids, admin_id, reason)
+        rejected = [(transaction_id, details) for transaction_id, status, details in results if status == 'ok']
+        
+        await update.message.reply_text(format_bulk_results("Bulk Rejection", results), parse_mode='Markdown')
+        if rejected:
+            context.application.create_task(deliver_bulk_notifications(context, admin_id, "Bulk Rejection", [
+                (transaction_id, details, {'text': build_rejection_message(transaction_id, details['amount'], reason)})
+                for transaction_id, details in rejected
+            ]))
+        logger.info(f"Bulk rejection by admin {admin_id}: {len(rejected)}/{len(results)} rejected")
+    
+    except Exception as e:
+        logger.error(f"Error in bulk_reject: {e}")
+        await update.message.reply_text("❌ An error occurred. Please try again.")
+
+async def inbox_bulk_approve_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Approve-all button in the inbox - the ids travel in the callback data"""
+    query = update.callback_query
+    transaction_ids = [int(part) for part in query.data.replace('inbox_bulk_', '').split('.')]
+    await complete_bulk_approval(context, query.from_user.id, transaction_ids, query.message.reply_text)
+
+def add_stock_key(key_value, key_type, admin_id):
+    """Add a key to stock - returns False if the key already exists"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        # Check if key already exists (CASE SENSITIVE check)
+        cursor.execute('SELECT key_value FROM keys_stock WHERE key_value = ?', (key_value,))
+        if cursor.fetchone():
+            return False
+        
+        # Add the key with exact case
+        cursor.execute('INSERT INTO keys_stock (key_value, key_type) VALUES (?, ?)', 
+                      (key_value, key_type))
+        
+        # Log admin action
+        log_admin_action(admin_id, 'add_key', 0, f"{key_type} key: {key_value}", cursor=cursor)
+        
+        conn.commit()
+    finally:
+        conn.close()
+    
+    adjust_stock_counter(key_type, 1)
+    return True
 
-📞 **Contact:** @Aarifseller for assistance."""
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify user {user_telegram_id}: {e}")
+def delete_stock_key(key_value, admin_id):
+    """Delete a key from stock.
+    
+    Returns ((key_id, key_type, status, key_value), case_mismatch) or (None, False) if not found.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        # Check if key exists (EXACT CASE SENSITIVE MATCH)
+        cursor.execute('''SELECT key_id, key_type, status, key_value 
+                          FROM keys_stock 
+                          WHERE key_value = ?''', (key_value,))
+        key_data = cursor.fetchone()
+        case_mismatch = False
         
-        # Clear user data
-        context.user_data.clear()
+        if not key_data:
+            # Try case-insensitive search for better UX
+            cursor.execute('''SELECT key_id, key_type, status, key_value 
+                              FROM keys_stock 
+                              WHERE LOWER(key_value) = LOWER(?)''', (key_value,))
+            key_data = cursor.fetchone()
+            
+            if not key_data:
+                return None, False
+            case_mismatch = True
         
-        # Send confirmation to admin
-        await update.message.reply_text(
-            f"""✅ **Payment Rejected Successfully!**
-
-📋 **Transaction Details:**
-• **Transaction ID:** #{transaction_id}
-• **Amount:** ₹{amount}
-• **Reason:** {reason}
-
-✅ User has been notified."""
-        )
+        key_id, key_type, status, actual_key_value = key_data
         
-        conn.close()
-        logger.info(f"Transaction #{transaction_id} rejected by admin {admin_id}")
+        # Delete the key using exact key value from database
+        cursor.execute('DELETE FROM keys_stock WHERE key_id = ?', (key_id,))
         
-    except Exception as e:
-        logger.error(f"Error in handle_reject_reason: {e}")
+        # Log admin action
+        log_admin_action(admin_id, 'delete_key', 0, f"{key_type} key: {actual_key_value} (Status: {status})",
+                         cursor=cursor)
+        
+        conn.commit()
+    finally:
+        conn.close()
+    
+    if status == 'available':
+        adjust_stock_counter(key_type, -1)
+    return key_data, case_mismatch
 
-# ========== EXISTING FUNCTIONS ==========
 async def handle_add_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle adding keys by admin - CASE SENSITIVE (EXACT CASE PRESERVED)"""
     admin_id = update.effective_user.id
@@ -2879,37 +4234,19 @@ async def handle_add_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Keep the EXACT case as sent by admin - NO UPPERCASE CONVERSION
     # Determine key type from command
-    if command == "/addkey_3d":
-        key_type = '3d'
-    elif command == "/addkey_10d":
-        key_type = '10d'
-    elif command == "/addkey_30d":
-        key_type = '30d'
-    else:
-        await update.message.reply_text("❌ Invalid command! Use /addkey_3d, /addkey_10d, or /addkey_30d")
+    key_type = command_key_type(command, '/addkey_')
+    product = get_product(key_type)
+    if product is None:
+        await update.message.reply_text(f"❌ Unknown key type! Use /addkey_TYPE with one of: {key_type_list()}")
         return
     
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
     try:
-        # Check if key already exists (CASE SENSITIVE check)
-        cursor.execute('SELECT key_value FROM keys_stock WHERE key_value = ?', (key_value,))
-        existing_key = cursor.fetchone()
+        added = await run_db(add_stock_key, key_value, key_type, admin_id)
         
-        if existing_key:
+        if not added:
             await update.message.reply_text(f"❌ Key '{key_value}' already exists!")
-            conn.close()
             return
         
-        # Add the key with exact case
-        cursor.execute('INSERT INTO keys_stock (key_value, key_type) VALUES (?, ?)', 
-                      (key_value, key_type))
-        conn.commit()
-        
-        # Log admin action
-        log_admin_action(admin_id, 'add_key', 0, f"{key_type} key: {key_value}")
-        
         # Get updated stock
         stock_info = get_stock_info()
         
@@ -2917,14 +4254,12 @@ async def handle_add_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"""✅ **Key Added Successfully!**
 
 🔑 **Key:** `{key_value}`
-📦 **Type:** {key_type.upper()}-Day Key
-💰 **Price:** ₹{PRODUCT_PRICES[key_type]}
+📦 **Type:** {product['name']}
+💰 **Price:** ₹{product['price']}
 👤 **Added by:** Admin
 
 📊 **Updated Stock:**
-• 3-Day Keys: {stock_info.get('3d', 0)} available
-• 10-Day Keys: {stock_info.get('10d', 0)} available  
-• 30-Day Keys: {stock_info.get('30d', 0)} available""",
+{stock_lines(stock_info)}""",
             parse_mode='Markdown'
         )
         
@@ -2932,8 +4267,217 @@ async def handle_add_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     except Exception as e:
         await update.message.reply_text(f"❌ Error adding key: {str(e)}")
+
+# ========== BULK KEY IMPORT ==========
+def _import_key_batch(batch, admin_id, batch_number):
+    """Insert one batch of (key_value, key_type) in its own transaction - returns (added per type, duplicates)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        begin_immediate(cursor)
+        
+        placeholders = ','.join('?' * len(batch))
+        cursor.execute(f'SELECT key_value FROM keys_stock WHERE key_value IN ({placeholders})',
+                       [key_value for key_value, _ in batch])
+        existing = {row[0] for row in cursor.fetchall()}
+        
+        cursor.executemany('INSERT OR IGNORE INTO keys_stock (key_value, key_type) VALUES (?, ?)', batch)
+        
+        added = {}
+        for key_value, key_type in batch:
+            if key_value not in existing:
+                added[key_type] = added.get(key_type, 0) + 1
+        duplicates = [key_value for key_value, _ in batch if key_value in existing]
+        
+        # One log row per batch
+        summary = ', '.join(f"{key_type}: {count}" for key_type, count in sorted(added.items())) or "none"
+        log_admin_action(admin_id, 'import_keys', 0,
+                         f"Batch {batch_number}: {sum(added.values())} added ({summary}), {len(duplicates)} duplicates",
+                         cursor=cursor)
+        
+        conn.commit()
     finally:
         conn.close()
+    return added, duplicates
+
+def import_stock_keys(path, default_key_type, admin_id):
+    """Stream a text/CSV key file into keys_stock in batches.
+    
+    Each line is `KEY` (uses default_key_type) or `KEY,TYPE`. Blank lines and lines starting
+    with # are skipped. Keys are stored exactly as written (case sensitive).
+    
+    Every batch commits on its own and is retried on its own while the database is locked - run
+    this with run_db_no_retry(). If a batch still can't get the lock the import stops there:
+    result['stopped'] says why and the counts cover the batches already saved.
+    """
+    result = {'lines': 0, 'added': {}, 'duplicates': 0, 'duplicate_samples': [],
+              'invalid': 0, 'invalid_lines': [], 'batches': 0, 'stopped': None}
+    seen = set()
+    batch = []
+    
+    def flush():
+        batch_number = result['batches'] + 1
+        added, duplicates = call_with_lock_retry(_import_key_batch, batch, admin_id, batch_number)
+        result['batches'] = batch_number
+        for key_type, count in added.items():
+            result['added'][key_type] = result['added'].get(key_type, 0) + count
+        note_duplicates(duplicates)
+        batch.clear()
+    
+    def note_duplicates(keys):
+        result['duplicates'] += len(keys)
+        room = 10 - len(result['duplicate_samples'])
+        result['duplicate_samples'].extend(keys[:max(0, room)])
+    
+    try:
+        with open(path, newline='', encoding='utf-8-sig', errors='replace') as key_file:
+            for line_number, row in enumerate(csv.reader(key_file), 1):
+                result['lines'] += 1
+                if not row or not row[0].strip() or row[0].strip().startswith('#'):
+                    continue
+                
+                key_value = row[0].strip()
+                key_type = row[1].strip().lower() if len(row) > 1 and row[1].strip() else default_key_type
+                
+                if line_number == 1 and key_value.lower() in ('key', 'key_value'):
+                    continue  # CSV header
+                
+                if get_product(key_type) is None:
+                    result['invalid'] += 1
+                    if len(result['invalid_lines']) < 10:
+                        result['invalid_lines'].append(line_number)
+                    continue
+                
+                # Repeated inside the file itself
+                if key_value in seen:
+                    note_duplicates([key_value])
+                    continue
+                seen.add(key_value)
+                
+                batch.append((key_value, key_type))
+                if len(batch) >= KEY_IMPORT_BATCH_SIZE:
+                    flush()
+        
+        if batch:
+            flush()
+    except sqlite3.OperationalError as e:
+        if not is_lock_error(e):
+            raise
+        result['stopped'] = f"batch {result['batches'] + 1} could not be saved ({e})"
+        logger.error(f"Key import by admin {admin_id} stopped: {result['stopped']}")
+    
+    # Counters refreshed once for the whole import (whatever was committed)
+    for key_type, count in result['added'].items():
+        adjust_stock_counter(key_type, count)
+    return result
+
+async def import_keys_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/importkeys [KEY_TYPE] - wait for a key file from this admin"""
+    admin_id = update.effective_user.id
+    
+    if not has_permission(admin_id, 'add_keys'):
+        await update.message.reply_text("❌ You don't have permission to add keys!")
+        return
+    
+    key_type = context.args[0].lower() if context.args else ''
+    if key_type and get_product(key_type) is None:
+        await update.message.reply_text(f"❌ Invalid key type! Use one of: {key_type_list()}")
+        return
+    
+    context.user_data['awaiting_key_import'] = key_type
+    
+    type_note = f"All keys will be added as **{get_product(key_type)['stock_label']}** unless a line says otherwise." if key_type \
+        else "Every line must say its type: `KEY,3d`"
+    await update.message.reply_text(
+        f"""📥 **Bulk Key Import**
+
+Send a .txt or .csv file now, one key per line:
+• `KEY` or `KEY,TYPE` (TYPE = {key_type_list()})
+• Blank lines and lines starting with # are ignored
+
+{type_note}
+
+⚠️ Keys are saved EXACTLY as written (case sensitive). Existing keys are skipped.""",
+        parse_mode='Markdown'
+    )
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Key import documents (after /importkeys, or sent with /importkeys as the caption)"""
+    try:
+        admin_id = update.effective_user.id
+        caption = (update.message.caption or '').split()
+        
+        if caption and caption[0].startswith('/importkeys'):
+            key_type = caption[1].lower() if len(caption) > 1 else ''
+        elif 'awaiting_key_import' in context.user_data:
+            key_type = context.user_data['awaiting_key_import']
+        else:
+            await update.message.reply_text("⚠️ I'm not expecting a file right now.")
+            return
+        
+        if not has_permission(admin_id, 'add_keys'):
+            await update.message.reply_text("❌ You don't have permission to add keys!")
+            return
+        
+        if key_type and get_product(key_type) is None:
+            await update.message.reply_text(f"❌ Invalid key type! Use one of: {key_type_list()}")
+            return
+        
+        document = update.message.document
+        if document.file_size and document.file_size > KEY_IMPORT_MAX_BYTES:
+            await update.message.reply_text(f"❌ File too large! Maximum is {KEY_IMPORT_MAX_BYTES // (1024 * 1024)} MB.")
+            return
+        
+        context.user_data.pop('awaiting_key_import', None)
+        await update.message.reply_text("⏳ Importing keys...")
+        
+        fd, path = tempfile.mkstemp(suffix='.keys')
+        os.close(fd)
+        try:
+            telegram_file = await context.bot.get_file(document.file_id)
+            await telegram_file.download_to_drive(path)
+            result = await run_db_no_retry(import_stock_keys, path, key_type, admin_id)
+        finally:
+            os.remove(path)
+        
+        stock_info = get_stock_info()
+        added_total = sum(result['added'].values())
+        added_detail = ', '.join(f"{key_type.upper()}: {count}" for key_type, count in sorted(result['added'].items()))
+        
+        title = "⚠️ **Key Import Stopped!**" if result['stopped'] else "✅ **Key Import Finished!**"
+        text = f"""{title}
+
+📄 **File:** `{document.file_name or 'document'}`
+• **Lines Read:** {result['lines']}
+• **Keys Added:** {added_total}{f' ({added_detail})' if added_detail else ''}
+• **Duplicates Skipped:** {result['duplicates']}
+• **Invalid Lines:** {result['invalid']}
+• **Batches:** {result['batches']}
+"""
+        if result['stopped']:
+            text += f"\n⚠️ The database stayed locked: {result['stopped']}. Keys above were saved - send the file again to add the rest (saved keys will show as duplicates).\n"
+        if result['duplicate_samples']:
+            text += "\n🔁 **Duplicates:** " + ', '.join(f"`{key}`" for key in result['duplicate_samples'])
+            if result['duplicates'] > len(result['duplicate_samples']):
+                text += f" (+{result['duplicates'] - len(result['duplicate_samples'])} more)"
+            text += "\n"
+        if result['invalid_lines']:
+            text += "\n⚠️ **Invalid Lines:** " + ', '.join(str(line) for line in result['invalid_lines'])
+            if result['invalid'] > len(result['invalid_lines']):
+                text += f" (+{result['invalid'] - len(result['invalid_lines'])} more)"
+            text += "\n"
+        
+        text += f"""
+📊 **Updated Stock:**
+{stock_lines(stock_info)}"""
+        
+        await update.message.reply_text(text, parse_mode='Markdown')
+        logger.info(f"Admin {admin_id} imported {added_total} keys ({result['duplicates']} duplicates)")
+    
+    except Exception as e:
+        logger.error(f"Error in handle_document: {e}")
+        await update.message.reply_text(f"❌ Error importing keys: {str(e)}")
 
 async def handle_delete_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle deleting keys by admin - CASE SENSITIVE (EXACT MATCH)"""
@@ -2961,39 +4505,17 @@ async def handle_delete_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(parts) > 2:
         key_value = " ".join(parts[1:])
     
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
     try:
-        # Check if key exists (EXACT CASE SENSITIVE MATCH)
-        cursor.execute('''SELECT key_id, key_type, status, key_value 
-                          FROM keys_stock 
-                          WHERE key_value = ?''', (key_value,))
-        key_data = cursor.fetchone()
+        key_data, case_mismatch = await run_db(delete_stock_key, key_value, admin_id)
         
         if not key_data:
-            # Try case-insensitive search for better UX
-            cursor.execute('''SELECT key_id, key_type, status, key_value 
-                              FROM keys_stock 
-                              WHERE LOWER(key_value) = LOWER(?)''', (key_value,))
-            key_data = cursor.fetchone()
-            
-            if not key_data:
-                await update.message.reply_text(f"❌ Key '{key_value}' not found!")
-                conn.close()
-                return
-            else:
-                key_id, key_type, status, actual_key_value = key_data
-                await update.message.reply_text(f"⚠️ **Note:** Key found with different case: '{actual_key_value}'", parse_mode='Markdown')
-        else:
-            key_id, key_type, status, actual_key_value = key_data
+            await update.message.reply_text(f"❌ Key '{key_value}' not found!")
+            return
         
-        # Delete the key using exact key value from database
-        cursor.execute('DELETE FROM keys_stock WHERE key_id = ?', (key_id,))
-        conn.commit()
+        key_id, key_type, status, actual_key_value = key_data
         
-        # Log admin action
-        log_admin_action(admin_id, 'delete_key', 0, f"{key_type} key: {actual_key_value} (Status: {status})")
+        if case_mismatch:
+            await update.message.reply_text(f"⚠️ **Note:** Key found with different case: '{actual_key_value}'", parse_mode='Markdown')
         
         # Get updated stock
         stock_info = get_stock_info()
@@ -3002,23 +4524,19 @@ async def handle_delete_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"""✅ **Key Deleted Successfully!**
 
 🔑 **Key:** `{actual_key_value}`
-📦 **Type:** {key_type.upper()}-Day Key
+📦 **Type:** {product_days(key_type)}-Day Key
 📊 **Status:** {status}
 👤 **Deleted by:** Admin
 
 📊 **Updated Stock:**
-• 3-Day Keys: {stock_info.get('3d', 0)} available
-• 10-Day Keys: {stock_info.get('10d', 0)} available  
-• 30-Day Keys: {stock_info.get('30d', 0)} available""",
+{stock_lines(stock_info)}""",
             parse_mode='Markdown'
         )
         
         logger.info(f"Admin {admin_id} deleted {key_type} key: {actual_key_value}")
-        
+    
     except Exception as e:
         await update.message.reply_text(f"❌ Error deleting key: {str(e)}")
-    finally:
-        conn.close()
 
 async def handle_price_change(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle price changes by admin"""
@@ -3050,38 +4568,22 @@ async def handle_price_change(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     # Determine product type from command
-    if command == "/price_3d":
-        product_type = '3d'
-        product_name = '3-Day Key'
-        old_price = PRODUCT_PRICES['3d']
-        PRODUCT_PRICES['3d'] = new_price
-    elif command == "/price_10d":
-        product_type = '10d'
-        product_name = '10-Day Key'
-        old_price = PRODUCT_PRICES['10d']
-        PRODUCT_PRICES['10d'] = new_price
-    elif command == "/price_30d":
-        product_type = '30d'
-        product_name = '30-Day Key'
-        old_price = PRODUCT_PRICES['30d']
-        PRODUCT_PRICES['30d'] = new_price
-    else:
-        await update.message.reply_text("❌ Invalid command! Use /price_3d, /price_10d, or /price_30d")
+    product = get_product(command_key_type(command, '/price_'))
+    if product is None:
+        await update.message.reply_text(f"❌ Unknown product! Use /price_TYPE with one of: {key_type_list()}")
         return
+    product_name = product['name']
     
-    # Save price to database
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''INSERT OR REPLACE INTO settings (setting_key, setting_value) 
-                      VALUES (?, ?)''',
-                   (f'price_{product_type}', str(new_price)))
-    
-    conn.commit()
-    conn.close()
+    same_price = product_at_price(new_price)
+    if same_price and same_price['key_type'] != product['key_type']:
+        await update.message.reply_text(PRICE_TAKEN_MESSAGE.format(name=same_price['name'], price=new_price))
+        return
     
-    # Log admin action
-    log_admin_action(admin_id, 'change_price', 0, f"{product_name}: ₹{old_price} → ₹{new_price}")
+    # Save to the catalogue (logged there) and publish the new price
+    old_price = await run_db(set_product_price, product['key_type'], new_price, admin_id)
+    if old_price is None:
+        await update.message.reply_text("❌ Product not found!")
+        return
     
     await update.message.reply_text(
         f"""✅ **Price Updated Successfully!**
@@ -3097,76 +4599,234 @@ async def handle_price_change(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     logger.info(f"Admin {admin_id} changed {product_name} price: ₹{old_price} → ₹{new_price}")
 
-async def show_stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show current stock"""
+async def add_product_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/addproduct KEY_TYPE DAYS PRICE [NAME] - add a product to the catalogue"""
     admin_id = update.effective_user.id
     
     if not is_admin(admin_id):
         await update.message.reply_text("❌ Unauthorized!")
         return
     
-    if not has_permission(admin_id, 'view_stock'):
-        await update.message.reply_text("❌ You don't have permission to view stock!")
+    if not has_permission(admin_id, 'change_prices'):
+        await update.message.reply_text("❌ You don't have permission to change prices!")
         return
     
-    stock_info = get_stock_info()
+    args = context.args or []
+    if len(args) < 3:
+        await update.message.reply_text(
+            "❌ Invalid format! Use: `/addproduct KEY_TYPE DAYS PRICE [NAME]`\n\nExample: `/addproduct 7d 7 650 7-Day Key`",
+            parse_mode='Markdown'
+        )
+        return
+    
+    key_type = args[0].lower()
+    if not KEY_TYPE_PATTERN.match(key_type):
+        await update.message.reply_text("❌ Key type must be 1-8 lowercase letters or digits, e.g. 7d")
+        return
+    
+    try:
+        days = int(args[1])
+        price = int(args[2])
+    except ValueError:
+        await update.message.reply_text("❌ DAYS and PRICE must be whole numbers!")
+        return
+    
+    if days <= 0 or price <= 0:
+        await update.message.reply_text("❌ DAYS and PRICE must be greater than 0!")
+        return
+    
+    name = ' '.join(args[3:]) or f"{days}-Day Key"
+    if any(char in name for char in '*_`['):
+        await update.message.reply_text("❌ Product name can't contain * _ ` or [")
+        return
+    
+    if get_products().get(f'product_{key_type}'):
+        await update.message.reply_text(f"❌ Product {key_type} already exists! Use /price_{key_type} to change its price.")
+        return
+    
+    same_price = product_at_price(price)
+    if same_price:
+        await update.message.reply_text(PRICE_TAKEN_MESSAGE.format(name=same_price['name'], price=price))
+        return
+    
+    await run_db(add_product, key_type, name, days, price, admin_id)
+    
+    await update.message.reply_text(
+        f"""✅ **Product Added!**
+
+📦 **Product:** {name}
+📅 **Days:** {days}
+💰 **Price:** ₹{price}
+
+It is now in the /buy menu. Add keys with:
+`/addkey_{key_type} KEYVALUE` or `/importkeys {key_type}`""",
+        parse_mode='Markdown'
+    )
+    
+    logger.info(f"Admin {admin_id} added product {key_type}: {name}, {days} days, ₹{price}")
+
+async def addkey_prompt_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """addkey_<type>_menu - how to add a key of that type"""
+    query = update.callback_query
+    product = get_product(query.data[len('addkey_'):-len('_menu')])
+    if product is None:
+        await query.edit_message_text("❌ Unknown key type!")
+        return
+    
+    key_type = product['key_type']
+    await query.edit_message_text(
+        f"📝 **Add {product['name']}**\n\nSend command: `/addkey_{key_type} KEYVALUE`\n\nExample: `/addkey_{key_type} ABC123`\n\n⚠️ Key will be saved EXACTLY as you type it (case sensitive).",
+        parse_mode='Markdown'
+    )
+
+async def price_prompt_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """price_<type>_menu - current price and how to change it"""
+    query = update.callback_query
+    product = get_product(query.data[len('price_'):-len('_menu')])
+    if product is None:
+        await query.edit_message_text("❌ Unknown product!")
+        return
     
-    conn = sqlite3.connect('atoplay_bot.db')
+    key_type = product['key_type']
+    await query.edit_message_text(
+        f"💰 **Change {product['name']} Price**\n\nCurrent Price: ₹{product['price']}\n\nSend command: `/price_{key_type} NEW_PRICE`\n\nExample: `/price_{key_type} {product['price'] + 20}`",
+        parse_mode='Markdown'
+    )
+
+def get_stock_summary():
+    """Per-type key counts from one aggregate query - key values are never read"""
+    conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Get all keys with details
-    cursor.execute('''SELECT key_type, key_value, status, 
-                             strftime('%Y-%m-%d %H:%M', created_at) as created
+    cursor.execute('''SELECT key_type, COUNT(*), SUM(status = 'available'), 
+                             strftime('%Y-%m-%d %H:%M', MAX(created_at))
                       FROM keys_stock 
-                      ORDER BY key_type, created_at DESC''')
-    
-    all_keys = cursor.fetchall()
+                      GROUP BY key_type''')
+    summary = {key_type: {'total': total, 'available': available or 0, 'newest': newest}
+               for key_type, total, available, newest in cursor.fetchall()}
     conn.close()
+    return summary
+
+def get_stock_page(key_type, after=None, limit=STOCK_PAGE_SIZE):
+    """Newest-first page of one key type, continuing after the (created_epoch, key_id) cursor.
     
-    # Group keys by type
-    keys_by_type = {'3d': [], '10d': [], '30d': []}
+    Keyset pagination on (key_type, created_at, key_id) - served by idx_keys_stock_type_created.
+    The cursor carries the values themselves, so it stays valid if that key is sold meanwhile.
+    Returns (rows, has_more); rows are (key_id, key_value, status, created, created_epoch).
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
     
-    for key_type, key_value, status, created in all_keys:
-        keys_by_type[key_type].append(f"`{key_value}` - {status} ({created})")
+    query = '''SELECT key_id, key_value, status, strftime('%Y-%m-%d %H:%M', created_at), 
+                      CAST(strftime('%s', created_at) AS INTEGER)
+               FROM keys_stock 
+               WHERE key_type = ? '''
+    params = [key_type]
+    if after is not None:
+        query += "AND (created_at, key_id) < (datetime(?, 'unixepoch'), ?) "
+        params.extend(after)
+    query += 'ORDER BY created_at DESC, key_id DESC LIMIT ?'
+    params.append(limit + 1)
+    
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    conn.close()
     
-    text = f"""📊 **STOCK REPORT**
-
-📈 **Available Keys:**
-• 3-Day Keys: {stock_info.get('3d', 0)} available - ₹{PRODUCT_PRICES['3d']}
-• 10-Day Keys: {stock_info.get('10d', 0)} available - ₹{PRODUCT_PRICES['10d']}
-• 30-Day Keys: {stock_info.get('3d', 0)} available - ₹{PRODUCT_PRICES['30d']}
+    return rows[:limit], len(rows) > limit
 
-🔑 **All Keys:**
+async def show_stock_page(update: Update, context: ContextTypes.DEFAULT_TYPE, key_type, after=None):
+    """One page of keys, cut short if the text would get too long for a message"""
+    rows, has_more = await run_db(get_stock_page, key_type, after)
+    stock_label = get_product(key_type)['stock_label']
+    
+    text = f"""🔑 **{stock_label}** • {get_stock_info().get(key_type, 0)} available
 
-📅 **3-Day Keys:**"""
+"""
+    if not rows:
+        text += f"• No {stock_label.lower()}" if after is None else "• No more keys"
     
-    if keys_by_type['3d']:
-        for key_info in keys_by_type['3d']:
-            text += f"\n• {key_info}"
-    else:
-        text += "\n• No 3-day keys"
+    shown = 0
+    for key_id, key_value, status, created, created_epoch in rows:
+        line = f"• `{key_value}` - {status} ({created})\n"
+        if shown and len(text) + len(line) > STOCK_PAGE_MAX_CHARS:
+            has_more = True
+            break
+        text += line
+        shown += 1
     
-    text += "\n\n📅 **10-Day Keys:**"
-    if keys_by_type['10d']:
-        for key_info in keys_by_type['10d']:
-            text += f"\n• {key_info}"
-    else:
-        text += "\n• No 10-day keys"
+    keyboard = []
+    navigation = []
+    if after is not None:
+        navigation.append(InlineKeyboardButton("⏮️ First", callback_data=f'stk_{key_type}'))
+    if has_more:
+        key_id, _, _, _, created_epoch = rows[shown - 1]
+        navigation.append(InlineKeyboardButton("Next ▶️", callback_data=f'stk_{key_type}_{created_epoch}_{key_id}'))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton("📊 Stock Summary", callback_data='view_stock')])
+    keyboard.append([InlineKeyboardButton("🔙 Back to Stock Menu", callback_data='admin_stock')])
+    reply_markup = InlineKeyboardMarkup(keyboard)
     
-    text += "\n\n📅 **30-Day Keys:**"
-    if keys_by_type['30d']:
-        for key_info in keys_by_type['30d']:
-            text += f"\n• {key_info}"
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
     else:
-        text += "\n• No 30-day keys"
+        await update.message.reply_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+
+async def show_stock(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stock summary (/stock), or the first page of one type (/stock 3d)"""
+    admin_id = update.effective_user.id
+    
+    if not is_admin(admin_id):
+        await update.message.reply_text("❌ Unauthorized!")
+        return
+    
+    if not has_permission(admin_id, 'view_stock'):
+        await update.message.reply_text("❌ You don't have permission to view stock!")
+        return
+    
+    if context.args and not update.callback_query:
+        key_type = context.args[0].lower()
+        if get_product(key_type) is None:
+            await update.message.reply_text(f"❌ Invalid key type! Use one of: {key_type_list()}")
+            return
+        await show_stock_page(update, context, key_type)
+        return
+    
+    stock_info = get_stock_info()
+    summary = await run_db(get_stock_summary)
+    
+    text = f"""📊 **STOCK REPORT**
+
+📈 **Available Keys:**
+{stock_lines(stock_info, with_prices=True)}
+
+🗂️ **In Stock Table:**"""
+    
+    keyboard = []
+    for product in list_products():
+        key_type = product['key_type']
+        type_summary = summary.get(key_type)
+        if type_summary:
+            text += f"\n• {product['stock_label']}: {type_summary['total']} rows, newest {type_summary['newest']}"
+        else:
+            text += f"\n• {product['stock_label']}: none"
+        keyboard.append([InlineKeyboardButton(f"🔑 Browse {product['stock_label']}", callback_data=f'stk_{key_type}')])
     
-    # Add back button for callback
     if update.callback_query:
-        keyboard = [[InlineKeyboardButton("🔙 Back to Stock Menu", callback_data='admin_stock')]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.callback_query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+        keyboard.append([InlineKeyboardButton("🔙 Back to Stock Menu", callback_data='admin_stock')])
+        await update.callback_query.edit_message_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
     else:
-        await update.message.reply_text(text, parse_mode='Markdown')
+        await update.message.reply_text(text, parse_mode='Markdown', reply_markup=InlineKeyboardMarkup(keyboard))
+
+async def stock_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """stk_<type> (first page) or stk_<type>_<created_epoch>_<key_id> (page after that key)"""
+    parts = update.callback_query.data.split('_')
+    key_type = parts[1]
+    if get_product(key_type) is None:
+        await update.callback_query.edit_message_text("❌ Unknown key type!")
+        return
+    after = (int(parts[2]), int(parts[3])) if len(parts) == 4 else None
+    await show_stock_page(update, context, key_type, after)
 
 async def view_prices(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """View all prices"""
@@ -3180,21 +4840,20 @@ async def view_prices(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ You don't have permission to view prices!")
         return
     
+    products = list_products()
+    change_commands = '\n'.join(f"• `/price_{product['key_type']} NEW_PRICE` - Change {product['name']} price"
+                                 for product in products)
+    example = f"`/price_{products[0]['key_type']} {products[0]['price'] + 20}`" if products else "`/price_3d 300`"
+    
     text = f"""💰 **CURRENT PRICES**
 
-📦 **3-Day Key:** ₹{PRODUCT_PRICES['3d']}
-📦 **10-Day Key:** ₹{PRODUCT_PRICES['10d']}
-📦 **30-Day Key:** ₹{PRODUCT_PRICES['30d']}
+{price_lines(prefix="📦 ", bold=True)}
 
 📝 **To Change Prices:**
-• `/price_3d NEW_PRICE` - Change 3-day price
-• `/price_10d NEW_PRICE` - Change 10-day price  
-• `/price_30d NEW_PRICE` - Change 30-day price
+{change_commands}
+• `/addproduct KEY_TYPE DAYS PRICE [NAME]` - Add a new product
 
-**Examples:**
-• `/price_3d 300`
-• `/price_10d 600`
-• `/price_30d 1300`"""
+**Example:** {example}"""
     
     # Add back button for callback
     if update.callback_query:
@@ -3202,21 +4861,17 @@ async def view_prices(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.callback_query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
     else:
-        await update.message.reply_text(text, parse_mode='Markdown')
-
-async def view_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """View all users summary - FIXED VERSION"""
-    admin_id = update.effective_user.id
-    
-    if not is_admin(admin_id):
-        await update.message.reply_text("❌ Unauthorized!")
-        return
-    
-    if not has_permission(admin_id, 'view_users'):
-        await update.message.reply_text("❌ You don't have permission to view users!")
-        return
-    
-    conn = sqlite3.connect('atoplay_bot.db')
+        await update.message.reply_text(text, parse_mode='Markdown')
+
+# Distinct customers with a sale approved in [start, end) - served by idx_transactions_status_approved
+APPROVED_BUYERS_SQL = '''SELECT COUNT(DISTINCT t.user_id) 
+                         FROM transactions t
+                         WHERE t.status = 'approved' AND t.payment_method != 'admin_adjustment'
+                         AND t.approved_at >= ? AND t.approved_at < ?'''
+
+def get_user_overview():
+    """User counts, today's buyers and the 10 most recent users"""
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
@@ -3230,11 +4885,8 @@ async def view_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
         cursor.execute('SELECT COUNT(*) FROM users WHERE is_admin = 1')
         admin_users = cursor.fetchone()[0]
         
-        # Get today's buyers
-        cursor.execute('''SELECT COUNT(DISTINCT t.user_id) 
-                          FROM transactions t
-                          WHERE t.status = 'approved' 
-                          AND DATE(t.created_at) = DATE('now')''')
+        # Get today's buyers (distinct users can't come from the rollup - index range instead)
+        cursor.execute(APPROVED_BUYERS_SQL, time_window('today'))
         today_buyers_result = cursor.fetchone()
         today_buyers = today_buyers_result[0] if today_buyers_result else 0
         
@@ -3246,6 +4898,36 @@ async def view_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
                           LIMIT 10''')
         
         recent_users = cursor.fetchall()
+    finally:
+        conn.close()
+    
+    return {
+        'total_users': total_users,
+        'blocked_users': blocked_users,
+        'admin_users': admin_users,
+        'today_buyers': today_buyers,
+        'recent_users': recent_users
+    }
+
+async def view_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """View all users summary - FIXED VERSION"""
+    admin_id = update.effective_user.id
+    
+    if not is_admin(admin_id):
+        await update.message.reply_text("❌ Unauthorized!")
+        return
+    
+    if not has_permission(admin_id, 'view_users'):
+        await update.message.reply_text("❌ You don't have permission to view users!")
+        return
+    
+    try:
+        overview = await run_db(get_user_overview)
+        total_users = overview['total_users']
+        blocked_users = overview['blocked_users']
+        admin_users = overview['admin_users']
+        today_buyers = overview['today_buyers']
+        recent_users = overview['recent_users']
         
         text = f"""👥 **USER STATISTICS**
 
@@ -3276,8 +4958,6 @@ async def view_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Error in view_users: {e}")
         text = "❌ An error occurred while fetching user data. Please try again."
-    finally:
-        conn.close()
 
     # Add back button for callback
     if update.callback_query:
@@ -3299,14 +4979,11 @@ async def view_payment_methods(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text("❌ You don't have permission to view payment methods!")
         return
     
-    # Update payment methods
-    update_payment_methods_global()
-    
     text = """💳 **PAYMENT METHODS**
 
 📋 **Current Payment Details:**"""
     
-    for method_key, method_data in PAYMENT_METHODS.items():
+    for method_key, method_data in get_payment_methods().items():
         text += f"\n\n🔸 **{method_data['name']}:**"
         
         if method_key in ['easypaisa', 'jazzcash', 'upi']:
@@ -3344,6 +5021,76 @@ async def view_payment_methods(update: Update, context: ContextTypes.DEFAULT_TYP
     else:
         await update.message.reply_text(text, parse_mode='Markdown')
 
+# ========== STATISTICS ==========
+def collect_stats():
+    """Gather the figures shown by show_stats in two aggregate queries.
+    
+    Sales figures come from the daily_sales rollup only; transactions and keys_stock are not scanned.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''SELECT COUNT(*), COALESCE(SUM(is_blocked = 1), 0), COALESCE(SUM(is_admin = 1), 0)
+                          FROM users''')
+        total_users, blocked_users, total_admins = cursor.fetchone()
+        
+        # Sales per key type: all time, today, the last 7 days (today included) and this month
+        today, _ = day_window('today')
+        week_start, _ = day_window('last_7_days')
+        month_start, _ = day_window('this_month')
+        cursor.execute('''SELECT key_type, 
+                                 SUM(sales_count), SUM(amount),
+                                 SUM(CASE WHEN day >= ? THEN sales_count ELSE 0 END),
+                                 SUM(CASE WHEN day >= ? THEN amount ELSE 0 END),
+                                 SUM(CASE WHEN day >= ? THEN amount ELSE 0 END),
+                                 SUM(CASE WHEN day >= ? THEN amount ELSE 0 END)
+                          FROM daily_sales 
+                          GROUP BY key_type''', (today, today, week_start, month_start))
+        sales = cursor.fetchall()
+    finally:
+        conn.close()
+    
+    keys_sold_by_type = {key_type: count for key_type, count, *_ in sales if key_type}
+    return {
+        'total_users': total_users,
+        'blocked_users': blocked_users,
+        'total_admins': total_admins,
+        'total_transactions': sum(row[1] for row in sales),
+        'total_revenue': sum(row[2] for row in sales),
+        'today_transactions': sum(row[3] for row in sales),
+        'today_revenue': sum(row[4] for row in sales),
+        'week_revenue': sum(row[5] for row in sales),
+        'month_revenue': sum(row[6] for row in sales),
+        'total_keys_sold': sum(keys_sold_by_type.values()),
+        'today_keys_sold': sum(row[3] for row in sales if row[0]),
+        'keys_sold_by_type': keys_sold_by_type
+    }
+
+# Latest collect_stats() result, shared by every admin viewing stats within STATS_CACHE_TTL
+_stats_snapshot = None
+_stats_taken_at = 0.0  # time.monotonic() of the snapshot
+_stats_collected_at = None  # Wall clock time of the snapshot, for display
+_stats_lock = asyncio.Lock()
+STATS_CACHE_STATS = {'hits': 0, 'refreshes': 0}
+
+async def get_stats_snapshot():
+    """Cached stats and their age in seconds; concurrent callers share a single refresh"""
+    global _stats_snapshot, _stats_taken_at, _stats_collected_at
+    
+    async with _stats_lock:
+        age = time.monotonic() - _stats_taken_at
+        if _stats_snapshot is None or age >= STATS_CACHE_TTL:
+            _stats_snapshot = await run_db(collect_stats)
+            _stats_taken_at = time.monotonic()
+            _stats_collected_at = business_now()
+            STATS_CACHE_STATS['refreshes'] += 1
+            age = 0.0
+        else:
+            STATS_CACHE_STATS['hits'] += 1
+        return _stats_snapshot, _stats_collected_at, age
+
+
 async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show bot statistics - FIXED VERSION"""
     admin_id = update.effective_user.id
@@ -3356,62 +5103,28 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ You don't have permission to view statistics!")
         return
     
-    conn = sqlite3.connect('atoplay_bot.db')
-    cursor = conn.cursor()
-    
     try:
-        # Get total users
-        cursor.execute('SELECT COUNT(*) FROM users')
-        total_users_result = cursor.fetchone()
-        total_users = total_users_result[0] if total_users_result else 0
-        
-        # Get total blocked users
-        cursor.execute('SELECT COUNT(*) FROM users WHERE is_blocked = 1')
-        blocked_users_result = cursor.fetchone()
-        blocked_users = blocked_users_result[0] if blocked_users_result else 0
-        
-        # Get total admins
-        cursor.execute('SELECT COUNT(*) FROM users WHERE is_admin = 1')
-        total_admins_result = cursor.fetchone()
-        total_admins = total_admins_result[0] if total_admins_result else 0
-        
-        # Get total transactions
-        cursor.execute('SELECT COUNT(*) FROM transactions')
-        total_transactions_result = cursor.fetchone()
-        total_transactions = total_transactions_result[0] if total_transactions_result else 0
-        
-        # Get total approved transactions amount
-        cursor.execute('SELECT SUM(amount) FROM transactions WHERE status = "approved"')
-        total_revenue_result = cursor.fetchone()
-        total_revenue = total_revenue_result[0] if total_revenue_result else 0
-        
-        # Get today's transactions
-        cursor.execute('''SELECT COUNT(*), SUM(amount) FROM transactions 
-                          WHERE DATE(created_at) = DATE('now') AND status = "approved"''')
-        today_data = cursor.fetchone()
-        today_transactions = today_data[0] if today_data and today_data[0] else 0
-        today_revenue = today_data[1] if today_data and today_data[1] else 0
-        
-        # Get stock info
-        stock_info = get_stock_info()
-        
-        # Get total keys sold
-        cursor.execute('SELECT COUNT(*) FROM keys_stock WHERE status = "used"')
-        total_keys_sold_result = cursor.fetchone()
-        total_keys_sold = total_keys_sold_result[0] if total_keys_sold_result else 0
-        
-        # Get today's keys sold
-        cursor.execute('''SELECT COUNT(*) FROM keys_stock 
-                          WHERE status = "used" AND DATE(used_at) = DATE('now')''')
-        today_keys_sold_result = cursor.fetchone()
-        today_keys_sold = today_keys_sold_result[0] if today_keys_sold_result else 0
-        
+        stats, collected_at, age = await get_stats_snapshot()
     except Exception as e:
         logger.error(f"Error in show_stats: {e}")
-        text = "❌ An error occurred while fetching statistics. Please try again."
         return
-    finally:
-        conn.close()
+    
+    total_users = stats['total_users']
+    blocked_users = stats['blocked_users']
+    total_admins = stats['total_admins']
+    total_transactions = stats['total_transactions']
+    total_revenue = stats['total_revenue']
+    today_transactions = stats['today_transactions']
+    today_revenue = stats['today_revenue']
+    stock_info = get_stock_info()
+    total_keys_sold = stats['total_keys_sold']
+    today_keys_sold = stats['today_keys_sold']
+    keys_sold_by_type = stats['keys_sold_by_type']
+    sold_breakdown = ', '.join(f"{product['key_type'].upper()}: {keys_sold_by_type.get(product['key_type'], 0)}"
+                               for product in list_products())
+    
+    db_stats = DB_POOL.stats()
+    send_stats = OUTBOX.stats()
     
     text = f"""📊 **BOT STATISTICS**
 
@@ -3424,25 +5137,44 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 💰 **Revenue:**
 • **Total Revenue:** ₹{total_revenue}
 • **Today's Revenue:** ₹{today_revenue}
+• **Last 7 Days:** ₹{stats['week_revenue']}
+• **This Month:** ₹{stats['month_revenue']}
 
 💳 **Transactions:**
-• **Total Transactions:** {total_transactions}
+• **Approved Transactions:** {total_transactions}
 • **Today's Transactions:** {today_transactions}
 
 📦 **Stock & Sales:**
-• **3-Day Keys:** {stock_info.get('3d', 0)} available
-• **10-Day Keys:** {stock_info.get('10d', 0)} available
-• **30-Day Keys:** {stock_info.get('30d', 0)} available
-• **Total Keys Sold:** {total_keys_sold}
+{stock_lines(stock_info, bold=True)}
+• **Total Keys Sold:** {total_keys_sold} ({sold_breakdown})
 • **Today's Keys Sold:** {today_keys_sold}
 
-⏰ **Last Updated:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"""
+🗄️ **Database:**
+• **Connections Opened:** {db_stats['opened']}
+• **Connections Reused:** {db_stats['borrowed'] - db_stats['opened']}
+• **Permission Cache:** {PERMISSION_CACHE_STATS['hits']} hits / {PERMISSION_CACHE_STATS['misses']} misses
+• **Stats Cache:** {STATS_CACHE_STATS['hits']} hits / {STATS_CACHE_STATS['refreshes']} refreshes
+
+📤 **Outbound Queue:**
+• **Queued:** {send_stats['depth']} (+{send_stats['delayed']} throttled, peak {send_stats['max_depth']})
+• **Sent / Failed:** {send_stats['sent']} / {send_stats['failed']}
+• **Retries:** {send_stats['retried']} ({send_stats['rate_limited']} flood waits)
+
+⏰ **Last Updated:** {collected_at.strftime('%Y-%m-%d %H:%M:%S %Z')} ({format_age(age)} ago, refreshed every {format_age(STATS_CACHE_TTL)})"""
     
     # Add back button for callback
     if update.callback_query:
-        keyboard = [[InlineKeyboardButton("🔙 Back to Admin Panel", callback_data='admin_back')]]
+        keyboard = [
+            [InlineKeyboardButton("🔄 Refresh", callback_data='admin_stats')],
+            [InlineKeyboardButton("🔙 Back to Admin Panel", callback_data='admin_back')]
+        ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+        try:
+            await update.callback_query.edit_message_text(text, reply_markup=reply_markup, parse_mode='Markdown')
+        except BadRequest as e:
+            # Refresh tapped again within the same second - nothing changed
+            if 'not modified' not in str(e).lower():
+                raise
     else:
         await update.message.reply_text(text, parse_mode='Markdown')
 
@@ -3452,12 +5184,7 @@ async def check_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         user_id = update.effective_user.id
         
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT unique_id, balance, is_blocked FROM users WHERE telegram_id = ?', (user_id,))
-        user_data = cursor.fetchone()
-        conn.close()
+        user_data = await db_fetchone('SELECT unique_id, balance, is_blocked FROM users WHERE telegram_id = ?', (user_id,))
         
         if user_data:
             unique_id, balance, is_blocked = user_data
@@ -3485,67 +5212,154 @@ Use /buy → Add Balance
     except Exception as e:
         logger.error(f"Error in check_balance: {e}")
 
+USER_KEYS_SELECT = '''SELECT user_key_id, key_value, key_type, strftime('%Y-%m-%d %H:%M', purchased_at), status,
+                             CAST(strftime('%s', purchased_at) AS INTEGER)
+                      FROM user_keys 
+                      WHERE user_id = ? '''
+USER_KEYS_PAGE_SQL = USER_KEYS_SELECT + 'ORDER BY purchased_at DESC, user_key_id DESC LIMIT ?'
+# Cursor pages: older keys (Next) and newer keys (Prev, read upwards from the cursor)
+USER_KEYS_OLDER_SQL = USER_KEYS_SELECT + '''AND (purchased_at, user_key_id) < (datetime(?, 'unixepoch'), ?) 
+                                           ORDER BY purchased_at DESC, user_key_id DESC LIMIT ?'''
+USER_KEYS_NEWER_SQL = USER_KEYS_SELECT + '''AND (purchased_at, user_key_id) > (datetime(?, 'unixepoch'), ?) 
+                                           ORDER BY purchased_at ASC, user_key_id ASC LIMIT ?'''
+
+def get_user_keys_page(user_db_id, cursor_key=None, backwards=False, limit=MY_KEYS_PAGE_SIZE):
+    """Newest-first page of a user's keys next to the (purchased_epoch, user_key_id) cursor.
+    
+    Keyset pagination on (user_id, purchased_at, user_key_id) - served by idx_user_keys_user_purchased.
+    backwards=True returns the page before the cursor (still newest first).
+    Returns (rows, has_more); rows are (user_key_id, key_value, key_type, purchase_time, status, purchased_epoch).
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    if cursor_key is None:
+        cursor.execute(USER_KEYS_PAGE_SQL, (user_db_id, limit + 1))
+    else:
+        query = USER_KEYS_NEWER_SQL if backwards else USER_KEYS_OLDER_SQL
+        cursor.execute(query, (user_db_id, *cursor_key, limit + 1))
+    rows = cursor.fetchall()
+    conn.close()
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    return rows, has_more
+
+async def show_my_keys_page(update: Update, context: ContextTypes.DEFAULT_TYPE, page=1, cursor_key=None, backwards=False):
+    """One page of the user's key history with Prev/Next buttons"""
+    user_id = update.effective_user.id
+    reply = update.callback_query.edit_message_text if update.callback_query else update.message.reply_text
+    
+    user_data = await db_fetchone('SELECT user_id, unique_id, is_blocked, keys_count FROM users WHERE telegram_id = ?',
+                                  (user_id,))
+    
+    if not user_data:
+        await reply("❌ Account not found! Use /start")
+        return
+    
+    user_db_id, unique_id, is_blocked, keys_count = user_data
+    
+    if is_blocked == 1:
+        await reply("❌ You are blocked from using this bot!")
+        return
+    
+    if not keys_count:
+        await reply(f"""🔑 **My Keys**
+
+🆔 **Your ID:** `{unique_id}`
+📦 **No keys purchased yet.**
+
+🛒 Use /buy to purchase your first key!""", parse_mode='Markdown')
+        return
+    
+    rows, has_more = await run_db(get_user_keys_page, user_db_id, cursor_key, backwards)
+    total_pages = max(1, math.ceil(keys_count / MY_KEYS_PAGE_SIZE))
+    page = min(max(1, page), total_pages)
+    
+    text = f"""🔑 **My Keys**
+
+🆔 **Your ID:** `{unique_id}`
+📦 **Total Keys:** {keys_count}
+
+📋 **Your Purchased Keys** (page {page}/{total_pages}):"""
+    
+    first_number = (page - 1) * MY_KEYS_PAGE_SIZE + 1
+    for i, (_, key_value, key_type, purchase_time, status, _) in enumerate(rows, first_number):
+        days = product_days(key_type)
+        text += f"\n\n{i}. 🔑 **Key:** `{key_value}`"
+        text += f"\n   📅 **Type:** {days}-Day"
+        text += f"\n   🕒 **Purchased:** {purchase_time}"
+        text += f"\n   📊 **Status:** {status}"
+    
+    # Going backwards, has_more means there are newer keys; going forwards, older ones
+    has_newer = has_more if backwards else page > 1
+    has_older = True if backwards else has_more
+    
+    navigation = []
+    if rows and has_newer:
+        first = rows[0]
+        navigation.append(InlineKeyboardButton("◀️ Prev", callback_data=f'mk_p_{page - 1}_{first[5]}_{first[0]}'))
+    if rows and has_older:
+        last_row = rows[-1]
+        navigation.append(InlineKeyboardButton("Next ▶️", callback_data=f'mk_n_{page + 1}_{last_row[5]}_{last_row[0]}'))
+    reply_markup = InlineKeyboardMarkup([navigation]) if navigation else None
+    
+    await reply(text, parse_mode='Markdown', reply_markup=reply_markup)
+
 async def my_keys(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         await update.message.chat.send_action(action="typing")
-        
-        user_id = update.effective_user.id
-        
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT user_id, unique_id, is_blocked FROM users WHERE telegram_id = ?', (user_id,))
+        await show_my_keys_page(update, context)
+    
+    except Exception as e:
+        logger.error(f"Error in my_keys: {e}")
+
+async def my_keys_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """mk_<n|p>_<page>_<purchased_epoch>_<user_key_id> - older/newer page next to that key"""
+    _, direction, page, purchased_epoch, user_key_id = update.callback_query.data.split('_')
+    await show_my_keys_page(update, context, int(page), (int(purchased_epoch), int(user_key_id)),
+                            backwards=direction == 'p')
+
+def set_user_blocked(target_user_id, blocked, reason, admin_id):
+    """Block or unblock a user - returns (telegram_id, username) or None if not found"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        # Check if user exists
+        cursor.execute('SELECT user_id, telegram_id, username FROM users WHERE telegram_id = ?', (target_user_id,))
         user_data = cursor.fetchone()
         
         if not user_data:
-            await update.message.reply_text("❌ Account not found! Use /start")
-            conn.close()
-            return
-        
-        user_db_id, unique_id, is_blocked = user_data
-        
-        if is_blocked == 1:
-            await update.message.reply_text("❌ You are blocked from using this bot!")
-            conn.close()
-            return
-        
-        # Get user's purchased keys
-        cursor.execute('''SELECT key_value, key_type, 
-                                 strftime('%Y-%m-%d %H:%M', purchased_at) as purchase_time,
-                                 status
-                          FROM user_keys 
-                          WHERE user_id = ? 
-                          ORDER BY purchased_at DESC''', (user_db_id,))
+            return None
         
-        keys = cursor.fetchall()
-        conn.close()
+        target_db_id, target_telegram_id, username = user_data
         
-        if not keys:
-            text = f"""🔑 **My Keys**
-
-🆔 **Your ID:** `{unique_id}`
-📦 **No keys purchased yet.**
-
-🛒 Use /buy to purchase your first key!"""
+        # Update user status
+        if blocked:
+            cursor.execute('''UPDATE users 
+                              SET is_blocked = 1, blocked_reason = ?, blocked_at = CURRENT_TIMESTAMP
+                              WHERE telegram_id = ?''',
+                           (reason, target_user_id))
         else:
-            text = f"""🔑 **My Keys**
-
-🆔 **Your ID:** `{unique_id}`
-📦 **Total Keys:** {len(keys)}
-
-📋 **Your Purchased Keys:**"""
-            
-            for i, (key_value, key_type, purchase_time, status) in enumerate(keys, 1):
-                days = 3 if key_type == '3d' else (10 if key_type == '10d' else 30)
-                text += f"\n\n{i}. 🔑 **Key:** `{key_value}`"
-                text += f"\n   📅 **Type:** {days}-Day"
-                text += f"\n   🕒 **Purchased:** {purchase_time}"
-                text += f"\n   📊 **Status:** {status}"
+            cursor.execute('''UPDATE users 
+                              SET is_blocked = 0, blocked_reason = NULL, blocked_at = NULL
+                              WHERE telegram_id = ?''',
+                           (target_user_id,))
         
-        await update.message.reply_text(text, parse_mode='Markdown')
+        # Log admin action
+        if blocked:
+            log_admin_action(admin_id, 'block_user', target_db_id, f"Reason: {reason}", cursor=cursor)
+        else:
+            log_admin_action(admin_id, 'unblock_user', target_db_id, "", cursor=cursor)
         
-    except Exception as e:
-        logger.error(f"Error in my_keys: {e}")
+        conn.commit()
+    finally:
+        conn.close()
+    
+    return target_telegram_id, username
 
 async def block_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Block a user"""
@@ -3575,36 +5389,18 @@ async def block_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         reason = " ".join(parts[2:])
         
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        
-        # Check if user exists
-        cursor.execute('SELECT telegram_id, username FROM users WHERE telegram_id = ?', (target_user_id,))
-        user_data = cursor.fetchone()
+        user_data = await run_db(set_user_blocked, target_user_id, True, reason, admin_id)
         
         if not user_data:
             await update.message.reply_text(f"❌ User with ID {target_user_id} not found!")
-            conn.close()
             return
         
         target_telegram_id, username = user_data
         
-        # Update user status
-        cursor.execute('''UPDATE users 
-                          SET is_blocked = 1, blocked_reason = ?, blocked_at = CURRENT_TIMESTAMP
-                          WHERE telegram_id = ?''',
-                       (reason, target_user_id))
-        
-        conn.commit()
-        
-        # Log admin action
-        cursor.execute('SELECT user_id FROM users WHERE telegram_id = ?', (target_user_id,))
-        target_db_id = cursor.fetchone()[0]
-        log_admin_action(admin_id, 'block_user', target_db_id, f"Reason: {reason}")
-        
         # Notify user
         try:
-            await context.bot.send_message(
+            await OUTBOX.send(
+                context.bot, 'send_message', PRIORITY_NOTICE,
                 chat_id=target_user_id,
                 text=f"""❌ **You have been blocked!**
 
@@ -3634,7 +5430,6 @@ You have been blocked from using the Atoplay Shop bot.
             parse_mode='Markdown'
         )
         
-        conn.close()
         logger.info(f"User {target_user_id} blocked by admin {admin_id}")
         
     except Exception as e:
@@ -3666,36 +5461,18 @@ async def unblock_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Invalid user ID!")
             return
         
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        
-        # Check if user exists
-        cursor.execute('SELECT telegram_id, username FROM users WHERE telegram_id = ?', (target_user_id,))
-        user_data = cursor.fetchone()
+        user_data = await run_db(set_user_blocked, target_user_id, False, None, admin_id)
         
         if not user_data:
             await update.message.reply_text(f"❌ User with ID {target_user_id} not found!")
-            conn.close()
             return
         
         target_telegram_id, username = user_data
         
-        # Update user status
-        cursor.execute('''UPDATE users 
-                          SET is_blocked = 0, blocked_reason = NULL, blocked_at = NULL
-                          WHERE telegram_id = ?''',
-                       (target_user_id,))
-        
-        conn.commit()
-        
-        # Log admin action
-        cursor.execute('SELECT user_id FROM users WHERE telegram_id = ?', (target_user_id,))
-        target_db_id = cursor.fetchone()[0]
-        log_admin_action(admin_id, 'unblock_user', target_db_id, "")
-        
         # Notify user
         try:
-            await context.bot.send_message(
+            await OUTBOX.send(
+                context.bot, 'send_message', PRIORITY_NOTICE,
                 chat_id=target_user_id,
                 text=f"""✅ **You have been unblocked!**
 
@@ -3723,12 +5500,17 @@ Your access to Atoplay Shop bot has been restored.
             parse_mode='Markdown'
         )
         
-        conn.close()
         logger.info(f"User {target_user_id} unblocked by admin {admin_id}")
         
     except Exception as e:
         logger.error(f"Error in unblock_user: {e}")
 
+USER_PURCHASE_TOTALS_SQL = '''SELECT COUNT(*), COALESCE(SUM(amount), 0),
+                                     (SELECT keys_count FROM users WHERE telegram_id = ?)
+                              FROM transactions 
+                              WHERE user_id = (SELECT user_id FROM users WHERE telegram_id = ?)
+                              AND status = 'approved' '''
+
 async def user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Get user information"""
     try:
@@ -3755,44 +5537,22 @@ async def user_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Invalid user ID!")
             return
         
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        
         # Get user details
-        cursor.execute('''SELECT telegram_id, username, unique_id, balance, 
-                                 is_blocked, blocked_reason, blocked_at, is_admin,
-                                 strftime('%Y-%m-%d %H:%M', blocked_at) as blocked_time
-                          FROM users WHERE telegram_id = ?''', (target_user_id,))
-        
-        user_data = cursor.fetchone()
+        user_data = await db_fetchone('''SELECT telegram_id, username, unique_id, balance, 
+                                                is_blocked, blocked_reason, blocked_at, is_admin,
+                                                strftime('%Y-%m-%d %H:%M', blocked_at) as blocked_time
+                                         FROM users WHERE telegram_id = ?''', (target_user_id,))
         
         if not user_data:
             await update.message.reply_text(f"❌ User with ID {target_user_id} not found!")
-            conn.close()
             return
         
         (telegram_id, username, unique_id, balance, is_blocked, 
          blocked_reason, blocked_at, is_admin_user, blocked_time) = user_data
         
-        # Get user's purchase history
-        cursor.execute('''SELECT COUNT(*), SUM(amount) 
-                          FROM transactions 
-                          WHERE user_id = (SELECT user_id FROM users WHERE telegram_id = ?)
-                          AND status = 'approved' ''', (target_user_id,))
-        
-        purchase_data = cursor.fetchone()
-        total_purchases = purchase_data[0] or 0
-        total_spent = purchase_data[1] or 0
-        
-        # Get user's keys
-        cursor.execute('''SELECT COUNT(*) 
-                          FROM user_keys 
-                          WHERE user_id = (SELECT user_id FROM users WHERE telegram_id = ?)''', 
-                       (target_user_id,))
-        
-        keys_count = cursor.fetchone()[0] or 0
-        
-        conn.close()
+        # Get user's purchase history and keys
+        total_purchases, total_spent, keys_count = await db_fetchone(USER_PURCHASE_TOTALS_SQL,
+                                                                     (target_user_id, target_user_id))
         
         text = f"""📋 **USER INFORMATION**
 
@@ -3849,13 +5609,13 @@ async def set_easypaisa(update: Update, context: ContextTypes.DEFAULT_TYPE):
         account_name = " ".join(parts[2:]) if len(parts) > 2 else ""
         
         # Update Easypaisa in database
-        update_payment_method('easypaisa', {
+        await run_db(update_payment_method, 'easypaisa', {
             'number': number,
             'account_name': account_name
         })
         
         # Log admin action
-        log_admin_action(admin_id, 'set_easypaisa', 0, f"Number: {number}, Account: {account_name}")
+        await run_db(log_admin_action, admin_id, 'set_easypaisa', 0, f"Number: {number}, Account: {account_name}")
         
         await update.message.reply_text(
             f"""✅ **Easypaisa Updated Successfully!**
@@ -3897,13 +5657,13 @@ async def set_jazzcash(update: Update, context: ContextTypes.DEFAULT_TYPE):
         account_name = " ".join(parts[2:]) if len(parts) > 2 else ""
         
         # Update JazzCash in database
-        update_payment_method('jazzcash', {
+        await run_db(update_payment_method, 'jazzcash', {
             'number': number,
             'account_name': account_name
         })
         
         # Log admin action
-        log_admin_action(admin_id, 'set_jazzcash', 0, f"Number: {number}, Account: {account_name}")
+        await run_db(log_admin_action, admin_id, 'set_jazzcash', 0, f"Number: {number}, Account: {account_name}")
         
         await update.message.reply_text(
             f"""✅ **JazzCash Updated Successfully!**
@@ -3944,10 +5704,10 @@ async def set_binance(update: Update, context: ContextTypes.DEFAULT_TYPE):
         pay_id = parts[1]
         
         # Update Binance in database
-        update_payment_method('binance', {'pay_id': pay_id})
+        await run_db(update_payment_method, 'binance', {'pay_id': pay_id})
         
         # Log admin action
-        log_admin_action(admin_id, 'set_binance', 0, f"Pay ID: {pay_id}")
+        await run_db(log_admin_action, admin_id, 'set_binance', 0, f"Pay ID: {pay_id}")
         
         await update.message.reply_text(
             f"""✅ **Binance Updated Successfully!**
@@ -3988,13 +5748,13 @@ async def set_upi(update: Update, context: ContextTypes.DEFAULT_TYPE):
         account_name = " ".join(parts[2:]) if len(parts) > 2 else ""
         
         # Update UPI in database
-        update_payment_method('upi', {
+        await run_db(update_payment_method, 'upi', {
             'number': number,
             'account_name': account_name
         })
         
         # Log admin action
-        log_admin_action(admin_id, 'set_upi', 0, f"Number: {number}, Account: {account_name}")
+        await run_db(log_admin_action, admin_id, 'set_upi', 0, f"Number: {number}, Account: {account_name}")
         
         await update.message.reply_text(
             f"""✅ **UPI Updated Successfully!**
@@ -4060,13 +5820,13 @@ async def handle_upi_qr_code_setup(update: Update, context: ContextTypes.DEFAULT
         file_id = photo.file_id
         
         # Update UPI QR code in database
-        update_payment_method('upi', {'qr_code': file_id})
+        await run_db(update_payment_method, 'upi', {'qr_code': file_id})
         
         # Clear the flag
         context.user_data.pop('awaiting_upi_qr_code', None)
         
         # Log admin action
-        log_admin_action(admin_id, 'set_upi_qr_code', 0, "UPI QR code updated")
+        await run_db(log_admin_action, admin_id, 'set_upi_qr_code', 0, "UPI QR code updated")
         
         await update.message.reply_text(
             f"""✅ **UPI QR Code Updated Successfully!**
@@ -4132,13 +5892,13 @@ async def handle_binance_qr_code_setup(update: Update, context: ContextTypes.DEF
         file_id = photo.file_id
         
         # Update Binance QR code in database
-        update_payment_method('binance', {'qr_code': file_id})
+        await run_db(update_payment_method, 'binance', {'qr_code': file_id})
         
         # Clear the flag
         context.user_data.pop('awaiting_binance_qr_code', None)
         
         # Log admin action
-        log_admin_action(admin_id, 'set_binance_qr_code', 0, "Binance QR code updated")
+        await run_db(log_admin_action, admin_id, 'set_binance_qr_code', 0, "Binance QR code updated")
         
         await update.message.reply_text(
             f"""✅ **Binance QR Code Updated Successfully!**
@@ -4156,6 +5916,80 @@ async def handle_binance_qr_code_setup(update: Update, context: ContextTypes.DEF
         logger.error(f"Error in handle_binance_qr_code_setup: {e}")
         await update.message.reply_text("❌ An error occurred while updating Binance QR code. Please try again.")
 
+def grant_admin(new_admin_id, admin_id):
+    """Make a user admin with default permissions.
+    
+    Returns (status, username) where status is 'ok', 'no_user' or 'already_admin'.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        # Check if user exists
+        cursor.execute('SELECT user_id, username, is_admin FROM users WHERE telegram_id = ?', (new_admin_id,))
+        user_data = cursor.fetchone()
+        
+        if not user_data:
+            return 'no_user', None
+        
+        target_db_id, username, is_admin_user = user_data
+        
+        # Check if already admin
+        if is_admin_user == 1:
+            return 'already_admin', username
+        
+        # Make user admin with default permissions (only approve payments)
+        cursor.execute('UPDATE users SET is_admin = 1, added_by = ?, permission_mask = ? WHERE telegram_id = ?',
+                       (admin_id, PERMISSION_BITS['approve_payments'], new_admin_id))
+        
+        # Log admin action
+        log_admin_action(admin_id, 'add_admin', target_db_id, f"Added new admin: {username}", cursor=cursor)
+        
+        conn.commit()
+    finally:
+        conn.close()
+    
+    invalidate_admin_cache(new_admin_id)
+    refresh_admin_cache()
+    return 'ok', username
+
+def revoke_admin(target_admin_id, admin_id):
+    """Remove admin privileges from a user.
+    
+    Returns (status, username) where status is 'ok', 'no_user' or 'not_admin'.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    try:
+        # Check if user exists and is admin
+        cursor.execute('SELECT user_id, username, is_admin FROM users WHERE telegram_id = ?', (target_admin_id,))
+        user_data = cursor.fetchone()
+        
+        if not user_data:
+            return 'no_user', None
+        
+        target_db_id, username, is_admin_user = user_data
+        
+        if is_admin_user != 1:
+            return 'not_admin', username
+        
+        # Remove admin privileges
+        cursor.execute('''UPDATE users SET is_admin = 0, added_by = NULL, permission_mask = 0 
+                          WHERE telegram_id = ?''',
+                       (target_admin_id,))
+        
+        # Log admin action
+        log_admin_action(admin_id, 'remove_admin', target_db_id, f"Removed admin: {username}", cursor=cursor)
+        
+        conn.commit()
+    finally:
+        conn.close()
+    
+    invalidate_admin_cache(target_admin_id)
+    refresh_admin_cache()
+    return 'ok', username
+
 async def add_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Add new admin (Super Admin only)"""
     try:
@@ -4178,46 +6012,20 @@ async def add_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ Invalid user ID!")
             return
         
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        
-        # Check if user exists
-        cursor.execute('SELECT telegram_id, username FROM users WHERE telegram_id = ?', (new_admin_id,))
-        user_data = cursor.fetchone()
+        status, username = await run_db(grant_admin, new_admin_id, admin_id)
         
-        if not user_data:
+        if status == 'no_user':
             await update.message.reply_text(f"❌ User with ID {new_admin_id} not found!")
-            conn.close()
             return
         
-        target_telegram_id, username = user_data
-        
-        # Check if already admin
-        cursor.execute('SELECT is_admin FROM users WHERE telegram_id = ?', (new_admin_id,))
-        is_admin_user = cursor.fetchone()
-        
-        if is_admin_user and is_admin_user[0] == 1:
+        if status == 'already_admin':
             await update.message.reply_text(f"❌ User @{username} is already an admin!")
-            conn.close()
             return
         
-        # Make user admin with default permissions (only approve payments)
-        default_permissions = ADMIN_PERMISSIONS.copy()
-        default_permissions['approve_payments'] = True
-        
-        cursor.execute('UPDATE users SET is_admin = 1, added_by = ?, permissions = ? WHERE telegram_id = ?',
-                       (admin_id, str(default_permissions), new_admin_id))
-        
-        conn.commit()
-        
-        # Log admin action
-        cursor.execute('SELECT user_id FROM users WHERE telegram_id = ?', (new_admin_id,))
-        target_db_id = cursor.fetchone()[0]
-        log_admin_action(admin_id, 'add_admin', target_db_id, f"Added new admin: {username}")
-        
         # Notify new admin
         try:
-            await context.bot.send_message(
+            await OUTBOX.send(
+                context.bot, 'send_message', PRIORITY_NOTICE,
                 chat_id=new_admin_id,
                 text=f"""🎉 **Congratulations!**
 
@@ -4249,7 +6057,6 @@ You have been promoted to Admin in Atoplay Shop bot.
             parse_mode='Markdown'
         )
         
-        conn.close()
         logger.info(f"Admin {new_admin_id} added by Super Admin {admin_id}")
         
     except Exception as e:
@@ -4282,39 +6089,20 @@ async def remove_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ You cannot remove yourself as admin!")
             return
         
-        conn = sqlite3.connect('atoplay_bot.db')
-        cursor = conn.cursor()
-        
-        # Check if user exists and is admin
-        cursor.execute('SELECT telegram_id, username, is_admin FROM users WHERE telegram_id = ?', (target_admin_id,))
-        user_data = cursor.fetchone()
+        status, username = await run_db(revoke_admin, target_admin_id, admin_id)
         
-        if not user_data:
+        if status == 'no_user':
             await update.message.reply_text(f"❌ User with ID {target_admin_id} not found!")
-            conn.close()
             return
         
-        target_telegram_id, username, is_admin_user = user_data
-        
-        if is_admin_user != 1:
+        if status == 'not_admin':
             await update.message.reply_text(f"❌ User @{username} is not an admin!")
-            conn.close()
             return
         
-        # Remove admin privileges
-        cursor.execute('UPDATE users SET is_admin = 0, added_by = NULL, permissions = "{}" WHERE telegram_id = ?',
-                       (target_admin_id,))
-        
-        conn.commit()
-        
-        # Log admin action
-        cursor.execute('SELECT user_id FROM users WHERE telegram_id = ?', (target_admin_id,))
-        target_db_id = cursor.fetchone()[0]
-        log_admin_action(admin_id, 'remove_admin', target_db_id, f"Removed admin: {username}")
-        
         # Notify removed admin
         try:
-            await context.bot.send_message(
+            await OUTBOX.send(
+                context.bot, 'send_message', PRIORITY_NOTICE,
                 chat_id=target_admin_id,
                 text=f"""📢 **Notice**
 
@@ -4343,7 +6131,6 @@ Your admin privileges have been removed from Atoplay Shop bot.
             parse_mode='Markdown'
         )
         
-        conn.close()
         logger.info(f"Admin {target_admin_id} removed by Super Admin {admin_id}")
         
     except Exception as e:
@@ -4362,7 +6149,7 @@ async def list_admins(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("❌ You don't have permission to list admins!")
             return
         
-        admins = get_all_admins()
+        admins = await run_db(get_all_admins)
         
         text = "👑 **ADMIN LIST**\n\n"
         
@@ -4390,14 +6177,226 @@ async def list_admins(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Error in list_admins: {e}")
 
+async def warm_caches():
+    """Load the admin cache and stock counters through run_db if they are cold or stale.
+    
+    is_admin, has_permission, menu_mask and get_stock_info are plain calls from async handlers;
+    with these caches warm they never query sqlite on the event loop.
+    """
+    if not admin_cache_ready():
+        await run_db(refresh_admin_cache)
+    if not _stock_loaded:
+        await run_db(reconcile_stock_counters)
+
+async def warm_caches_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs ahead of every other handler (group -1)"""
+    await warm_caches()
+
+async def post_init(application: Application):
+    """Warm the in-memory caches and start background maintenance"""
+    await run_db(reconcile_stock_counters)
+    await run_db(refresh_admin_cache)
+    application.bot_data['stock_reconcile_task'] = asyncio.create_task(stock_reconcile_loop())
+
+async def post_shutdown(application: Application):
+    """Stop background maintenance"""
+    task = application.bot_data.pop('stock_reconcile_task', None)
+    if task:
+        task.cancel()
+    await OUTBOX.stop()
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Log errors"""
     logger.error(f"Update {update} caused error {context.error}")
 
+# ========== CALLBACK ROUTING ==========
+SUPER_ADMIN_ONLY = 'super_admin'
+
+class CallbackRouter:
+    """callback_data -> (handler, permission, denied message).
+
+    Exact routes are a dict lookup; prefix routes live in a character trie and the
+    longest matching prefix wins, so lookup cost does not grow with the number of routes.
+    """
+    
+    def __init__(self):
+        self.exact = {}
+        self._trie = {}
+
+    def add(self, data, handler, permission=None, denied=None):
+        self.exact[data] = (handler, permission, denied)
+
+    def add_prefix(self, prefix, handler, permission=None, denied=None):
+        node = self._trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        # Characters are str keys, so None marks "a route ends here"
+        node[None] = (handler, permission, denied)
+
+    def resolve(self, data):
+        route = self.exact.get(data)
+        if route is not None:
+            return route
+        
+        node = self._trie
+        for char in data:
+            node = node.get(char)
+            if node is None:
+                break
+            route = node.get(None, route)
+        return route
+
+def route_allowed(user_id, permission):
+    """permission: None (anyone), SUPER_ADMIN_ONLY, a permission name or a tuple of alternatives"""
+    if permission is None:
+        return True
+    if permission == SUPER_ADMIN_ONLY:
+        return is_super_admin(user_id)
+    if isinstance(permission, tuple):
+        return any(has_permission(user_id, perm) for perm in permission)
+    return has_permission(user_id, permission)
+
+def prompt_route(text):
+    """Handler that just shows usage instructions (text may be a callable for live values)"""
+    async def show_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        message = text() if callable(text) else text
+        await update.callback_query.edit_message_text(message, parse_mode='Markdown')
+    return show_prompt
+
+async def cancel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        await update.callback_query.edit_message_text("❌ Cancelled!")
+    except Exception as e:
+        logger.error(f"Error editing message: {e}")
+
+CALLBACK_ROUTER = CallbackRouter()
+
+# Customer flow
+CALLBACK_ROUTER.add_prefix('product_', handle_product_selection)
+CALLBACK_ROUTER.add('add_balance', handle_add_balance)
+CALLBACK_ROUTER.add('use_balance', process_balance_purchase)
+CALLBACK_ROUTER.add('new_payment', handle_new_payment)
+CALLBACK_ROUTER.add('cancel', cancel_callback)
+CALLBACK_ROUTER.add_prefix('mk_', my_keys_page_callback)
+CALLBACK_ROUTER.add_prefix('payment_', handle_payment_selection)
+CALLBACK_ROUTER.add_prefix('amount_', handle_amount_selection)
+
+# Pending payments inbox
+CALLBACK_ROUTER.add('approval_inbox', pending_inbox_callback, 'approve_payments',
+                    "❌ You don't have permission to approve payments!")
+CALLBACK_ROUTER.add_prefix('inbox_after_', pending_inbox_callback, 'approve_payments',
+                           "❌ You don't have permission to approve payments!")
+CALLBACK_ROUTER.add_prefix('inbox_approve_', inbox_approve_callback, 'approve_payments',
+                           "❌ You don't have permission to approve payments!")
+CALLBACK_ROUTER.add_prefix('inbox_reject_', inbox_reject_callback, 'approve_payments',
+                           "❌ You don't have permission to approve payments!")
+CALLBACK_ROUTER.add_prefix('inbox_bulk_', inbox_bulk_approve_callback, 'approve_payments',
+                           "❌ You don't have permission to approve payments!")
+
+# Admin panel navigation
+CALLBACK_ROUTER.add('admin_back', admin_panel_callback)
+CALLBACK_ROUTER.add('admin_back_home', start_callback)
+CALLBACK_ROUTER.add('admin_stock', admin_stock_menu, 'view_stock',
+                    "❌ You don't have permission to access Stock Management!")
+CALLBACK_ROUTER.add('admin_prices', admin_prices_menu, ('change_prices', 'view_payments'),
+                    "❌ You don't have permission to access Price Management!")
+CALLBACK_ROUTER.add('admin_users', admin_users_menu, 'view_users',
+                    "❌ You don't have permission to access User Management!")
+CALLBACK_ROUTER.add('admin_payments', admin_payments_menu, 'view_payments',
+                    "❌ You don't have permission to access Payment Methods!")
+CALLBACK_ROUTER.add('admin_stats', show_stats, 'view_stats',
+                    "❌ You don't have permission to view Statistics!")
+CALLBACK_ROUTER.add('admin_settings', admin_settings_menu, 'manage_admins',
+                    "❌ Only Super Admin can access this section!")
+
+# Permissions (Super Admin)
+CALLBACK_ROUTER.add('set_permissions_menu', set_permissions_menu, SUPER_ADMIN_ONLY,
+                    "❌ Only Super Admin can set permissions!")
+CALLBACK_ROUTER.add('view_permissions', view_all_permissions, SUPER_ADMIN_ONLY,
+                    "❌ Only Super Admin can view permissions!")
+CALLBACK_ROUTER.add_prefix('select_admin_', select_admin_for_permissions, SUPER_ADMIN_ONLY,
+                           "❌ Only Super Admin can set permissions!")
+CALLBACK_ROUTER.add_prefix('toggle_', toggle_permission, SUPER_ADMIN_ONLY,
+                           "❌ Only Super Admin can set permissions!")
+CALLBACK_ROUTER.add_prefix('save_permissions_', save_permissions, SUPER_ADMIN_ONLY,
+                           "❌ Only Super Admin can set permissions!")
+
+# Stock management
+CALLBACK_ROUTER.add_prefix('addkey_', addkey_prompt_callback, 'add_keys',
+                           "❌ You don't have permission to add keys!")
+CALLBACK_ROUTER.add('importkeys_menu', prompt_route(
+    lambda: f"📥 **Import Keys From File**\n\nSend command: `/importkeys TYPE` ({key_type_list()}), then upload a .txt or .csv file with one key per line.\n\nLines may also be `KEY,TYPE` to mix types in one file.\n\n⚠️ Keys are saved EXACTLY as written (case sensitive). Existing keys are skipped."
+), 'add_keys', "❌ You don't have permission to add keys!")
+CALLBACK_ROUTER.add('delkey_menu', prompt_route(
+    "🗑️ **Delete Key**\n\nSend command: `/delkey KEYVALUE`\n\nExample: `/delkey ABC123`\n\n⚠️ Key must match EXACTLY (case sensitive)."
+), 'delete_keys', "❌ You don't have permission to delete keys!")
+CALLBACK_ROUTER.add('view_stock', show_stock, 'view_stock',
+                    "❌ You don't have permission to view stock!")
+CALLBACK_ROUTER.add_prefix('stk_', stock_page_callback, 'view_stock',
+                           "❌ You don't have permission to view stock!")
+
+# Price management
+CALLBACK_ROUTER.add_prefix('price_', price_prompt_callback, 'change_prices',
+                           "❌ You don't have permission to change prices!")
+CALLBACK_ROUTER.add('addproduct_menu', prompt_route(
+    "➕ **Add Product**\n\nSend command: `/addproduct KEY_TYPE DAYS PRICE [NAME]`\n\nExample: `/addproduct 7d 7 650 7-Day Key`\n\n⚠️ KEY_TYPE is 1-8 lowercase letters or digits, and every product needs its own price."
+), 'change_prices', "❌ You don't have permission to change prices!")
+CALLBACK_ROUTER.add('view_prices', view_prices, 'view_payments',
+                    "❌ You don't have permission to view prices!")
+
+# User management
+CALLBACK_ROUTER.add('block_user_menu', prompt_route(
+    "🚫 **Block User**\n\nSend command: `/block USER_ID REASON`\n\nExample: `/block 1234567 \"Spamming\"`"
+), 'block_users', "❌ You don't have permission to block users!")
+CALLBACK_ROUTER.add('unblock_user_menu', prompt_route(
+    "✅ **Unblock User**\n\nSend command: `/unblock USER_ID`\n\nExample: `/unblock 1234567`"
+), 'unblock_users', "❌ You don't have permission to unblock users!")
+CALLBACK_ROUTER.add('userinfo_menu', prompt_route(
+    "👤 **User Information**\n\nSend command: `/userinfo USER_ID`\n\nExample: `/userinfo 1234567`"
+), 'view_user_info', "❌ You don't have permission to view user info!")
+CALLBACK_ROUTER.add('view_users', view_users, 'view_users',
+                    "❌ You don't have permission to view users!")
+CALLBACK_ROUTER.add('manage_user_balance_menu', prompt_route(
+    "💰 **Manage User Balance**\n\nSend command: `/adjustbalance USER_ID AMOUNT`\n\nExamples:\n• `/adjustbalance 1234567 +500` - Add ₹500\n• `/adjustbalance 1234567 -200` - Subtract ₹200"
+), 'adjust_balance', "❌ You don't have permission to adjust balance!")
+
+# Payment methods
+CALLBACK_ROUTER.add('set_easypaisa_menu', prompt_route(
+    "📱 **Set Easypaisa Details**\n\nSend command: `/seteasypaisa NUMBER \"ACCOUNT NAME\"`\n\nExample: `/seteasypaisa 03431178575 \"John Doe\"`"
+), 'change_payments', "❌ You don't have permission to change payment methods!")
+CALLBACK_ROUTER.add('set_jazzcash_menu', prompt_route(
+    "📱 **Set JazzCash Details**\n\nSend command: `/setjazzcash NUMBER \"ACCOUNT NAME\"`\n\nExample: `/setjazzcash 03001234567 \"Ali Khan\"`"
+), 'change_payments', "❌ You don't have permission to change payment methods!")
+CALLBACK_ROUTER.add('set_binance_menu', prompt_route(
+    "💰 **Set Binance Pay ID**\n\nSend command: `/setbinance PAY_ID`\n\nExample: `/setbinance 335277914`"
+), 'change_payments', "❌ You don't have permission to change payment methods!")
+CALLBACK_ROUTER.add('set_upi_menu', prompt_route(
+    "💎 **Set UPI Details**\n\nSend command: `/setupi UPI_ID \"ACCOUNT NAME\"`\n\nExample: `/setupi user@upi \"Account Name\"`"
+), 'change_payments', "❌ You don't have permission to change payment methods!")
+CALLBACK_ROUTER.add('set_upi_qr_menu', prompt_route(
+    "📸 **Set UPI QR Code**\n\nSend command: `/setupiqr` then send the QR code image."
+), 'change_payments', "❌ You don't have permission to change payment methods!")
+CALLBACK_ROUTER.add('set_binance_qr_menu', prompt_route(
+    "📸 **Set Binance QR Code**\n\nSend command: `/setbinanceqr` then send the QR code image."
+), 'change_payments', "❌ You don't have permission to change payment methods!")
+CALLBACK_ROUTER.add('view_payments', view_payment_methods, 'view_payments',
+                    "❌ You don't have permission to view payment methods!")
+
+# Admin settings (Super Admin)
+CALLBACK_ROUTER.add('addadmin_menu', prompt_route(
+    "➕ **Add Admin**\n\nSend command: `/addadmin USER_ID`\n\nExample: `/addadmin 1234567`"
+), SUPER_ADMIN_ONLY, "❌ Only Super Admin can add admins!")
+CALLBACK_ROUTER.add('removeadmin_menu', prompt_route(
+    "➖ **Remove Admin**\n\nSend command: `/removeadmin USER_ID`\n\nExample: `/removeadmin 1234567`"
+), SUPER_ADMIN_ONLY, "❌ Only Super Admin can remove admins!")
+CALLBACK_ROUTER.add('listadmins', list_admins, 'manage_admins',
+                    "❌ You don't have permission to list admins!")
+
 def main():
-    # First delete old database and create new one
+    # Apply any pending schema migrations (keeps existing data)
     init_db()
-    add_sample_keys()
+    reload_payment_methods()
+    reload_catalogue()
     
     print("=" * 50)
     print("🤖 Bot starting...")
@@ -4407,11 +6406,17 @@ def main():
     
     try:
         # Create application with build method
-        application = Application.builder().token(TOKEN).build()
+        builder = Application.builder().token(TOKEN).post_init(post_init).post_shutdown(post_shutdown)
+        if TELEGRAM_API_URL:
+            builder = builder.base_url(TELEGRAM_API_URL)
+        application = builder.build()
         
         # Add error handler
         application.add_error_handler(error_handler)
         
+        # Refill stale caches off the event loop before any handler reads them
+        application.add_handler(TypeHandler(Update, warm_caches_handler), group=-1)
+        
         # Basic command handlers
         application.add_handler(CommandHandler('start', start))
         application.add_handler(CommandHandler('buy', buy))
@@ -4421,19 +6426,20 @@ def main():
         application.add_handler(CommandHandler('stats', show_stats))
         application.add_handler(CommandHandler('stock', show_stock))
         application.add_handler(CommandHandler('listadmins', list_admins))
+        application.add_handler(CommandHandler('pending', pending_command))
+        application.add_handler(CommandHandler('bulkapprove', bulk_approve))
+        application.add_handler(CommandHandler('bulkreject', bulk_reject))
         
         # Admin command handlers for adding keys
-        application.add_handler(CommandHandler('addkey_3d', handle_add_key))
-        application.add_handler(CommandHandler('addkey_10d', handle_add_key))
-        application.add_handler(CommandHandler('addkey_30d', handle_add_key))
+        application.add_handler(MessageHandler(filters.Regex(r'^/addkey_[A-Za-z0-9]+(@\w+)?(\s|$)'), handle_add_key))
+        application.add_handler(CommandHandler('importkeys', import_keys_command))
         
         # Admin command handlers for deleting keys
         application.add_handler(CommandHandler('delkey', handle_delete_key))
         
         # Admin command handlers for price changes
-        application.add_handler(CommandHandler('price_3d', handle_price_change))
-        application.add_handler(CommandHandler('price_10d', handle_price_change))
-        application.add_handler(CommandHandler('price_30d', handle_price_change))
+        application.add_handler(MessageHandler(filters.Regex(r'^/price_[A-Za-z0-9]+(@\w+)?(\s|$)'), handle_price_change))
+        application.add_handler(CommandHandler('addproduct', add_product_command))
         
         # Admin user management commands
         application.add_handler(CommandHandler('block', block_user))
@@ -4468,6 +6474,9 @@ def main():
         # Photo handler for payment screenshots and QR codes
         application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
         
+        # Document handler for bulk key imports
+        application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
+        
         print("✅ All handlers registered successfully!")
         print("⏳ Starting polling...")
         
@@ -0,0 +1,125 @@
+"""Mixed purchase/browse benchmark: rollback journal without lock retries (before) vs WAL with retries (after).
+
+    python bench/bench_db.py [--buyers 8] [--browsers 8] [--seconds 5]
+
+Each mode runs in its own process against a fresh scratch database (DB_PATH and
+DB_STORAGE_MODE are read when the bot module is imported). Buyers run
+purchase_with_balance; browsers run the read queries behind /stock, /mykeys and the
+admin check straight against the database (bypassing the in-memory caches).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {
+    'before': {'DB_STORAGE_MODE': 'legacy', 'retry': False},
+    'after': {'DB_STORAGE_MODE': 'wal', 'retry': True}
+}
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def run_mode(mode, buyers, browsers, seconds):
+    sys.path.insert(0, ROOT)
+    import logging
+    logging.disable(logging.CRITICAL)
+    import atoplay_telegram3_bot as bot
+    
+    bot.init_db()
+    bot.reload_catalogue()
+    product = bot.get_product('3d')
+    
+    conn = bot.get_db_connection()
+    conn.execute('DELETE FROM keys_stock')
+    conn.executemany("INSERT INTO keys_stock (key_value, key_type) VALUES (?, '3d')",
+                     [(f'BENCH{i}',) for i in range(20000)])
+    conn.executemany('INSERT INTO users (telegram_id, username, unique_id, balance) VALUES (?, ?, ?, 1e12)',
+                     [(1000 + i, f'bench{i}', f'B{i}') for i in range(buyers)])
+    conn.commit()
+    conn.close()
+    
+    call = bot.call_with_lock_retry if MODES[mode]['retry'] else (lambda func, *args: func(*args))
+    
+    def browse(user_id):
+        conn = bot.get_db_connection()
+        try:
+            conn.execute('''SELECT key_type, SUM(CASE WHEN status = 'available' THEN 1 ELSE 0 END)
+                            FROM keys_stock GROUP BY key_type''').fetchall()
+            conn.execute('SELECT permission_mask FROM users WHERE telegram_id = ? AND is_admin = 1',
+                         (user_id,)).fetchone()
+            conn.execute('SELECT user_id FROM users WHERE telegram_id = ?', (user_id,)).fetchone()
+        finally:
+            conn.close()
+        return bot.get_user_keys_page(1)
+    
+    stats = {'purchase': [], 'browse': [], 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+    
+    def worker(kind, user_id):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                if kind == 'purchase':
+                    call(bot.purchase_with_balance, user_id, product)
+                else:
+                    call(browse, user_id)
+            except Exception:
+                with lock:
+                    stats['errors'] += 1
+                continue
+            with lock:
+                stats[kind].append((time.perf_counter() - started) * 1000)
+    
+    threads = [threading.Thread(target=worker, args=('purchase', 1000 + i)) for i in range(buyers)]
+    threads += [threading.Thread(target=worker, args=('browse', 1000 + i % max(buyers, 1))) for i in range(browsers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    
+    total = len(stats['purchase']) + len(stats['browse'])
+    print(f"{mode:>6} ({MODES[mode]['DB_STORAGE_MODE']}, retry={MODES[mode]['retry']}): "
+          f"{total / elapsed:7.0f} ops/s, errors {stats['errors']}")
+    for kind in ('purchase', 'browse'):
+        samples = stats[kind]
+        print(f"        {kind:<8} {len(samples):6} ops  p50 {percentile(samples, 0.5):6.2f} ms  "
+              f"p95 {percentile(samples, 0.95):6.2f} ms  p99 {percentile(samples, 0.99):6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--buyers', type=int, default=8)
+    parser.add_argument('--browsers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--mode', choices=sorted(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.mode:
+        run_mode(args.mode, args.buyers, args.browsers, args.seconds)
+        return
+    
+    for mode in ('before', 'after'):
+        env = dict(os.environ,
+                   DB_PATH=os.path.join(tempfile.mkdtemp(prefix='atoplay-bench-'), 'atoplay_bot.db'),
+                   DB_STORAGE_MODE=MODES[mode]['DB_STORAGE_MODE'])
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--mode', mode,
+                        '--buyers', str(args.buyers), '--browsers', str(args.browsers),
+                        '--seconds', str(args.seconds)],
+                       env=env, check=True, stdout=sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Callback dispatch cost per callback: the old callback_handler if-chain vs CALLBACK_ROUTER.resolve().
+
+    python bench/bench_router.py [--number 200000]
+
+The old chain is reproduced as the ordered list of comparisons callback_handler made before
+the routing table (exact matches, startswith tests and one list membership test), stopping
+at the first hit like the original. Only the matching is timed - neither side runs a handler.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# callback_handler's tests, in the order it made them
+OLD_CHAIN = [
+    ('eq', 'cancel'),
+    ('eq', 'admin_back'),
+    ('eq', 'admin_back_home'),
+    ('prefix', 'toggle_'),
+    ('prefix', 'save_permissions_'),
+    ('prefix', 'select_admin_'),
+] + [('eq', data) for data in (
+    'admin_stock', 'admin_prices', 'admin_users', 'admin_payments', 'admin_stats', 'admin_settings',
+    'set_permissions_menu', 'view_permissions', 'addkey_3d_menu', 'addkey_10d_menu', 'addkey_30d_menu',
+    'delkey_menu', 'view_stock', 'price_3d_menu', 'price_10d_menu', 'price_30d_menu', 'view_prices',
+    'block_user_menu', 'unblock_user_menu', 'userinfo_menu', 'view_users', 'manage_user_balance_menu',
+    'set_easypaisa_menu', 'set_jazzcash_menu', 'set_binance_menu', 'set_upi_menu', 'set_upi_qr_menu',
+    'set_binance_qr_menu', 'view_payments', 'addadmin_menu', 'removeadmin_menu', 'listadmins'
+)] + [
+    ('in', ['product_3d', 'product_10d', 'product_30d']),
+    ('eq', 'add_balance'),
+    ('prefix', 'payment_'),
+    ('prefix', 'amount_'),
+    ('eq', 'use_balance'),
+    ('eq', 'new_payment'),
+]
+
+# Customer callbacks first - they are most of the traffic
+SAMPLE_CALLBACKS = [
+    'product_3d', 'product_30d', 'add_balance', 'payment_upi', 'payment_binance', 'amount_500',
+    'use_balance', 'new_payment', 'cancel',
+    'admin_back', 'admin_stock', 'view_stock', 'price_10d_menu', 'toggle_5510368247_add_keys', 'listadmins'
+]
+
+
+def old_resolve(data):
+    for kind, value in OLD_CHAIN:
+        if kind == 'eq':
+            if data == value:
+                return value
+        elif kind == 'prefix':
+            if data.startswith(value):
+                return value
+        elif data in value:
+            return value
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--number', type=int, default=200000, help="lookups timed per callback")
+    args = parser.parse_args()
+    
+    os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(prefix='atoplay-bench-'), 'atoplay_bot.db'))
+    sys.path.insert(0, ROOT)
+    import logging
+    logging.disable(logging.CRITICAL)
+    import atoplay_telegram3_bot as bot
+    
+    router = bot.CALLBACK_ROUTER
+    for data in SAMPLE_CALLBACKS:
+        assert old_resolve(data) is not None and router.resolve(data) is not None, data
+    
+    print(f"{'callback_data':<28} {'if-chain':>10} {'router':>10}")
+    old_total = new_total = 0.0
+    for data in SAMPLE_CALLBACKS:
+        old_ns = timeit.timeit(lambda: old_resolve(data), number=args.number) / args.number * 1e9
+        new_ns = timeit.timeit(lambda: router.resolve(data), number=args.number) / args.number * 1e9
+        old_total += old_ns
+        new_total += new_ns
+        print(f"{data:<28} {old_ns:8.0f} ns {new_ns:8.0f} ns")
+    print(f"{'mean':<28} {old_total / len(SAMPLE_CALLBACKS):8.0f} ns {new_total / len(SAMPLE_CALLBACKS):8.0f} ns")
+
+
+if __name__ == '__main__':
+    main()
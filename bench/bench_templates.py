@@ -0,0 +1,268 @@
+"""Render time per customer screen: the old f-string + escape_markdown path vs the pre-parsed MessageTemplates.
+
+    python bench/bench_templates.py [--number 20000]
+
+The old_* functions are the handlers' f-string bodies as they were before MESSAGE TEMPLATES
+(text += concatenation for the payment and permissions screens), with user-supplied fields escaped at render
+time the way the templates do. Both sides must produce identical text; that is checked first.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(prefix='atoplay-bench-'), 'atoplay_bot.db'))
+sys.path.insert(0, ROOT)
+import logging  # noqa: E402
+logging.disable(logging.CRITICAL)
+import atoplay_telegram3_bot as bot  # noqa: E402
+from telegram.helpers import escape_markdown  # noqa: E402
+
+FIRST_NAME = 'Ali_Khan*'
+UNIQUE_ID = 'ABCD1234'
+STOCK = {'3d': 4, '10d': 3, '30d': 9}
+PAYMENT_INFO = {'name': 'UPI', 'number': 'shop@upi', 'pay_id': '', 'account_name': 'Atoplay_Store', 'qr_code': 'QR'}
+KEY_DETAILS = {'key_value': 'KEY-1234', 'key_type': '10d', 'product_name': '10-Day Key', 'amount': 560, 'new_balance': 10.0}
+BALANCE_DETAILS = {'key_value': None, 'key_type': '', 'product_name': 'Balance Addition', 'amount': 500, 'new_balance': 510.0}
+
+
+def old_welcome_back(first_name, unique_id, balance):
+    return f"""🎉 **Welcome back {escape_markdown(first_name)}!**
+
+🆔 **Your Unique ID:** `{unique_id}`
+💰 **Balance:** ₹{balance}
+
+📱 **Available Commands:**
+• /buy - Purchase Atoplay keys
+• /balance - Check your balance
+• /mykeys - View your purchased keys
+
+📞 **Contact:** @Aarifseller
+📢 **Channel:** @SnakeEngine105
+
+👉 **Use the buttons below to navigate!**"""
+
+
+def old_buy_menu(stock_info):
+    products = bot.list_products()
+    return f"""🛒 **Select Product:**
+
+1️⃣ **{products[0]['name']}** - ₹{products[0]['price']}
+2️⃣ **{products[1]['name']}** - ₹{products[1]['price']}
+3️⃣ **{products[2]['name']}** - ₹{products[2]['price']}
+
+📦 **Current Stock:**
+• 3-Day Keys: {stock_info.get('3d', 0)} available
+• 10-Day Keys: {stock_info.get('10d', 0)} available
+• 30-Day Keys: {stock_info.get('30d', 0)} available
+
+👇 **Select a product or add balance:**"""
+
+
+def old_purchase_success(product, new_balance, key_value):
+    return f"""✅ **Purchase Successful!**
+
+🎉 Congratulations! Your purchase is complete.
+
+📦 **Product:** {product['name']}
+💰 **Price:** ₹{product['price']}
+💳 **New Balance:** ₹{new_balance}
+🔑 **Your Key:** `{key_value}`
+
+📋 **Instructions:**
+1. Open Atoplay application
+2. Go to settings or activation section
+3. Enter the key: `{key_value}`
+4. Enjoy your {product['days']} days subscription!
+
+⚠️ **Important:**
+• This key is for ONE-TIME use only
+• Do not share with anyone
+• Key will expire after {product['days']} days
+
+📞 **Contact:** @Aarifseller for any issues.
+📢 **Join:** @SnakeEngine105"""
+
+
+def old_approval(transaction_id, details):
+    if details['key_value']:
+        days = bot.product_days(details['key_type'])
+        return f"""✅ **Payment Approved!**
+
+🎉 Congratulations! Your payment has been approved.
+
+📋 **Transaction Details:**
+• **Transaction ID:** #{transaction_id}
+• **Product:** {details['product_name']}
+• **Amount:** ₹{details['amount']}
+• **Status:** ✅ Approved
+• **Approved by:** Admin
+
+💰 **Your New Balance:** ₹{details['new_balance']}
+
+🔑 **Your Key:** `{details['key_value']}`
+
+📋 **Instructions:**
+1. Open Atoplay application
+2. Go to settings or activation section
+3. Enter the key: `{details['key_value']}`
+4. Enjoy your {days} days subscription!
+
+📞 **Contact:** @Aarifseller for any queries."""
+    return f"""✅ **Payment Approved!**
+
+🎉 Congratulations! Your payment has been approved.
+
+📋 **Transaction Details:**
+• **Transaction ID:** #{transaction_id}
+• **Amount:** ₹{details['amount']}
+• **Status:** ✅ Approved
+• **Approved by:** Admin
+
+💰 **Your New Balance:** ₹{details['new_balance']}
+
+💸 You can now use your balance to purchase keys!
+Use /buy to get started.
+
+📞 **Contact:** @Aarifseller for any queries."""
+
+
+def old_payment_details(payment_method, payment_info, amount, purpose, product_name):
+    text = f"""💳 **Payment Details:**
+
+🔸 **Product:** {product_name}
+🔸 **Purpose:** {purpose}
+🔸 **Method:** {payment_info['name']}"""
+    if payment_method in bot.EXCHANGE_RATES:
+        text += f"\n\n{bot.EXCHANGE_RATES[payment_method]['message']}\n"
+    if payment_method in ['easypaisa', 'jazzcash']:
+        account_text = f"\n🔸 **Account Name:** {escape_markdown(payment_info['account_name'])}" if payment_info.get('account_name') else ""
+        text += f"\n🔸 **Number:** `{payment_info['number']}`{account_text}"
+    elif payment_method == 'binance':
+        text += f"\n🔸 **Pay ID:** `{payment_info['pay_id']}`"
+    elif payment_method == 'upi':
+        account_text = f"\n🔸 **Account Name:** {escape_markdown(payment_info['account_name'])}" if payment_info.get('account_name') else ""
+        text += f"\n🔸 **UPI ID:** `{payment_info['number']}`{account_text}"
+    text += f"\n🔸 **Amount:** ₹{amount}"
+    if payment_method == 'upi' and payment_info.get('qr_code'):
+        text += "\n\n📱 **UPI QR Code:** Available (Scan to pay)"
+    elif payment_method == 'binance' and payment_info.get('qr_code'):
+        text += "\n\n💰 **Binance QR Code:** Available (Scan to pay)"
+    text += f"""
+
+📋 **Instructions:**
+1. Send ₹{amount} to above {payment_info['name']} details
+2. Take a clear screenshot of successful payment
+3. Send the screenshot here
+
+⚠️ **Make sure screenshot shows:**
+• Transaction ID/Reference
+• Amount
+• Date & Time
+
+📸 **After payment, send the screenshot now.**"""
+    return text
+
+
+def old_admin_panel(stock_info):
+    return f"""🔧 **ADMIN PANEL** - **Control Center**
+
+📊 **Quick Stats:**
+{bot.stock_lines(stock_info)}
+
+🎛️ **Management Sections:**
+
+📥 **Pending Payments** - Approve/Reject queue
+📦 **Stock Management** - Add/Delete/View keys
+💰 **Price Management** - Change product prices
+👤 **User Management** - Block/Unblock/View users
+💳 **Payment Methods** - Update payment details
+📊 **Statistics** - View bot analytics
+🔑 **Admin Settings** - Manage admins (Super Admin only)
+
+👇 **Select a section to manage:**"""
+
+
+def old_permissions_overview(admins):
+    text = "👑 **ADMIN PERMISSIONS OVERVIEW**\n\n"
+    for admin_telegram_id, username, is_admin_user in admins:
+        username_display = f"@{username}" if username else "No username"
+        status = "👑 Super Admin" if admin_telegram_id == bot.SUPER_ADMIN_ID else "🔧 Admin"
+        text += f"**{escape_markdown(username_display)}** ({admin_telegram_id}) - {status}\n"
+        if admin_telegram_id != bot.SUPER_ADMIN_ID:
+            enabled, disabled = bot.get_admin_permissions_list(admin_telegram_id)
+            if enabled:
+                text += "✅ **Enabled:**\n"
+                for perm in enabled:
+                    text += f"  • {perm}\n"
+            if disabled:
+                text += "❌ **Disabled:**\n"
+                for perm in disabled:
+                    text += f"  • {perm}\n"
+        text += "\n"
+    return text
+
+
+def screens():
+    """screen name -> (old render, template render)"""
+    product = bot.get_product('3d')
+    admins = bot.get_all_admins()
+    return {
+        'welcome_back': (
+            lambda: old_welcome_back(FIRST_NAME, UNIQUE_ID, 100.0),
+            lambda: bot.WELCOME_BACK_TEMPLATE.render(first_name=FIRST_NAME, unique_id=UNIQUE_ID, balance=100.0)
+        ),
+        'buy_menu': (
+            lambda: old_buy_menu(STOCK),
+            lambda: bot.build_buy_menu_text(STOCK)
+        ),
+        'purchase_success': (
+            lambda: old_purchase_success(product, 20.0, 'KEY-1234'),
+            lambda: bot.PURCHASE_SUCCESS_TEMPLATE.render(product_name=product['name'], price=product['price'],
+                                                         new_balance=20.0, key_value='KEY-1234', days=product['days'])
+        ),
+        'approval_key': (
+            lambda: old_approval(41, KEY_DETAILS),
+            lambda: bot.build_approval_message(41, KEY_DETAILS)
+        ),
+        'approval_balance': (
+            lambda: old_approval(42, BALANCE_DETAILS),
+            lambda: bot.build_approval_message(42, BALANCE_DETAILS)
+        ),
+        'payment_details': (
+            lambda: old_payment_details('upi', PAYMENT_INFO, 280, 'Product Purchase', product['name']),
+            lambda: bot.build_payment_details('upi', PAYMENT_INFO, 280, 'Product Purchase', product['name'])
+        ),
+        'admin_panel': (
+            lambda: old_admin_panel(STOCK),
+            lambda: bot.build_admin_panel_text(STOCK)
+        ),
+        'permissions': (
+            lambda: old_permissions_overview(admins),
+            lambda: bot.build_permissions_overview(admins)
+        )
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--number', type=int, default=20000, help="renders timed per screen")
+    args = parser.parse_args()
+    with contextlib.redirect_stdout(io.StringIO()):
+        bot.init_db()  # Seeds the initial admins for the permissions overview
+    
+    print(f"{'screen':<18} {'f-string':>10} {'template':>10} {'chars':>6}")
+    for name, (old, new) in screens().items():
+        assert old() == new(), f"{name}: old and template output differ"
+        old_us = timeit.timeit(old, number=args.number) / args.number * 1e6
+        new_us = timeit.timeit(new, number=args.number) / args.number * 1e6
+        print(f"{name:<18} {old_us:7.2f} us {new_us:7.2f} us {len(new()):6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The bot reads DB_PATH when it is imported, so point it at a scratch file first
+os.environ.setdefault('DB_PATH', os.path.join(tempfile.mkdtemp(prefix='atoplay-test-'), 'atoplay_bot.db'))
+os.environ.setdefault('DB_WORKERS', '32')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,43 @@
+"""Admin permission cache: queries run without the cache lock, and reads that overlap a write are redone"""
+import atoplay_telegram3_bot as bot
+
+ADMIN_ID = 1001
+
+
+def test_load_runs_outside_the_lock_and_retries_after_invalidation(monkeypatch):
+    monkeypatch.setattr(bot, '_admin_cache', {})
+    monkeypatch.setattr(bot, '_admin_cache_loaded', False)
+    monkeypatch.setattr(bot, '_admin_cache_stale', set())
+
+    masks = iter([1, 3])
+    reads = []
+
+    def load_all_admins():
+        assert not bot._admin_cache_lock.locked(), "admins were read with the cache lock held"
+        reads.append(1)
+        if len(reads) == 1:
+            # An admin row is written (and invalidated) while this read is in flight
+            bot.invalidate_admin_cache(ADMIN_ID)
+        return {ADMIN_ID: next(masks)}
+
+    monkeypatch.setattr(bot, '_load_all_admins', load_all_admins)
+
+    assert bot.get_cached_admin(ADMIN_ID) == 3
+    assert len(reads) == 2
+    assert not bot._admin_cache_stale
+
+
+def test_stale_entry_reloaded_outside_the_lock(monkeypatch):
+    monkeypatch.setattr(bot, '_admin_cache', {ADMIN_ID: 1})
+    monkeypatch.setattr(bot, '_admin_cache_loaded', True)
+    monkeypatch.setattr(bot, '_admin_cache_stale', set())
+
+    def load_admin(user_id):
+        assert not bot._admin_cache_lock.locked(), "admin was read with the cache lock held"
+        return None  # No longer an admin
+
+    monkeypatch.setattr(bot, '_load_admin', load_admin)
+
+    bot.invalidate_admin_cache(ADMIN_ID)
+    assert bot.get_cached_admin(ADMIN_ID) is None
+    assert not bot.is_admin(ADMIN_ID)
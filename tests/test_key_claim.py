@@ -0,0 +1,77 @@
+"""Stress test: many simultaneous balance purchases against a small stock"""
+import asyncio
+import uuid
+
+import atoplay_telegram3_bot as bot
+
+BUYERS = 300
+STOCK = 54
+KEY_TYPE = '3d'
+
+
+def setup_module():
+    bot.init_db()
+    bot.reload_payment_methods()
+    bot.reload_catalogue()
+
+
+def prepare_stock_and_buyers():
+    """Replace the 3d stock with STOCK fresh keys and create BUYERS users who can each afford one"""
+    price = bot.get_product(KEY_TYPE)['price']
+    conn = bot.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM keys_stock WHERE key_type = ?', (KEY_TYPE,))
+        keys = [f'STRESS-{uuid.uuid4().hex[:12]}' for _ in range(STOCK)]
+        cursor.executemany('INSERT INTO keys_stock (key_value, key_type) VALUES (?, ?)',
+                           [(key_value, KEY_TYPE) for key_value in keys])
+        buyers = list(range(900000000, 900000000 + BUYERS))
+        cursor.executemany('INSERT INTO users (telegram_id, username, balance, unique_id) VALUES (?, ?, ?, ?)',
+                           [(telegram_id, f'buyer{telegram_id}', price, uuid.uuid4().hex[:8].upper())
+                            for telegram_id in buyers])
+        conn.commit()
+    finally:
+        conn.close()
+    bot.reconcile_stock_counters()
+    return set(keys), buyers
+
+
+async def buy_all(buyers):
+    product = bot.get_product(KEY_TYPE)
+    return await asyncio.gather(*(bot.run_db(bot.purchase_with_balance, telegram_id, product)
+                                  for telegram_id in buyers))
+
+
+def test_concurrent_purchases_hand_out_each_key_once():
+    keys, buyers = prepare_stock_and_buyers()
+    
+    results = asyncio.run(buy_all(buyers))
+    
+    statuses = [status for status, _ in results]
+    assert statuses.count('ok') == STOCK
+    assert statuses.count('out_of_stock') == BUYERS - STOCK
+    
+    sold = [details['key_value'] for status, details in results if status == 'ok']
+    assert len(set(sold)) == len(sold), "a key was handed out twice"
+    assert set(sold) == keys, "a key was lost or invented"
+    
+    conn = bot.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM keys_stock WHERE key_type = ?', (KEY_TYPE,))
+        assert cursor.fetchone()[0] == 0
+        
+        placeholders = ','.join('?' * len(sold))
+        cursor.execute(f'SELECT key_value FROM user_keys WHERE key_value IN ({placeholders})', sold)
+        assert sorted(row[0] for row in cursor.fetchall()) == sorted(sold)
+        
+        # Only the winners were charged
+        cursor.execute('''SELECT COUNT(*) FROM users 
+                          WHERE telegram_id BETWEEN ? AND ? AND keys_count = 1 AND balance = 0''',
+                       (buyers[0], buyers[-1]))
+        assert cursor.fetchone()[0] == STOCK
+    finally:
+        conn.close()
+    
+    assert bot.reconcile_stock_counters() == {}
+    assert bot.get_stock_info().get(KEY_TYPE, 0) == 0
@@ -0,0 +1,43 @@
+"""EXPLAIN QUERY PLAN checks: the hot query shapes must SEARCH an index, never SCAN a table"""
+import sqlite3
+
+import pytest
+
+import atoplay_telegram3_bot as bot
+
+# The statements the handlers run, with sample parameters
+HOT_QUERIES = {
+    'key claim': (bot.CLAIM_KEYS_SQL, ('3d', 1)),
+    'key claim (DELETE ... RETURNING)': (bot.CLAIM_KEYS_RETURNING_SQL, ('3d', 1)),
+    'my keys first page': (bot.USER_KEYS_PAGE_SQL, (1, 11)),
+    'my keys older page': (bot.USER_KEYS_OLDER_SQL, (1, 0, 1, 11)),
+    'my keys newer page': (bot.USER_KEYS_NEWER_SQL, (1, 0, 1, 11)),
+    'buyers by approval date': (bot.APPROVED_BUYERS_SQL, ('2024-01-01 00:00:00', '2024-01-02 00:00:00')),
+    'pending inbox first page': (bot.PENDING_PAGE_SQL, (11,)),
+    'pending inbox next page': (bot.PENDING_PAGE_AFTER_SQL, (1, 11)),
+    'user purchase totals': (bot.USER_PURCHASE_TOTALS_SQL, (1, 1)),
+    'admin list': (bot.ADMIN_MASKS_SQL, ()),
+    'admin lookup': (bot.ADMIN_MASK_SQL, (1,))
+}
+
+
+@pytest.fixture(scope='module')
+def migrated_db(tmp_path_factory):
+    """A fresh database with every schema migration applied"""
+    conn = sqlite3.connect(str(tmp_path_factory.mktemp('plans') / 'atoplay_bot.db'))
+    cursor = conn.cursor()
+    for version, _, migrate in bot.SCHEMA_MIGRATIONS:
+        migrate(cursor)
+        cursor.execute(f'PRAGMA user_version = {version}')
+        conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(migrated_db, name):
+    query, params = HOT_QUERIES[name]
+    plan = [row[3] for row in migrated_db.execute(f'EXPLAIN QUERY PLAN {query}', params)]
+    
+    assert not [step for step in plan if step.startswith('SCAN')], f"{name} scans: {plan}"
+    assert any(step.startswith('SEARCH') for step in plan), f"{name} has no index search: {plan}"
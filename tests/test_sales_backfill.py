@@ -0,0 +1,73 @@
+"""Migration 8: daily_sales backfilled by approval date at the saved prices, without balance adjustments"""
+import sqlite3
+
+import pytest
+
+import atoplay_telegram3_bot as bot
+
+# (transaction_id, amount, payment_method, status, created_at)
+TRANSACTIONS = [
+    (1, 300, 'upi', 'approved', '2024-01-01 12:00:00'),  # Approved the next day
+    (2, 560, 'balance', 'approved', '2024-01-01 12:00:00'),  # Balance purchase, approved when created
+    (3, -50, 'admin_adjustment', 'approved', '2024-01-01 12:00:00'),
+    (4, 100, 'admin_adjustment', 'approved', '2024-01-02 12:00:00'),
+    (5, 280, 'upi', 'approved', '2024-01-01 12:00:00'),  # The default 3d price, a top-up at the saved one
+    (6, 300, 'upi', 'pending', '2024-01-01 12:00:00')
+]
+
+# (details, created_at) of 'approve_payment' admin log entries
+APPROVALS = [
+    ('Transaction #1 - ₹300', '2024-01-02 12:00:00'),
+    ('Transaction #5 - ₹280', '2024-01-03 12:00:00'),
+    ('Transaction #5 - ₹280', '2024-01-04 12:00:00')  # A repeated log line keeps the first approval
+]
+
+
+def migrate(cursor, versions):
+    for version, _, migration in bot.SCHEMA_MIGRATIONS:
+        if version in versions:
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {version}')
+
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    """A version 6 database with sales history and a saved /price_3d, migrated to the latest version"""
+    # Migrations must read prices from the database, never from the catalogue loaded in memory
+    monkeypatch.setattr(bot, 'PRODUCT_CATALOGUE', bot.build_catalogue([]))
+    conn = sqlite3.connect(str(tmp_path / 'atoplay_bot.db'))
+    cursor = conn.cursor()
+    migrate(cursor, range(1, 7))
+    cursor.execute("INSERT INTO settings (setting_key, setting_value) VALUES ('price_3d', '300')")
+    cursor.executemany('''INSERT INTO transactions (transaction_id, user_id, amount, payment_method, status, created_at)
+                          VALUES (?, 1, ?, ?, ?, ?)''', TRANSACTIONS)
+    cursor.executemany('''INSERT INTO admin_logs (admin_id, action, target_user_id, details, created_at)
+                          VALUES (1, 'approve_payment', 1, ?, ?)''', APPROVALS)
+    migrate(cursor, range(7, bot.SCHEMA_MIGRATIONS[-1][0] + 1))
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_approved_at_backfilled(legacy_db):
+    rows = dict(legacy_db.execute('SELECT transaction_id, approved_at FROM transactions'))
+
+    assert rows == {
+        1: '2024-01-02 12:00:00',
+        2: '2024-01-01 12:00:00',
+        3: '2024-01-01 12:00:00',
+        4: '2024-01-02 12:00:00',
+        5: '2024-01-03 12:00:00',
+        6: None
+    }
+
+
+def test_daily_sales_by_approval_date_at_saved_prices(legacy_db):
+    rows = legacy_db.execute('''SELECT day, key_type, payment_method, sales_count, amount
+                                FROM daily_sales ORDER BY day''').fetchall()
+
+    assert rows == [
+        ('2024-01-01', '10d', 'balance', 1, 560),
+        ('2024-01-02', '3d', 'upi', 1, 300),
+        ('2024-01-03', '', 'upi', 1, 280)
+    ]
@@ -0,0 +1,39 @@
+"""Stock counter reconciliation must not undo a sale that lands while keys_stock is being counted"""
+import atoplay_telegram3_bot as bot
+
+
+def test_count_overlapping_a_sale_is_discarded(monkeypatch):
+    monkeypatch.setattr(bot, '_stock_counts', {'3d': 5})
+    monkeypatch.setattr(bot, '_stock_loaded', True)
+
+    counts = iter([{'3d': 5}, {'3d': 4}])
+
+    def count_stock_from_db():
+        stock = next(counts)
+        if stock == {'3d': 5}:
+            # A purchase commits right after this read and adjusts the counter
+            bot.adjust_stock_counter('3d', -1)
+        return stock
+
+    monkeypatch.setattr(bot, 'count_stock_from_db', count_stock_from_db)
+
+    assert bot.reconcile_stock_counters() == {}
+    assert bot.get_stock_info() == {'3d': 4}
+
+
+def test_busy_counters_are_counted_under_the_lock(monkeypatch):
+    monkeypatch.setattr(bot, '_stock_counts', {'3d': 9})
+    monkeypatch.setattr(bot, '_stock_loaded', True)
+    reads = []
+
+    def count_stock_from_db():
+        reads.append(bot._stock_lock.locked())
+        if not bot._stock_lock.locked():
+            bot.adjust_stock_counter('3d', -1)  # Every unlocked count overlaps a sale
+        return {'3d': 9 - len(reads)}
+
+    monkeypatch.setattr(bot, 'count_stock_from_db', count_stock_from_db)
+
+    bot.reconcile_stock_counters()
+    assert reads == [False] * bot.STOCK_RECONCILE_ATTEMPTS + [True]
+    assert bot.get_stock_info() == {'3d': 9 - len(reads)}